@@ -0,0 +1,85 @@
+"""Micro-benchmark of the per-file cost of parsing and splitting.
+
+Compares building a GenericLoader (a glob over the file's directory), a LanguageParser and a splitter
+for every file, as split_file used to, with split_file's cached per-language parser and splitter fed
+the bytes already read for hashing. Both must produce the same chunks.
+
+The loader's glob makes the old cost grow with the size of the file's directory. --synthetic N times
+N small modules in a single directory, the layout the old staging area had.
+
+Usage:
+    python benchmarks/bench_split.py [DIRECTORY] [--repeat N] [--synthetic N]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from langchain_community.document_loaders.generic import GenericLoader
+from langchain_community.document_loaders.parsers import LanguageParser
+from langchain_community.document_loaders import TextLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from perpetua.agent.document_processing import CODE_LANGUAGES, get_bytes_hash, get_file_hash, is_supported, split_file
+from perpetua.utils import walk_files
+
+
+def split_per_file(file_path: Path):
+    """The previous implementation: a loader, parser and splitter built for every file"""
+    file_hash = get_file_hash(file_path)
+    if file_path.suffix in CODE_LANGUAGES:
+        lang = CODE_LANGUAGES[file_path.suffix]
+        loader = GenericLoader.from_filesystem(str(file_path.parent), glob=str(file_path.name), parser=LanguageParser(language=lang))
+        splitter = RecursiveCharacterTextSplitter.from_language(language=lang, chunk_size=1500, chunk_overlap=200, add_start_index=True)
+    else:
+        loader = TextLoader(str(file_path))
+        splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200, add_start_index=True)
+    return file_hash, splitter.split_documents(loader.load())
+
+
+def split_cached(file_path: Path):
+    data = file_path.read_bytes()
+    file_hash = get_bytes_hash(data)
+    return file_hash, split_file(file_path, file_hash, data=data)[0]
+
+
+def bench(function, files: list[Path], repeat: int) -> tuple[float, list]:
+    best, results = float("inf"), []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [function(file) for file in files]
+        best = min(best, time.perf_counter() - start)
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", nargs="?", default=str(Path(__file__).parent.parent / "src"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--synthetic", type=int, default=0, help="benchmark N generated modules in one directory instead")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        args.directory = tempfile.mkdtemp()
+        for i in range(args.synthetic):
+            Path(args.directory, f"module_{i}.py").write_text(f"def function_{i}(x):\n    return x + {i}\n")
+
+    files = [Path(file) for file in sorted(walk_files(str(Path(args.directory).resolve()))) if is_supported(file)]
+    if not files:
+        raise SystemExit(f"No supported files under {args.directory}")
+
+    before, expected = bench(split_per_file, files, args.repeat)
+    after, actual = bench(split_cached, files, args.repeat)
+    for file, (hash_before, docs_before), (hash_after, docs_after) in zip(files, expected, actual):
+        assert hash_before == hash_after, file
+        assert [doc.page_content for doc in docs_before] == [doc.page_content for doc in docs_after], file
+        assert [doc.metadata["start_index"] for doc in docs_before] == [doc.metadata["start_index"] for doc in docs_after], file
+
+    chunks = sum(len(docs) for _, docs in actual)
+    print(f"{len(files)} files, {chunks} chunks, best of {args.repeat}")
+    print(f"loader per file:   {1000 * before / len(files):.2f} ms/file")
+    print(f"cached, in memory: {1000 * after / len(files):.2f} ms/file ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
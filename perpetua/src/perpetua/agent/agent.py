@@ -7,13 +7,13 @@ from langchain.messages import SystemMessage, ToolCall, ToolMessage, HumanMessag
 from langchain_core.messages.utils import count_tokens_approximately
 from langgraph.graph import StateGraph, START, END
 from langgraph.checkpoint.sqlite import SqliteSaver
+from ..setup_db import connect
 
 from langchain_community.utilities import SQLDatabase
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
 
 from langmem.short_term import SummarizationNode
 
-import sqlite3
 
 from typing import Literal, Union
 
@@ -60,7 +60,7 @@ def tool_node(state: LocalRagState):
         if tool_call['name'] == "retrieve_context":
             tool_call["args"]["vector_db_path"] = state["vector_db_path"]
             tool_call["args"]["relational_db_path"] = state["relational_db_path"]
-        elif tool_call['name'] == "search_db":
+        elif tool_call['name'] in ("search_db", "lookup_symbol"):
             tool_call["args"]["relational_db_path"] = state["relational_db_path"]
 
         tool = TOOLS_BY_NAME[tool_call["name"]]
@@ -114,7 +114,8 @@ _agent_cache = {}
 
 def choose_agent(relational_db_path: str):
     if relational_db_path not in _agent_cache:
-        conn = sqlite3.connect(relational_db_path, check_same_thread=False)
+        # a connection of its own, WAL lets the checkpointer read and write while a commit holds the database
+        conn = connect(relational_db_path, check_same_thread=False)
         memory = SqliteSaver(conn)
         _agent_cache[relational_db_path] = app.compile(checkpointer=memory)
     return _agent_cache[relational_db_path]
@@ -0,0 +1,63 @@
+#Journal of an in-progress commit, used to resume it after a crash or Ctrl-C
+import json
+import os
+
+JOURNAL_FILE = "commit-journal.jsonl"
+
+class CommitJournal:
+    """Append-only log of a commit's progress, kept in the .rag directory while the commit runs.
+
+    Before chunks of a file are written to Milvus the file is logged as started, and once its docs row
+    is committed to SQLite it is logged as done. The journal is deleted when the commit completes, so
+    finding one at the start of a commit means the previous one was interrupted. Files started but not
+    done may already have chunks in Milvus without a docs row, they are diffed against the vector store
+    like modified files instead of being inserted again.
+
+    Args:
+    path: the path to the journal file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started: set[str] = set()
+        self.done: set[str] = set()
+        self.resumed = os.path.exists(path)
+        if self.resumed:
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last line may have been cut off by the crash
+                        continue
+                    if entry.get("event") == "started":
+                        self.started.update(entry["files"])
+                    elif entry.get("event") == "done":
+                        self.done.update(entry["files"])
+        self.f = open(path, "a")
+
+    def interrupted(self) -> set[str]:
+        """Files whose chunks may be partially written"""
+        return self.started - self.done
+
+    def write(self, event: str, files) -> None:
+        files = sorted(files)
+        if not files:
+            return
+        self.f.write(json.dumps({"event": event, "files": files}) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def start(self, files) -> None:
+        self.write("started", files)
+        self.started.update(files)
+
+    def finish(self, files) -> None:
+        self.write("done", files)
+        self.done.update(files)
+
+    def close(self, completed: bool) -> None:
+        """Closes the journal, deleting it if the commit completed"""
+        self.f.close()
+        if completed:
+            os.remove(self.path)
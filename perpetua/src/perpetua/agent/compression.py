@@ -0,0 +1,52 @@
+#Reduced-dimension (Matryoshka) and quantized storage of embeddings
+import math
+
+QUANTIZATIONS = ("none", "int8")
+
+# Index types holding 1 byte per component instead of a float32
+QUANTIZED_INDEXES = {"IVF_SQ8": 1, "HNSW_SQ": 1}
+
+# Quantized searches fetch this many candidates per result and rank them again with the stored float vectors
+DEFAULT_RESCORE = 4
+
+def truncate(vector: list[float], dimension: int | None) -> list[float]:
+    """First dimension components of a Matryoshka embedding, scaled back to unit length.
+    Vectors are returned unchanged when dimension is None or not smaller than theirs."""
+    if not dimension or dimension >= len(vector):
+        return vector
+    head = vector[:dimension]
+    norm = math.sqrt(sum(x * x for x in head)) or 1.0
+    return [x / norm for x in head]
+
+def apply_storage_options(config: dict, dimension: int | None, quantization: str) -> dict:
+    """Records the storage chosen at init in a project config and picks a matching index.
+
+    Raises ValueError for unsupported options.
+    """
+    if dimension is not None and dimension < 1:
+        raise ValueError(f"The embedding dimension must be positive, got {dimension}")
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(
+            f"Unsupported quantization {quantization}, expected one of {', '.join(QUANTIZATIONS)}. "
+            "Milvus Lite only stores float vectors, binary vectors are not available."
+        )
+    config["embedding"].update(dimension=dimension, quantization=quantization)
+    if quantization == "int8":
+        index = config["index"]
+        index["index_type"] = "HNSW_SQ" if index["index_type"].startswith("HNSW") else "IVF_SQ8"
+        config["search"]["rescore"] = DEFAULT_RESCORE
+    return config
+
+def exact_scores(query: list[float], vectors: list[list[float]], metric_type: str) -> list[float]:
+    """Similarity of the query to each vector, higher is closer"""
+    if metric_type == "L2":
+        return [-sum((q - v) ** 2 for q, v in zip(query, vector)) for vector in vectors]
+    scores = [sum(q * v for q, v in zip(query, vector)) for vector in vectors]
+    if metric_type == "COSINE":
+        query_norm = math.sqrt(sum(q * q for q in query)) or 1.0
+        scores = [score / ((math.sqrt(sum(v * v for v in vector)) or 1.0) * query_norm) for score, vector in zip(scores, vectors)]
+    return scores
+
+def index_memory(count: int, dimension: int, index_type: str) -> int:
+    """Bytes taken by the vector components held by an index, graph and centroids excluded"""
+    return count * dimension * QUANTIZED_INDEXES.get(index_type, 4)
@@ -1,29 +1,39 @@
 #Document processing for text-based files, main interface for documents
 from langchain_core.documents import Document
 
-from ..utils import load_env
+from ..utils import load_env, get_bytes_hash, get_file_hash, get_stat_key
 
 load_env()
 
-from langchain_community.document_loaders.generic import GenericLoader
-from langchain_community.document_loaders.parsers import LanguageParser
-from langchain_community.document_loaders import TextLoader
+from langchain_core.documents.base import Blob
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter, Language
 
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from .embedding_cache import CachedEmbeddings, EMBEDDING_CACHE_FILE
+from .embedding_scheduler import EmbeddingScheduler
+from .embedding_providers import get_provider, get_embeddings, request_settings, cache_key, check_model
+from .commit_journal import CommitJournal, JOURNAL_FILE
+from .symbols import extract_symbols
+from ..project_config import load_config, get_search_params
+from ..setup_db import connect, STAT_TABLE, SYMBOL_TABLE, SYMBOL_INDEXES, CHUNK_TABLE, CHUNK_INDEXES, CHUNK_FTS_TABLE, INDEX_STATE_TABLE
 
 from pathlib import Path
 import hashlib
 import uuid
 from datetime import datetime
 
-from langchain_milvus import Milvus
 
 from rich.console import Console
 
-import sqlite3
+import json
 import os
+import time
+import logging
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 console = Console()
 
@@ -37,6 +47,207 @@ CODE_LANGUAGES = {
 
 TEXT_EXTENSIONS = {".md", ".markdown", ".txt", ".rst", ".tex", ".html", ".htm"}
 
+# New collections are partitioned by language, so searches filtered by language only scan those partitions
+PARTITION_KEY_FIELD = "language"
+
+# SQLite caps the number of host parameters in a single statement
+MAX_SQL_VARIABLES = 900
+
+# Chunks deleted from the vector store per primary key delete
+DELETE_BATCH = 10000
+
+# Namespace for content-addressed chunk ids
+CHUNK_NAMESPACE = uuid.UUID("6f1c1a52-8d0e-4a8e-9a51-3f2a6b0c9d17")
+
+def get_chunk_hash(text: str) -> str:
+    """Hash of a chunk's text, used to recognise chunks that survived an edit"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def get_chunk_id(source: str, chunk_hash: str, occurrence: int) -> str:
+    """Deterministic id of a chunk. The same text at the same source always maps to the same id,
+    so an unchanged chunk keeps its vector across commits. occurrence separates identical chunks within a file."""
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{source}\0{chunk_hash}\0{occurrence}"))
+
+def get_chunk_rowid(chunk_id: str) -> int:
+    """Signed 64 bit rowid of a chunk in the full-text index, from the first half of its uuid"""
+    rowid = uuid.UUID(chunk_id).int >> 64
+    return rowid - (1 << 64) if rowid >= 1 << 63 else rowid
+
+def is_supported(file_path) -> bool:
+    """Whether split_file knows how to parse a file"""
+    suffix = Path(file_path).suffix
+    return suffix in CODE_LANGUAGES or suffix in TEXT_EXTENSIONS
+
+# Parsers and splitters are stateless, one of each per language is built per process and reused
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 200
+_parsers: dict[Language, "LanguageParser"] = {}
+_splitters: dict[Language | None, RecursiveCharacterTextSplitter] = {}
+
+def get_parser(language: Language) -> "LanguageParser":
+    if language not in _parsers:
+        # langchain_community is slow to import, and only needed once there is code to parse
+        from langchain_community.document_loaders.parsers import LanguageParser
+        _parsers[language] = LanguageParser(language=language)
+    return _parsers[language]
+
+def get_splitter(language: Language | None) -> RecursiveCharacterTextSplitter:
+    """Splitter for a code language, or for plain text when language is None"""
+    if language not in _splitters:
+        if language is None:
+            _splitters[language] = RecursiveCharacterTextSplitter(
+                chunk_size=CHUNK_SIZE,
+                chunk_overlap=CHUNK_OVERLAP,
+                add_start_index=True,
+            )
+        else:
+            _splitters[language] = RecursiveCharacterTextSplitter.from_language(
+                language=language,
+                chunk_size=CHUNK_SIZE,
+                chunk_overlap=CHUNK_OVERLAP,
+                add_start_index=True,
+            )
+    return _splitters[language]
+
+def split_file(file_path: Path, file_hash: str, verbose: bool = False, data: bytes | None = None) -> tuple[list[Document], list[str]]:
+    """Process code or text documents, using appropriate parser based on file type.
+
+    data holds the file's content when the caller already read it (to hash it), the file is read otherwise.
+    """
+    if file_path.suffix not in CODE_LANGUAGES and file_path.suffix not in TEXT_EXTENSIONS:
+        raise ValueError(f"Unsupported file extension: {file_path.suffix}")
+    if data is None:
+        data = file_path.read_bytes()
+
+    if file_path.suffix in CODE_LANGUAGES:
+        lang: Language = CODE_LANGUAGES[file_path.suffix]
+        docs = list(get_parser(lang).lazy_parse(Blob.from_data(data, path=str(file_path))))
+        text_splitter = get_splitter(lang)
+        content_type = "code"
+        # Extract language name from enum - use value if available, otherwise use lowercase name
+        language_name = lang.value if hasattr(lang, 'value') else lang.name.lower()
+    else:
+        docs = [Document(page_content=data.decode("utf-8"), metadata={"source": str(file_path)})]
+        text_splitter = get_splitter(None)
+        content_type = "text"
+        language_name = "text"
+
+    all_splits = text_splitter.split_documents(docs)
+    if verbose:
+        console.print(f"\n[italic]Split {str(file_path)} into {len(all_splits)} sub_documents")
+    
+    uuids = []
+    occurrences = {}
+    for chunk in all_splits:
+        chunk_hash = get_chunk_hash(chunk.page_content)
+        occurrences[chunk_hash] = occurrences.get(chunk_hash, 0) + 1
+        uuids.append(get_chunk_id(str(file_path), chunk_hash, occurrences[chunk_hash]))
+        chunk.metadata["chunk_hash"] = chunk_hash
+    
+    for chunk, ids in zip(all_splits, uuids):
+        chunk.metadata["uuid"] = ids
+        chunk.metadata["source"] = str(file_path)
+        chunk.metadata["hash"] = file_hash
+        chunk.metadata["indexed_at"] = datetime.now().isoformat()
+        chunk.metadata["content_type"] = content_type
+        chunk.metadata["language"] = language_name
+    
+    return all_splits, uuids
+
+def ingest_file(job: tuple[str, str | None, str | None, bool]) -> tuple[str, str, tuple[list[Document], list[str]] | None, list[tuple] | None]:
+    """Hashes, parses and splits a single file and extracts its symbols. Runs inside the worker processes of a parallel commit.
+
+    Args:
+        job (tuple): the file path, the hash currently indexed for it (or None), its hash if already known
+            from the stat cache (or None) and the verbose flag.
+
+    Returns:
+        the file path, its new hash, its splits and its symbols. Splits and symbols are None when the file is unchanged.
+    """
+    file_path, indexed_hash, known_hash, verbose = job
+    if known_hash is not None and known_hash == indexed_hash:
+        return file_path, known_hash, None, None
+    # read once, the same bytes are hashed, parsed and searched for symbols
+    data = Path(file_path).read_bytes()
+    file_hash = known_hash or get_bytes_hash(data)
+    if file_hash == indexed_hash:
+        return file_path, file_hash, None, None
+    splits = split_file(Path(file_path), file_hash, verbose, data)
+    return file_path, file_hash, splits, extract_symbols(Path(file_path).suffix, data)
+
+# Number of batches allowed to wait between two pipeline stages
+STAGE_QUEUE_SIZE = 2
+
+_DONE = object()
+
+def threaded(iterable, maxsize: int = STAGE_QUEUE_SIZE):
+    """Runs a pipeline stage in a background thread and yields its items through a bounded queue.
+    The stage blocks once maxsize items are waiting, which keeps memory flat. Exceptions are re-raised in the consumer."""
+    items = queue.Queue(maxsize)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put((None, e))
+        finally:
+            # stops the upstream stages as well when the consumer went away
+            close = getattr(iterable, "close", None)
+            if close:
+                close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            value, error = item
+            if error is not None:
+                raise error
+            yield value
+    finally:
+        stopped.set()
+
+class CommitBatch:
+    """A slice of a commit flowing through the pipeline.
+
+    Args:
+    files: files with chunks in this batch
+    docs, ids: chunks to embed and upsert
+    stale_ids: chunks of modified files that no longer exist, deleted once the batch is written
+    rows: (file path, file hash, chunk count, existing) of every file whose chunks are all written once this batch is
+    hashes: (file path, stat key, file hash) of every file hashed since the previous batch, to refresh the stat cache
+    symbols: the symbols of each file in rows, replacing the ones previously recorded
+    chunks: (chunk id, start index, length, chunk hash) of every chunk of each file in rows, replacing its chunks rows
+    lexical: chunks to (re)write in the full-text index. The chunks in docs, plus the kept chunks of interrupted files
+        which may be in the vector store but not in the full-text index
+    """
+    def __init__(self):
+        self.files: set[str] = set()
+        self.docs: list[Document] = []
+        self.ids: list[str] = []
+        self.stale_ids: list[str] = []
+        self.rows: list[tuple[str, str, int, bool]] = []
+        self.hashes: list[tuple[str, tuple[int, int, int], str]] = []
+        self.symbols: dict[str, list[tuple]] = {}
+        self.chunks: dict[str, list[tuple[str, int, int, str]]] = {}
+        self.lexical: list[tuple[Document, str]] = []
+
 class RAGStore:
     """A RAGStore that simplifies adding documents to a vector store.
     Its constructor will create a Milvus Lite vector store and SQLite relational database in desired locations
@@ -61,46 +272,116 @@ class RAGStore:
     def __init__(self, vs_URI, sql_URI):
         if self._initialized:
             return
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001")
+        self.vs_URI = vs_URI
+        self.sql_URI = sql_URI
+        self.rag_dir = os.path.dirname(sql_URI)
+        self.config = load_config(self.rag_dir)
+        provider, model_name = get_provider()
+        check_model(self.config, provider, model_name)
+        model = get_embeddings(provider, model_name)
+        self.embedding_cache = CachedEmbeddings(
+            model,
+            cache_key(provider, model_name),
+            os.path.join(self.rag_dir, EMBEDDING_CACHE_FILE),
+        )
+        self.embeddings = EmbeddingScheduler(
+            model, cache=self.embedding_cache, dimension=self.config["embedding"]["dimension"], **request_settings(provider)
+        )
+        # pymilvus starts gRPC when imported, modules only splitting files (the ingest workers) never import it
+        from langchain_milvus import Milvus
+        from pymilvus import DataType
+
         self.vector_store: Milvus = Milvus(
-            embedding_function=embeddings,
+            embedding_function=self.embeddings,
             connection_args={"uri": vs_URI},
-            index_params= {"index_type": "IVF_FLAT", "metric_type": "L2"},
+            index_params=self.config["index"],
+            search_params=get_search_params(self.config),
+            metadata_schema={PARTITION_KEY_FIELD: {"dtype": DataType.VARCHAR, "kwargs": {"max_length": 65_535, "is_partition_key": True}}},
             primary_field="id",
             text_field="text",
             auto_id=False,
         )
-        self.conn = sqlite3.connect(sql_URI)
+        # a `perpetua serve` daemon opens and releases the store from its request threads, one at a time
+        self.conn = connect(sql_URI, check_same_thread=False)
         self.curr = self.conn.cursor()
+        self.curr.execute(STAT_TABLE)
+        self.curr.execute(SYMBOL_TABLE)
+        for index in SYMBOL_INDEXES:
+            self.curr.execute(index)
+        self.curr.execute("SELECT name FROM sqlite_master WHERE name IN ('chunks_fts', 'chunks', 'docs')")
+        tables = {name for (name,) in self.curr.fetchall()}
+        self.curr.execute(CHUNK_TABLE)
+        for index in CHUNK_INDEXES:
+            self.curr.execute(index)
+        self.curr.execute(CHUNK_FTS_TABLE)
+        self.curr.execute(INDEX_STATE_TABLE)
         self.conn.commit()
         self._initialized = True
+        # indexes committed before the full-text index or the chunks table existed are filled once from the vector store
+        if "docs" in tables and "chunks_fts" not in tables:
+            self.rebuild_lexical_index()
+        if "docs" in tables and "chunks" not in tables:
+            self.rebuild_chunk_table()
+
+    @classmethod
+    def open(cls, vs_URI, sql_URI, timeout: float = 30.0) -> "RAGStore":
+        """Same as RAGStore(vs_URI, sql_URI), but waits up to timeout seconds while another process holds the Milvus Lite database.
+        A `perpetua serve` daemon holding it is asked to release it."""
+        from pymilvus.exceptions import MilvusException
+        from .. import daemon
+
+        deadline = time.monotonic() + timeout
+        rag_path = os.path.dirname(os.path.dirname(os.path.abspath(sql_URI)))
+        asked_daemon = False
+        loggers = [logging.getLogger(name) for name in ("milvus_lite", "pymilvus")]
+        levels = [logger.level for logger in loggers]
+        try:
+            while True:
+                try:
+                    return cls(vs_URI, sql_URI)
+                except MilvusException:
+                    if time.monotonic() >= deadline:
+                        raise
+                    if not asked_daemon:
+                        asked_daemon = True
+                        try:
+                            daemon.request(rag_path, "release")
+                            continue
+                        except (daemon.DaemonUnavailable, daemon.DaemonError):
+                            pass
+                    # failed attempts log a traceback each, one is enough
+                    for logger in loggers:
+                        logger.setLevel(logging.CRITICAL)
+                    time.sleep(0.5)
+        finally:
+            for logger, level in zip(loggers, levels):
+                logger.setLevel(level)
 
     def close(self):
         """Closes sqlite connection"""
         self.conn.close()
 
+    def release(self) -> None:
+        """Closes every connection and unlocks the Milvus Lite database, which only one process can hold open.
+        Long running commands call this between updates so `perpetua ask` can read the index meanwhile.
+        The next RAGStore(...) with the same URIs opens a fresh instance."""
+        self.close()
+        self.embedding_cache.close()
+        self.vector_store.client.close()
+        try:
+            from milvus_lite.server_manager import server_manager_instance
+            server_manager_instance.release_server(self.vs_URI)
+        except ImportError:
+            pass
+        RAGStore._instances.pop((self.vs_URI, self.sql_URI), None)
+
     def add_documents(self, file_path: str, verbose: bool) -> None:
         """ Adds documents to our various databases.
 
         Args:
             file_path (str): the path to the file that we want to add. Note for now this can only be a file (no directories).
         """
-        file_hash: str = self.get_file_hash(file_path);
-        if self.validate(file_path, file_hash):
-
-            splits_uuids = self.process_docs(Path(file_path), file_hash, verbose)
-
-            self.curr.execute(""" 
-            INSERT INTO docs (id, filepath, file_hash, chunk_count, last_indexed) VALUES (?, ?, ?, ?, ?)
-            """, (str(uuid.uuid4()), file_path, file_hash, len(splits_uuids[0]), datetime.now().isoformat()))
-            self.conn.commit()
-
-            self.curr.execute("SELECT filepath FROM docs WHERE filepath = (?)", (file_path,))
-            row = self.curr.fetchall()
-            if row[0] == file_path:
-                self.remove_doc(file_path)
-            
-            self.vector_store.add_documents(documents=splits_uuids[0], ids=splits_uuids[1])
+        self.add_documents_batch([file_path], verbose)
         
 
     def validate(self, file_path: str, file_hash: str) -> bool:
@@ -110,103 +391,457 @@ class RAGStore:
             return True  
         return row[0] != file_hash  
 
-    def add_documents_batch(self, file_paths: list[str], verbose: bool) -> None:
-        """Batch process multiple documents efficiently"""
-        documents_to_add = []
-        ids_to_add = []
-
-        for file_path in file_paths:
-            file_hash = self.get_file_hash(file_path)
-            if self.validate(file_path, file_hash):
-                splits_uuids = self.process_docs(Path(file_path), file_hash, verbose)
-                self.curr.execute("SELECT filepath FROM docs WHERE filepath = (?)", (file_path,))
-                existing = self.curr.fetchall()
-                if existing:
-                    self.remove_doc(file_path)
-                    self.curr.execute("""
-                        UPDATE docs SET file_hash=?, chunk_count=?, last_indexed=?
-                        WHERE filepath=?
-                    """, (file_hash, len(splits_uuids[0]), datetime.now().isoformat(), file_path))
-                else:
-                    self.curr.execute(""" 
-                        INSERT INTO docs (id, filepath, file_hash, chunk_count, last_indexed) 
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (str(uuid.uuid4()), file_path, file_hash, len(splits_uuids[0]), datetime.now().isoformat()))
-                
-                documents_to_add.extend(splits_uuids[0])
-                ids_to_add.extend(splits_uuids[1])
-
-        if documents_to_add:
-            self.vector_store.add_documents(documents=documents_to_add, ids=ids_to_add)
-            self.conn.commit() 
+    def add_documents_batch(self, file_paths: list[str], verbose: bool, jobs: int = 1) -> None:
+        """Batch process multiple documents efficiently
+
+        Files stream through read -> parse/split -> embed -> upsert to Milvus -> record in docs.
+        Stages run concurrently with bounded queues in between, so a batch is embedded while the previous
+        one is being written and memory does not grow with the number of files.
+        Progress is journaled in the .rag directory: an interrupted commit picks up where it stopped
+        the next time it is run, and new chunks of a file are always written before its stale ones are deleted.
+        
+        Args:
+            file_paths (list[str]): the files to index.
+            verbose (bool): prints how each file was split.
+            jobs (int): number of worker processes used to hash, parse and split the files. 
+                Results are merged back in the order of file_paths.
+        """
+        indexed_hashes = self.get_current_hashes(file_paths)
+        # taken before any file is read, so a file edited mid-commit is hashed again next time
+        stat_keys = {file_path: get_stat_key(file_path) for file_path in file_paths}
+        known_hashes = self.get_cached_hashes(file_paths, stat_keys)
+        # Files whose stat tuple did not change since they were indexed are never read
+        work = [
+            (file_path, indexed_hashes.get(file_path), known_hashes.get(file_path), verbose) 
+            for file_path in file_paths
+            if known_hashes.get(file_path) is None or known_hashes[file_path] != indexed_hashes.get(file_path)
+        ]
+
+        # read here, the diff stage runs in another thread than the SQLite connection
+        indexed_chunks = self.get_files_chunk_ids([file_path for file_path, *_ in work])
+
+        # opened once the files are known to be readable, a commit that fails before writing anything leaves no journal
+        journal = CommitJournal(os.path.join(self.rag_dir, JOURNAL_FILE))
+        if journal.resumed:
+            console.print(f"[yellow]Resuming interrupted commit, {len(journal.done)} files were already indexed.")
+        changed = False
+        try:
+            # interrupted files this commit does not diff again only lose the chunks they left behind
+            left_over = journal.interrupted() - {file_path for file_path, *_ in work}
+            if left_over:
+                changed = self.remove_orphan_chunks(left_over, journal)
+            files = self.ingest(work, jobs)
+            batches = threaded(self.batch_changes(files, indexed_hashes, indexed_chunks, stat_keys, journal.interrupted(), verbose))
+            embedded = threaded(self.embed_batches(batches))
+            try:
+                for batch, vectors in embedded:
+                    self.write_batch(batch, vectors, journal)
+                    changed = True
+            except BaseException:
+                embedded.close()
+                raise
+        except BaseException:
+            journal.close(completed=False)
+            raise
+        journal.close(completed=True)
+
+        if verbose:
+            console.print(f"[italic]Embedding cache: {self.embedding_cache.stats()}")
+            console.print(f"[italic]Embedding: {self.embeddings.stats()}")
+        if changed:
             self.close()   
 
-    def get_current_hashes(self, paths: list[str]) -> dict:
-        assert all([os.path.exists(path) for path in paths]), "Some of these are not real paths"
-        placeholder= '?' 
-        placeholders= ', '.join(placeholder for unused in paths)
-        query= 'SELECT filepath, file_hash FROM docs WHERE filepath IN(%s)' % placeholders
-        self.curr.execute(query, paths)
-        path_hash_dict = {path : hash for path, hash in self.curr.fetchall()}
-        return path_hash_dict
+    def ingest(self, work: list[tuple[str, str | None, str | None, bool]], jobs: int):
+        """Read and parse/split stage. Yields ingest_file results in input order,
+        keeping at most 2 * jobs files in flight."""
+        if jobs > 1 and len(work) > 1:
+            # spawn rather than fork: the parent already holds Milvus Lite and gRPC threads
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+                pending = deque()
+                for job in work:
+                    pending.append(pool.submit(ingest_file, job))
+                    if len(pending) >= 2 * jobs:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+        else:
+            for job in work:
+                yield ingest_file(job)
+
+    def batch_changes(self, files, indexed_hashes: dict, indexed_chunks: dict, stat_keys: dict, interrupted: set[str], verbose: bool):
+        """Diff stage. Works out which chunks of each file must be embedded or deleted
+        and groups them into CommitBatches of roughly batch_chunks chunks.
+        indexed_chunks maps files to the ids of their chunks recorded in the chunks table.
+        Files in interrupted may have chunks in the vector store without a docs row and are diffed too."""
+        batch_chunks = self.embeddings.batch_size * self.embeddings.concurrency
+        batch = CommitBatch()
+        for file_path, file_hash, splits_uuids, symbols in files:
+            batch.hashes.append((file_path, stat_keys[file_path], file_hash))
+            if splits_uuids is None:
+                continue
+            docs, ids = splits_uuids
+            all_chunks = list(zip(docs, ids))
+            existing = file_path in indexed_hashes
+            row = (file_path, file_hash, len(docs), existing)
+            stale_ids = set()
+            if existing or file_path in interrupted:
+                # Only chunks whose content changed are embedded, vanished ones are deleted.
+                # An interrupted commit may have written chunks the chunks table does not list yet
+                existing_ids = set(indexed_chunks.get(file_path, ()))
+                if file_path in interrupted:
+                    existing_ids |= set(self.get_stored_chunk_ids(file_path))
+                new_ids = set(ids)
+                stale_ids = existing_ids - new_ids
+                kept = [(doc, id) for doc, id in zip(docs, ids) if id not in existing_ids]
+                if verbose:
+                    console.print(f"[italic]{file_path}: kept {len(new_ids & existing_ids)} chunks, "
+                                  f"embedding {len(kept)}, deleting {len(stale_ids)}")
+                docs = [doc for doc, _ in kept]
+                ids = [id for _, id in kept]
+
+            for doc, id in zip(docs, ids):
+                batch.files.add(file_path)
+                batch.docs.append(doc)
+                batch.ids.append(id)
+                batch.lexical.append((doc, id))
+                if len(batch.docs) >= batch_chunks:
+                    yield batch
+                    batch = CommitBatch()
+            # Stale chunks go out with the file's docs row, after all of its new chunks are written
+            batch.files.add(file_path)
+            batch.stale_ids.extend(stale_ids)
+            batch.rows.append(row)
+            batch.symbols[file_path] = symbols
+            batch.chunks[file_path] = [
+                (id, doc.metadata.get("start_index", 0), len(doc.page_content), doc.metadata["chunk_hash"]) for doc, id in all_chunks
+            ]
+            if file_path in interrupted:
+                new_ids = set(ids)
+                batch.lexical.extend((doc, id) for doc, id in all_chunks if id not in new_ids)
+        if batch.docs or batch.rows or batch.hashes:
+            yield batch
+
+    def embed_batches(self, batches):
+        """Embed stage"""
+        for batch in batches:
+            yield batch, self.embeddings.embed_documents([doc.page_content for doc in batch.docs])
+
+    def write_batch(self, batch: CommitBatch, vectors: list[list[float]], journal: CommitJournal) -> None:
+        """Upsert stage. Writes the chunks to Milvus, then records the files they complete in docs and chunks.
+
+        Ordering keeps both stores consistent if we stop at any point: the journal marks the files as started,
+        new chunks are inserted and flushed, stale chunks are deleted by primary key in one call, and only then
+        are the docs and chunks rows committed, in one transaction, and the files marked as done.
+        """
+        journal.start(batch.files)
+        if batch.docs:
+            self.vector_store.add_embeddings(
+                texts=[doc.page_content for doc in batch.docs],
+                embeddings=vectors,
+                metadatas=[doc.metadata for doc in batch.docs],
+                ids=batch.ids,
+            )
+        if batch.stale_ids:
+            self.delete_chunks(batch.stale_ids)
+        if batch.docs or batch.stale_ids:
+            self.vector_store.client.flush(self.vector_store.collection_name)
+        indexed_at = datetime.now().isoformat()
+        self.curr.executemany("""
+            UPDATE docs SET file_hash=?, chunk_count=?, last_indexed=?
+            WHERE filepath=?
+        """, [(file_hash, chunk_count, indexed_at, file_path) for file_path, file_hash, chunk_count, existing in batch.rows if existing])
+        doc_ids = self.get_doc_ids([file_path for file_path, *_, existing in batch.rows if existing])
+        new_docs = [(str(uuid.uuid4()), file_path, file_hash, chunk_count, indexed_at) for file_path, file_hash, chunk_count, existing in batch.rows if not existing]
+        self.curr.executemany(""" 
+            INSERT INTO docs (id, filepath, file_hash, chunk_count, last_indexed) 
+            VALUES (?, ?, ?, ?, ?)
+        """, new_docs)
+        doc_ids.update((file_path, doc_id) for doc_id, file_path, *_ in new_docs)
+        self.replace_chunk_rows({doc_ids[file_path]: batch.chunks[file_path] for file_path, *_ in batch.rows})
+        self.replace_symbols(batch.symbols)
+        self.update_lexical_index(batch.lexical, batch.stale_ids)
+        self.update_stat_cache(batch.hashes)
+        if batch.docs or batch.stale_ids or batch.rows:
+            self.bump_generation()
+        self.conn.commit()
+        journal.finish([row[0] for row in batch.rows])
 
+    def remove_orphan_chunks(self, file_paths: set[str], journal: CommitJournal) -> bool:
+        """Deletes the chunks an interrupted commit wrote to the vector store for files without recording them in the chunks table.
 
+        Returns: whether any chunk was deleted
+        """
+        orphans = []
+        for file_path in sorted(file_paths):
+            recorded = set(self.get_chunk_ids(file_path))
+            orphans.extend(id for id in self.get_stored_chunk_ids(file_path) if id not in recorded)
+        if orphans:
+            self.delete_chunks(orphans)
+            self.vector_store.client.flush(self.vector_store.collection_name)
+        journal.finish(file_paths)
+        return bool(orphans)
+
+    def replace_symbols(self, symbols: dict[str, list[tuple]]) -> None:
+        """Records the symbols of files, replacing what was recorded for them before. Does not commit."""
+        self.curr.executemany("DELETE FROM symbols WHERE filepath = ?", [(file_path,) for file_path in symbols])
+        self.curr.executemany(
+            "INSERT INTO symbols (filepath, name, qualified_name, kind, parent, start_line, end_line) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(file_path, *symbol) for file_path, file_symbols in symbols.items() for symbol in file_symbols],
+        )
 
-    def get_file_hash(self, file_path) -> str:
-        """Hash for change detection"""
-        with open(file_path, 'rb') as f:
-            return hashlib.md5(f.read()).hexdigest()
+    def replace_chunk_rows(self, chunks: dict[str, list[tuple[str, int, int, str]]]) -> None:
+        """Records the (chunk id, start index, length, chunk hash) of every chunk of files by doc id, replacing their previous chunks. Does not commit."""
+        self.curr.executemany("DELETE FROM chunks WHERE doc_id = ?", [(doc_id,) for doc_id in chunks])
+        self.curr.executemany(
+            "INSERT OR REPLACE INTO chunks (id, doc_id, start_index, length, chunk_hash) VALUES (?, ?, ?, ?, ?)",
+            [(id, doc_id, *chunk) for doc_id, doc_chunks in chunks.items() for id, *chunk in doc_chunks],
+        )
 
-    def process_docs(self, file_path: Path, file_hash: str, verbose: bool = False) -> tuple[list[Document], list[str]]:
-        """Process code or text documents, using appropriate parser based on file type."""
+    def delete_chunks(self, ids: list[str]) -> None:
+        """Deletes chunks from the vector store by primary key, DELETE_BATCH at a time. Does not flush."""
+        vector_store = self.vector_store
+        if vector_store.col is None:
+            return
+        for i in range(0, len(ids), DELETE_BATCH):
+            vector_store.client.delete(vector_store.collection_name, ids=ids[i:i + DELETE_BATCH])
 
-        if file_path.suffix in CODE_LANGUAGES:
-            lang: Language = CODE_LANGUAGES[file_path.suffix]
-            loader = GenericLoader.from_filesystem(
-                str(file_path.parent),
-                glob=str(file_path.name),
-                parser=LanguageParser(language=lang)
-            )
-            docs = loader.load()
-            text_splitter = RecursiveCharacterTextSplitter.from_language(
-                language=lang,
-                chunk_size=1500,
-                chunk_overlap=200,
-                add_start_index=True,
+    def bump_generation(self) -> None:
+        """Marks the index as changed, search results cached before are not served anymore. Does not commit."""
+        self.curr.execute(
+            "INSERT INTO index_state (key, value) VALUES ('generation', 1) ON CONFLICT(key) DO UPDATE SET value = value + 1"
+        )
+
+    def update_lexical_index(self, chunks: list[tuple[Document, str]], stale_ids: list[str]) -> None:
+        """Writes chunks to the full-text index and deletes stale ones, by rowid. Does not commit."""
+        self.curr.executemany(
+            "DELETE FROM chunks_fts WHERE rowid = ?",
+            [(get_chunk_rowid(id),) for id in stale_ids] + [(get_chunk_rowid(id),) for _, id in chunks],
+        )
+        self.curr.executemany(
+            "INSERT INTO chunks_fts (rowid, text, id, source, content_type, language) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (get_chunk_rowid(id), doc.page_content, id, doc.metadata.get("source"),
+                 doc.metadata.get("content_type"), doc.metadata.get("language"))
+                for doc, id in chunks
+            ],
+        )
+
+    def rebuild_lexical_index(self) -> int:
+        """Fills the full-text index from the chunks stored in the vector store, e.g. for an index built before it existed.
+
+        Returns: the number of chunks indexed
+        """
+        self.curr.execute("DELETE FROM chunks_fts")
+        vector_store = self.vector_store
+        count = 0
+        if vector_store.col is not None:
+            self.curr.execute("SELECT filepath FROM docs")
+            file_paths = [file_path for (file_path,) in self.curr.fetchall()]
+            for i in range(0, len(file_paths), 100):
+                rows = vector_store.client.query(
+                    vector_store.collection_name,
+                    filter=f"source in {json.dumps(file_paths[i:i + 100])}",
+                    output_fields=[vector_store._primary_field, vector_store._text_field, "source", "content_type", "language"],
+                )
+                self.update_lexical_index(
+                    [(Document(page_content=row[vector_store._text_field], metadata=row), row[vector_store._primary_field]) for row in rows],
+                    [],
+                )
+                count += len(rows)
+        self.bump_generation()
+        self.conn.commit()
+        return count
+
+    def rebuild_chunk_table(self) -> int:
+        """Fills the chunks table from the chunks stored in the vector store, e.g. for an index built before it existed.
+
+        Returns: the number of chunks recorded
+        """
+        self.curr.execute("DELETE FROM chunks")
+        vector_store = self.vector_store
+        count = 0
+        if vector_store.col is not None:
+            self.curr.execute("SELECT filepath, id FROM docs")
+            doc_ids = dict(self.curr.fetchall())
+            file_paths = list(doc_ids)
+            fields = [field for field in ("start_index", "chunk_hash") if field in vector_store.fields]
+            for i in range(0, len(file_paths), 100):
+                rows = vector_store.client.query(
+                    vector_store.collection_name,
+                    filter=f"source in {json.dumps(file_paths[i:i + 100])}",
+                    output_fields=[vector_store._primary_field, vector_store._text_field, "source", *fields],
+                )
+                self.curr.executemany(
+                    "INSERT OR REPLACE INTO chunks (id, doc_id, start_index, length, chunk_hash) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (row[vector_store._primary_field], doc_ids[row["source"]], row.get("start_index", 0),
+                         len(row[vector_store._text_field]), row.get("chunk_hash") or get_chunk_hash(row[vector_store._text_field]))
+                        for row in rows
+                    ],
+                )
+                count += len(rows)
+        self.conn.commit()
+        return count
+
+    def rebuild_symbols(self) -> int:
+        """Extracts the symbols of every indexed file again, e.g. for an index built before symbols were recorded.
+
+        Returns: the number of symbols recorded
+        """
+        self.curr.execute("SELECT filepath FROM docs")
+        symbols = {}
+        for (file_path,) in self.curr.fetchall():
+            if os.path.exists(file_path):
+                symbols[file_path] = extract_symbols(Path(file_path).suffix, Path(file_path).read_bytes())
+        self.curr.execute("DELETE FROM symbols")
+        self.replace_symbols(symbols)
+        self.conn.commit()
+        return sum(len(file_symbols) for file_symbols in symbols.values())
+
+    def get_chunk_ids(self, file_path: str) -> list[str]:
+        """Ids of the chunks recorded for a file"""
+        self.curr.execute("SELECT chunks.id FROM chunks JOIN docs ON docs.id = chunks.doc_id WHERE docs.filepath = ?", (file_path,))
+        return [id for (id,) in self.curr.fetchall()]
+
+    def get_files_chunk_ids(self, file_paths: list[str]) -> dict[str, list[str]]:
+        """Ids of the chunks recorded for each of the files that has any"""
+        file_ids = {}
+        for i in range(0, len(file_paths), MAX_SQL_VARIABLES):
+            batch = file_paths[i:i + MAX_SQL_VARIABLES]
+            placeholders = ', '.join('?' for unused in batch)
+            self.curr.execute(
+                'SELECT docs.filepath, chunks.id FROM chunks JOIN docs ON docs.id = chunks.doc_id WHERE docs.filepath IN(%s)' % placeholders, batch
             )
-            content_type = "code"
-            # Extract language name from enum - use value if available, otherwise use lowercase name
-            language_name = lang.value if hasattr(lang, 'value') else lang.name.lower()
-        elif file_path.suffix in TEXT_EXTENSIONS:
-            loader = TextLoader(str(file_path))
-            docs = loader.load()
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1500,
-                chunk_overlap=200,
-                add_start_index=True,
+            for file_path, id in self.curr.fetchall():
+                file_ids.setdefault(file_path, []).append(id)
+        return file_ids
+
+    def get_stored_chunk_ids(self, file_path: str) -> list[str]:
+        """Ids of the chunks stored in the vector store for a file. Scans the collection, only used
+        for files an interrupted commit may have written chunks of without recording them."""
+        if self.vector_store.col is None:
+            return []
+        return self.vector_store.get_pks(f"source == {json.dumps(file_path)}") or []
+
+    def get_doc_ids(self, file_paths: list[str]) -> dict[str, str]:
+        """docs row id of each of the files that is indexed"""
+        doc_ids = {}
+        for i in range(0, len(file_paths), MAX_SQL_VARIABLES):
+            batch = file_paths[i:i + MAX_SQL_VARIABLES]
+            placeholders = ', '.join('?' for unused in batch)
+            self.curr.execute('SELECT filepath, id FROM docs WHERE filepath IN(%s)' % placeholders, batch)
+            doc_ids.update(self.curr.fetchall())
+        return doc_ids
+
+    def get_current_hashes(self, paths: list[str]) -> dict:
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError(f"Cannot index files that do not exist: {', '.join(missing)}")
+        path_hash_dict = {}
+        for i in range(0, len(paths), MAX_SQL_VARIABLES):
+            batch = paths[i:i + MAX_SQL_VARIABLES]
+            placeholders = ', '.join('?' for unused in batch)
+            query = 'SELECT filepath, file_hash FROM docs WHERE filepath IN(%s)' % placeholders
+            self.curr.execute(query, batch)
+            path_hash_dict.update({path : hash for path, hash in self.curr.fetchall()})
+        return path_hash_dict
+
+    def get_file_hash(self, file_path) -> str:
+        """Hash for change detection"""
+        return get_file_hash(file_path)
+
+    def get_cached_hashes(self, paths: list[str], stat_keys: dict | None = None) -> dict:
+        """Hashes from the stat cache for the files whose size, mtime and inode did not change"""
+        if stat_keys is None:
+            stat_keys = {path: get_stat_key(path) for path in paths}
+        cached = {}
+        for i in range(0, len(paths), MAX_SQL_VARIABLES):
+            batch = paths[i:i + MAX_SQL_VARIABLES]
+            placeholders = ', '.join('?' for unused in batch)
+            self.curr.execute(
+                'SELECT filepath, size, mtime_ns, inode, file_hash FROM file_stats WHERE filepath IN(%s)' % placeholders, batch
             )
-            content_type = "text"
-            language_name = "text"
-        else:
-            raise ValueError(f"Unsupported file extension: {file_path.suffix}")
+            for path, size, mtime_ns, inode, file_hash in self.curr.fetchall():
+                if stat_keys[path] == (size, mtime_ns, inode):
+                    cached[path] = file_hash
+        return cached
+
+    def update_stat_cache(self, hashes: list[tuple[str, tuple[int, int, int], str]]) -> None:
+        """Records the stat tuple each file had when it was hashed"""
+        self.curr.executemany(
+            "INSERT OR REPLACE INTO file_stats VALUES (?, ?, ?, ?, ?)",
+            [(path, *stat_key, file_hash) for path, stat_key, file_hash in hashes],
+        )
 
-        all_splits = text_splitter.split_documents(docs)
-        if verbose:
-            console.print(f"\n[italic]Split {str(file_path)} into {len(all_splits)} sub_documents")
-        
-        uuids = [str(uuid.uuid4()) for _ in range(len(all_splits))]
-        
-        for chunk, ids in zip(all_splits, uuids):
-            chunk.metadata["uuid"] = ids
-            chunk.metadata["source"] = str(file_path)
-            chunk.metadata["hash"] = file_hash
-            chunk.metadata["indexed_at"] = datetime.now().isoformat()
-            chunk.metadata["content_type"] = content_type
-            chunk.metadata["language"] = language_name
-        
-        return all_splits, uuids
+    def get_file_hashes(self, paths: list[str]) -> dict:
+        """Hashes of files, only reading the ones whose stat tuple changed since they were last hashed"""
+        stat_keys = {path: get_stat_key(path) for path in paths}
+        hashes = self.get_cached_hashes(paths, stat_keys)
+        fresh = [(path, stat_keys[path], get_file_hash(path)) for path in paths if path not in hashes]
+        if fresh:
+            self.update_stat_cache(fresh)
+            self.conn.commit()
+            hashes.update({path: file_hash for path, _, file_hash in fresh})
+        return hashes
+
+    def process_docs(self, file_path: Path, file_hash: str, verbose: bool = False) -> tuple[list[Document], list[str]]:
+        """Process code or text documents, using appropriate parser based on file type."""
+        return split_file(file_path, file_hash, verbose)
         
     def remove_doc(self, file_path):
-        res = self.vector_store.delete(
-            expr=f"source == '{file_path}'",
-        )
\ No newline at end of file
+        self.remove_documents([file_path])
+
+    def remove_documents(self, file_paths: list[str]) -> None:
+        """Removes files from the vector store, the docs, chunks and full-text tables and the stat cache.
+        Their chunks are looked up in the chunks table and deleted by primary key, all files at once."""
+        ids = [id for file_ids in self.get_files_chunk_ids(file_paths).values() for id in file_ids]
+        if ids:
+            self.delete_chunks(ids)
+            self.vector_store.client.flush(self.vector_store.collection_name)
+        self.curr.executemany("DELETE FROM chunks WHERE id = ?", [(id,) for id in ids])
+        self.curr.executemany("DELETE FROM chunks_fts WHERE rowid = ?", [(get_chunk_rowid(id),) for id in ids])
+        self.curr.executemany("DELETE FROM docs WHERE filepath = ?", [(file_path,) for file_path in file_paths])
+        self.curr.executemany("DELETE FROM file_stats WHERE filepath = ?", [(file_path,) for file_path in file_paths])
+        self.curr.executemany("DELETE FROM symbols WHERE filepath = ?", [(file_path,) for file_path in file_paths])
+        self.bump_generation()
+        self.conn.commit()
+
+    def rename_document(self, old_path: str, new_path: str) -> None:
+        """Moves a file's chunks to its new path without embedding them again.
+        Stored vectors are re-keyed with the ids the new path gives them, so a later edit diffs cleanly."""
+        vector_store = self.vector_store
+        old_ids = self.get_chunk_ids(old_path)
+        rows = vector_store.client.get(
+            vector_store.collection_name, ids=old_ids, output_fields=["*"]
+        ) if vector_store.col is not None and old_ids else []
+        occurrences = {}
+        for row in sorted(rows, key=lambda row: row.get("start_index", 0)):
+            chunk_hash = row.get("chunk_hash") or get_chunk_hash(row[vector_store._text_field])
+            occurrences[chunk_hash] = occurrences.get(chunk_hash, 0) + 1
+            new_id = get_chunk_id(new_path, chunk_hash, occurrences[chunk_hash])
+            row[vector_store._primary_field] = new_id
+            row["source"] = new_path
+            if "uuid" in row:
+                row["uuid"] = new_id
+        if rows:
+            vector_store.client.insert(vector_store.collection_name, rows)
+            self.delete_chunks(old_ids)
+            vector_store.client.flush(vector_store.collection_name)
+        self.curr.execute("UPDATE docs SET filepath = ? WHERE filepath = ?", (new_path, old_path))
+        self.curr.execute("SELECT id FROM docs WHERE filepath = ?", (new_path,))
+        doc = self.curr.fetchone()
+        if doc:
+            self.replace_chunk_rows({doc[0]: [
+                (row[vector_store._primary_field], row.get("start_index", 0), len(row[vector_store._text_field]),
+                 row.get("chunk_hash") or get_chunk_hash(row[vector_store._text_field]))
+                for row in rows
+            ]})
+        self.curr.execute("DELETE FROM file_stats WHERE filepath = ?", (old_path,))
+        self.curr.execute("UPDATE symbols SET filepath = ? WHERE filepath = ?", (new_path, old_path))
+        self.curr.executemany("DELETE FROM chunks_fts WHERE rowid = ?", [(get_chunk_rowid(id),) for id in old_ids])
+        self.update_lexical_index(
+            [(Document(page_content=row[vector_store._text_field], metadata=row), row[vector_store._primary_field]) for row in rows],
+            [],
+        )
+        self.bump_generation()
+        self.conn.commit()
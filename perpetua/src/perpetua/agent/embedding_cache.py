@@ -0,0 +1,207 @@
+#On-disk cache of document embeddings, keyed by embedding model and chunk text hash
+from langchain_core.embeddings import Embeddings
+
+from array import array
+from collections import OrderedDict
+import hashlib
+import sqlite3
+import threading
+import time
+import os
+
+# Lives next to database.db and survives `reset --hard`
+EMBEDDING_CACHE_FILE = "embedding_cache.db"
+
+# Default upper bound of the cache file, can be overridden with EMBEDDING_CACHE_MB in the config .env
+DEFAULT_CACHE_MB = 1024
+
+# Query vectors are also kept in memory, shared by every RAGStore of the process
+QUERY_LRU_SIZE = 256
+_query_vectors: OrderedDict = OrderedDict()
+_query_lock = threading.Lock()
+
+def normalize_query(text: str) -> str:
+    """Queries differing only by whitespace share their cache entries"""
+    return " ".join(text.split())
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedding function with a persistent SQLite cache.
+
+    Vectors are stored per (model name, chunk hash), so text that has been embedded once,
+    in any file or on any branch, is never sent to the embedding model again.
+    Query vectors are cached too, under a separate model key since models may embed queries differently,
+    and in an in-process LRU in front of the file.
+    Least recently used entries are evicted once the cache grows past max_bytes.
+    Safe to share between threads, the network call itself is made outside the lock.
+
+    Args:
+    embeddings: the embedding function to wrap
+    model_name: name of the embedding model, part of the cache key
+    cache_URI: path to the SQLite file holding the cache
+    max_bytes: size of the stored vectors above which entries are evicted
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache_URI: str, max_bytes: int | None = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.query_model = model_name + ":query"
+        if max_bytes is None:
+            max_bytes = int(os.getenv("EMBEDDING_CACHE_MB", DEFAULT_CACHE_MB)) * 1024 * 1024
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(cache_URI, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings(
+            model TEXT,
+            chunk_hash TEXT,
+            vector BLOB,
+            size INT,
+            last_used REAL,
+            PRIMARY KEY (model, chunk_hash)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embeds texts, only calling the wrapped model for texts that are not cached"""
+        keys = [self.text_hash(text) for text in texts]
+        cached = self.get(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_entries = dict(zip(missing.keys(), vectors))
+            self.store(new_entries)
+            cached.update(new_entries)
+
+        return [cached[key] for key in keys]
+
+    def get(self, keys: list[str]) -> dict[str, list[float]]:
+        """Looks up chunk hashes and counts the hits and misses"""
+        cached = self.lookup(keys)
+        misses = sum(key not in cached for key in keys)
+        with self.lock:
+            self.misses += misses
+            self.hits += len(keys) - misses
+        return cached
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = self.get_query(text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.store_query(text, vector)
+        return vector
+
+    def get_query(self, text: str) -> list[float] | None:
+        """Cached vector of a query, from memory or else from the cache file"""
+        key = (self.query_model, self.text_hash(normalize_query(text)))
+        with _query_lock:
+            if key in _query_vectors:
+                _query_vectors.move_to_end(key)
+                return _query_vectors[key]
+        with self.lock:
+            vector = self._lookup([key[1]], self.query_model).get(key[1])
+        if vector is not None:
+            self.remember_query(key, vector)
+        return vector
+
+    def store_query(self, text: str, vector: list[float]) -> None:
+        key = (self.query_model, self.text_hash(normalize_query(text)))
+        self.remember_query(key, vector)
+        with self.lock:
+            self._store({key[1]: vector}, self.query_model)
+
+    @staticmethod
+    def remember_query(key: tuple[str, str], vector: list[float]) -> None:
+        with _query_lock:
+            _query_vectors[key] = vector
+            _query_vectors.move_to_end(key)
+            while len(_query_vectors) > QUERY_LRU_SIZE:
+                _query_vectors.popitem(last=False)
+
+    def lookup(self, keys: list[str]) -> dict[str, list[float]]:
+        """Fetches cached vectors for the given chunk hashes and marks them as recently used"""
+        with self.lock:
+            return self._lookup(keys)
+
+    def _lookup(self, keys: list[str], model: str | None = None) -> dict[str, list[float]]:
+        model = model or self.model_name
+        found = {}
+        unique_keys = list(set(keys))
+        for i in range(0, len(unique_keys), 900):
+            batch = unique_keys[i:i + 900]
+            placeholders = ", ".join("?" for unused in batch)
+            rows = self.conn.execute(
+                f"SELECT chunk_hash, vector FROM embeddings WHERE model = ? AND chunk_hash IN ({placeholders})",
+                [model, *batch],
+            ).fetchall()
+            found.update({key: array("f", vector).tolist() for key, vector in rows})
+        if found:
+            now = time.time()
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND chunk_hash = ?",
+                [(now, model, key) for key in found],
+            )
+            self.conn.commit()
+        return found
+
+    def store(self, entries: dict[str, list[float]]) -> None:
+        """Adds vectors to the cache and evicts old entries if it grew too large"""
+        with self.lock:
+            self._store(entries)
+
+    def _store(self, entries: dict[str, list[float]], model: str | None = None) -> None:
+        model = model or self.model_name
+        now = time.time()
+        keys = list(entries)
+        # entries stored again replace their row, their old size no longer counts
+        for i in range(0, len(keys), 900):
+            batch = keys[i:i + 900]
+            placeholders = ", ".join("?" for unused in batch)
+            self.size -= self.conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE model = ? AND chunk_hash IN ({placeholders})",
+                [model, *batch],
+            ).fetchone()[0]
+        rows = []
+        for key, vector in entries.items():
+            blob = array("f", vector).tobytes()
+            rows.append((model, key, blob, len(blob), now))
+            self.size += len(blob)
+        self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+        self.conn.commit()
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        """Removes least recently used entries until the cache is back under 90% of max_bytes"""
+        target = int(self.max_bytes * 0.9)
+        rows = self.conn.execute("SELECT model, chunk_hash, size FROM embeddings ORDER BY last_used").fetchall()
+        to_delete = []
+        for model, key, size in rows:
+            if self.size <= target:
+                break
+            to_delete.append((model, key))
+            self.size -= size
+        self.conn.executemany("DELETE FROM embeddings WHERE model = ? AND chunk_hash = ?", to_delete)
+        self.conn.commit()
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = (100 * self.hits / total) if total else 0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), {self.size / (1024 * 1024):.1f} MB cached"
+
+    def close(self):
+        """Closes sqlite connection"""
+        self.conn.close()
@@ -0,0 +1,101 @@
+#Embedding providers: which model embeds a project's chunks and queries, and how requests to it are batched
+from langchain_core.embeddings import Embeddings
+
+import threading
+import os
+
+# Default model and request settings of each provider. Gemini is a rate limited remote API taking up to
+# 100 texts per request, Ollama serves one local model that is saturated by a couple of concurrent requests,
+# and in-process models batch on their own device with no request overhead at all.
+PROVIDERS = {
+    "gemini": {"model": "models/gemini-embedding-001", "batch_size": 100, "concurrency": 4, "requests_per_minute": 300},
+    "ollama": {"model": "nomic-embed-text", "batch_size": 32, "concurrency": 2, "requests_per_minute": 6000},
+    "local": {"model": "sentence-transformers/all-MiniLM-L6-v2", "batch_size": 64, "concurrency": 1, "requests_per_minute": 60000},
+}
+
+# Embedding clients are shared by every RAGStore of the process, so commands reopening the index
+# (watch, ask, serve) keep their HTTP connections and in-process models keep their weights loaded
+_models: dict[tuple[str, str], Embeddings] = {}
+_models_lock = threading.Lock()
+
+class EmbeddingModelMismatch(ValueError):
+    """The configured embedding model is not the one the index was built with"""
+
+def get_provider() -> tuple[str, str]:
+    """(provider, model) configured in the config .env.
+
+    EMBEDDING_PROVIDER picks the provider explicitly. Otherwise LOCAL=True uses Ollama and Gemini is used.
+    Local providers embed with LOCAL_EMBD_MODEL, or their default model when it is not set.
+    """
+    provider = os.getenv("EMBEDDING_PROVIDER") or ("ollama" if os.getenv("LOCAL") == "True" else "gemini")
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown embedding provider {provider}, expected one of {', '.join(PROVIDERS)}")
+    model = PROVIDERS[provider]["model"]
+    if provider != "gemini":
+        model = os.getenv("LOCAL_EMBD_MODEL") or model
+    return provider, model
+
+def request_settings(provider: str) -> dict:
+    """EmbeddingScheduler settings of a provider, EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY and EMBEDDING_RPM take precedence"""
+    defaults = PROVIDERS[provider]
+    return {
+        "batch_size": int(os.getenv("EMBEDDING_BATCH_SIZE", defaults["batch_size"])),
+        "concurrency": int(os.getenv("EMBEDDING_CONCURRENCY", defaults["concurrency"])),
+        "requests_per_minute": float(os.getenv("EMBEDDING_RPM", defaults["requests_per_minute"])),
+    }
+
+def cache_key(provider: str, model: str) -> str:
+    """Model name in the embedding cache. Gemini keeps the bare model name its vectors were cached under."""
+    return model if provider == "gemini" else f"{provider}:{model}"
+
+def check_model(config: dict, provider: str, model: str) -> None:
+    """Raises EmbeddingModelMismatch when the project was indexed with another model.
+    Vectors of different models are not comparable, searching them would return unrelated chunks."""
+    embedding = config["embedding"]
+    if (embedding["provider"], embedding["model"]) != (provider, model):
+        raise EmbeddingModelMismatch(
+            f"This project was indexed with the {embedding['provider']} model {embedding['model']}, "
+            f"but the {provider} model {model} is configured. Configure {embedding['model']} again, "
+            "or run `perpetua reset --hard` and commit to index the project with the new model."
+        )
+
+class InProcessEmbeddings(Embeddings):
+    """sentence-transformers model running in this process, nothing leaves the machine.
+    Texts are encoded in batches of batch_size on the model's device and vectors are normalized.
+
+    Args:
+    model: name or path of a sentence-transformers model
+    batch_size: texts encoded at once
+    """
+
+    def __init__(self, model: str, batch_size: int = 64):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("The local embedding provider needs sentence-transformers: pip install sentence-transformers")
+        self.model = SentenceTransformer(model)
+        self.batch_size = batch_size
+        # encode is not thread safe
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self.lock:
+            return self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+def get_embeddings(provider: str, model: str) -> Embeddings:
+    """Embedding client of a provider's model, created once per process"""
+    key = (provider, model)
+    with _models_lock:
+        if key not in _models:
+            if provider == "gemini":
+                from langchain_google_genai import GoogleGenerativeAIEmbeddings
+                _models[key] = GoogleGenerativeAIEmbeddings(model=model)
+            elif provider == "ollama":
+                from langchain_ollama import OllamaEmbeddings
+                _models[key] = OllamaEmbeddings(model=model, base_url=os.getenv("OLLAMA_HOST"))
+            else:
+                _models[key] = InProcessEmbeddings(model, PROVIDERS["local"]["batch_size"])
+        return _models[key]
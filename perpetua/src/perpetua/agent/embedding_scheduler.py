@@ -0,0 +1,180 @@
+#Batched, concurrent and rate limited embedding of documents
+from langchain_core.embeddings import Embeddings
+
+from .embedding_cache import CachedEmbeddings
+from .compression import truncate
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import random
+import re
+import time
+import os
+
+# Defaults, can be overridden in the config .env or with `perpetua commit` options
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_MINUTE = 300
+MAX_RETRIES = 6
+
+# Exception classes raised for a 429 by the supported clients and SDKs
+RATE_LIMIT_ERRORS = {"ResourceExhausted", "TooManyRequests", "RateLimitError"}
+# A 429 named as a status in an error message, e.g. "429 RESOURCE_EXHAUSTED" or "HTTP error 429",
+# not any 429 in a path or an id
+RATE_LIMIT_STATUS = re.compile(r"(?:^|\b(?:http|status|code|error)\b[\s:=]*)429\b", re.IGNORECASE)
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """Whether an exception raised by an embedding client means we hit a quota (HTTP 429).
+    Works for the Gemini client (ResourceExhausted), Ollama (ResponseError) and httpx errors (HTTPStatusError).
+    The status code or the exception type decide when the client gives one, the message only otherwise."""
+    statuses = [getattr(e, "status_code", None), getattr(e, "code", None), getattr(getattr(e, "response", None), "status_code", None)]
+    statuses = [status for status in statuses if isinstance(status, int)]
+    if 429 in statuses or any(cls.__name__ in RATE_LIMIT_ERRORS for cls in type(e).__mro__):
+        return True
+    if statuses:
+        return False
+    message = str(e)
+    return bool(RATE_LIMIT_STATUS.search(message)) or "RESOURCE_EXHAUSTED" in message or "rate limit" in message.lower()
+
+class TokenBucket:
+    """Token bucket limiting how many embedding requests are issued per second.
+
+    The rate adapts: it is halved when the endpoint answers with a 429 (at most once per second,
+    so concurrent failures from one burst count once) and grows back by 10% after a streak
+    of successful requests, never exceeding max_rate.
+
+    Args:
+    rate: requests per second allowed
+    capacity: how many requests can be issued in a burst
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.max_rate = rate
+        self.min_rate = rate / 64
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.successes = 0
+        self.slowed_at = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Blocks until a request may be issued"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def slow_down(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if now - self.slowed_at >= 1:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.slowed_at = now
+            self.tokens = 0
+            self.successes = 0
+
+    def speed_up(self) -> None:
+        with self.lock:
+            self.successes += 1
+            if self.successes >= 10:
+                self.rate = min(self.max_rate, self.rate * 1.1)
+                self.successes = 0
+
+class EmbeddingScheduler(Embeddings):
+    """Splits document embedding into batches issued concurrently under a TokenBucket.
+    Batches that fail with a 429 back off exponentially and are retried. With a cache, only
+    uncached texts are scheduled and every finished batch is stored right away, so a failure
+    late in the run does not throw away the batches that already succeeded.
+
+    Args:
+    embeddings: the embedding function requests are sent to
+    cache: optional CachedEmbeddings consulted before scheduling
+    batch_size: number of texts per embedding request
+    concurrency: number of requests in flight at once
+    requests_per_minute: upper bound on the request rate
+    dimension: Matryoshka dimension vectors are truncated to, the cache keeps them whole
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: CachedEmbeddings | None = None, batch_size: int | None = None, concurrency: int | None = None, requests_per_minute: float | None = None, dimension: int | None = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.dimension = dimension
+        self.batch_size = batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+        self.concurrency = concurrency or int(os.getenv("EMBEDDING_CONCURRENCY", DEFAULT_CONCURRENCY))
+        requests_per_minute = requests_per_minute or float(os.getenv("EMBEDDING_RPM", DEFAULT_REQUESTS_PER_MINUTE))
+        self.bucket = TokenBucket(requests_per_minute / 60, self.concurrency)
+        self.chunks = 0
+        self.seconds = 0.0
+        self.rate_limited = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        start = time.perf_counter()
+        keys = [CachedEmbeddings.text_hash(text) for text in texts]
+        vectors = self.cache.get(keys) if self.cache else {}
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        items = list(missing.items())
+        batches = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+
+        if self.concurrency > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                results = list(pool.map(self.run_batch, batches))
+        else:
+            results = [self.run_batch(batch) for batch in batches]
+        for result in results:
+            vectors.update(result)
+
+        self.seconds += time.perf_counter() - start
+        self.chunks += len(texts)
+        return [truncate(vectors[key], self.dimension) for key in keys]
+
+    def run_batch(self, batch: list[tuple[str, str]]) -> dict[str, list[float]]:
+        """Embeds a batch of (chunk hash, text) pairs and caches the result"""
+        result = dict(zip([key for key, _ in batch], self.embed_batch([text for _, text in batch])))
+        if self.cache:
+            self.cache.store(result)
+        return result
+
+    def embed_batch(self, batch: list[str]) -> list[list[float]]:
+        """Embeds one batch, retrying with exponential backoff while the endpoint is rate limiting"""
+        for attempt in range(MAX_RETRIES + 1):
+            self.bucket.acquire()
+            try:
+                vectors = self.embeddings.embed_documents(batch)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == MAX_RETRIES:
+                    raise
+                self.rate_limited += 1
+                self.bucket.slow_down()
+                time.sleep(min(60, 2 ** attempt) + random.random())
+            else:
+                self.bucket.speed_up()
+                return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        if self.cache:
+            vector = self.cache.get_query(text)
+            if vector is not None:
+                return truncate(vector, self.dimension)
+        self.bucket.acquire()
+        vector = self.embeddings.embed_query(text)
+        if self.cache:
+            self.cache.store_query(text, vector)
+        return truncate(vector, self.dimension)
+
+    def stats(self) -> str:
+        throughput = self.chunks / self.seconds if self.seconds else 0
+        return f"{self.chunks} chunks in {self.seconds:.1f}s ({throughput:.1f} chunks/s), {self.rate_limited} rate limited requests"
@@ -0,0 +1,123 @@
+#Search filters on chunk metadata, translated to Milvus boolean expressions and SQLite conditions
+from datetime import datetime, timedelta
+import json
+import re
+
+FILTER_FIELDS = ("language", "content_type", "path", "indexed_after")
+
+CONTENT_TYPES = ("code", "text")
+
+# Relative times accepted by indexed_after, e.g. 2d or 12h
+RELATIVE_TIME = re.compile(r"^(\d+)([dhm])$")
+TIME_UNITS = {"d": "days", "h": "hours", "m": "minutes"}
+
+def split_values(values: str | list[str] | None) -> list[str]:
+    """Values given as a list or comma separated, e.g. "python,go" """
+    if not values:
+        return []
+    if isinstance(values, str):
+        values = [values]
+    return sorted({value.strip().lower() for item in values for value in item.split(",") if value.strip()})
+
+def parse_time(value: str) -> str:
+    """ISO timestamp of an ISO date or datetime, or of a time relative to now like 2d, 12h or 30m"""
+    match = RELATIVE_TIME.match(value.strip())
+    if match:
+        return (datetime.now() - timedelta(**{TIME_UNITS[match[2]]: int(match[1])})).isoformat()
+    try:
+        return datetime.fromisoformat(value.strip()).isoformat()
+    except ValueError:
+        raise ValueError(f"Expected an ISO date (2024-05-01), datetime or a relative time (2d, 12h, 30m), got {value!r}")
+
+def make_filters(language: str | list[str] | None = None, content_type: str | None = None, path: str | None = None, indexed_after: str | None = None) -> dict:
+    """Validated search filters, empty when nothing is filtered.
+
+    Args:
+        language: languages of the chunks, e.g. "python" or ["python", "go"].
+        content_type: "code" or "text".
+        path: path prefix (src/perpetua/agent) or glob (src/**/*.py) relative to the project root.
+        indexed_after: only chunks indexed after this time.
+
+    Raises ValueError for invalid values.
+    """
+    filters = {}
+    if languages := split_values(language):
+        filters["language"] = languages
+    if content_type:
+        content_type = content_type.strip().lower()
+        if content_type not in CONTENT_TYPES:
+            raise ValueError(f"Unknown content type {content_type}, expected one of {', '.join(CONTENT_TYPES)}")
+        filters["content_type"] = content_type
+    if path and path.strip().strip("/") not in ("", "."):
+        if "[" in path:
+            raise ValueError("Path globs support * and ? only")
+        filters["path"] = path.strip()
+    if indexed_after:
+        filters["indexed_after"] = parse_time(indexed_after)
+    return filters
+
+def filters_key(filters: dict | None) -> tuple:
+    """Hashable form of filters, for the result cache"""
+    return tuple((field, tuple(value) if isinstance(value, list) else value) for field, value in sorted((filters or {}).items()))
+
+def resolve_path(path: str, root: str) -> tuple[str, bool]:
+    """Absolute path pattern of a path filter, and whether it is a glob. Chunk sources are absolute paths."""
+    path = path.strip()
+    if path.startswith("./"):
+        path = path[2:]
+    # * already crosses directories, src/**/*.py also matches files directly in src
+    path = re.sub(r"\*+", "*", path.replace("**/", "*"))
+    is_glob = "*" in path or "?" in path
+    absolute = path if path.startswith("/") else root.rstrip("/") + "/" + path
+    return absolute, is_glob
+
+def to_like_pattern(path: str, is_glob: bool) -> str:
+    """LIKE pattern of a path prefix or glob, % and _ in the path are matched literally"""
+    escaped = path.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    if is_glob:
+        return escaped.replace("*", "%").replace("?", "_")
+    return escaped.rstrip("/") + "%"
+
+def to_glob_pattern(path: str, is_glob: bool) -> str:
+    """SQLite GLOB pattern of a path prefix or glob. Unlike LIKE, GLOB is case sensitive like Milvus' like."""
+    if is_glob:
+        return path
+    return re.sub(r"([*?\[])", r"[\1]", path.rstrip("/")) + "*"
+
+def to_milvus_expr(filters: dict | None, root: str) -> str | None:
+    """Milvus boolean expression selecting the filtered chunks, None without filters.
+    Milvus evaluates it during the index scan, and a language filter only visits the partitions
+    of those languages when the collection is partitioned by language."""
+    if not filters:
+        return None
+    conditions = []
+    if "language" in filters:
+        conditions.append(f"language in {json.dumps(filters['language'])}")
+    if "content_type" in filters:
+        conditions.append(f"content_type == {json.dumps(filters['content_type'])}")
+    if "path" in filters:
+        conditions.append(f"source like {json.dumps(to_like_pattern(*resolve_path(filters['path'], root)))}")
+    if "indexed_after" in filters:
+        conditions.append(f"indexed_at >= {json.dumps(filters['indexed_after'])}")
+    return " and ".join(conditions)
+
+def to_sql_condition(filters: dict | None, root: str) -> tuple[str, list]:
+    """SQL condition on the chunks_fts columns selecting the filtered chunks, and its parameters.
+    The full-text index does not record when each chunk was indexed, indexed_after selects chunks
+    of the files indexed since."""
+    if not filters:
+        return "", []
+    conditions, params = [], []
+    if "language" in filters:
+        conditions.append(f"language IN ({', '.join('?' * len(filters['language']))})")
+        params.extend(filters["language"])
+    if "content_type" in filters:
+        conditions.append("content_type = ?")
+        params.append(filters["content_type"])
+    if "path" in filters:
+        conditions.append("source GLOB ?")
+        params.append(to_glob_pattern(*resolve_path(filters["path"], root)))
+    if "indexed_after" in filters:
+        conditions.append("source IN (SELECT filepath FROM docs WHERE last_indexed >= ?)")
+        params.append(filters["indexed_after"])
+    return " AND ".join(conditions), params
@@ -0,0 +1,184 @@
+#Lexical (SQLite FTS5) and hybrid retrieval over the indexed chunks
+from langchain_core.documents import Document
+
+from .embedding_cache import normalize_query
+from .embedding_providers import get_provider
+from .compression import exact_scores
+from .filters import filters_key, to_milvus_expr, to_sql_condition
+from ..setup_db import pooled_connection
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import re
+import sqlite3
+import threading
+
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+
+# Constant of reciprocal rank fusion, damps the weight of the very first ranks
+RRF_K = 60
+
+# Each search contributes this many candidates per requested result to the fusion
+CANDIDATES_PER_RESULT = 2
+
+# Results of recent searches, keyed by (normalized query, k, mode, database, index generation, embedding model, filters)
+RESULT_CACHE_SIZE = 128
+_results: OrderedDict = OrderedDict()
+_results_lock = threading.Lock()
+
+def get_generation(conn: sqlite3.Connection) -> int:
+    """Generation of an index, bumped by every write to it"""
+    try:
+        row = conn.execute("SELECT value FROM index_state WHERE key = 'generation'").fetchone()
+    except sqlite3.OperationalError:
+        # index created before generations were recorded
+        return 0
+    return row[0] if row else 0
+
+def get_cached_results(key: tuple) -> list[Document] | None:
+    with _results_lock:
+        if key not in _results:
+            return None
+        _results.move_to_end(key)
+        return list(_results[key])
+
+def cache_results(key: tuple, docs: list[Document]) -> None:
+    with _results_lock:
+        _results[key] = list(docs)
+        _results.move_to_end(key)
+        while len(_results) > RESULT_CACHE_SIZE:
+            _results.popitem(last=False)
+
+def to_match_query(query: str) -> str:
+    """FTS5 query matching any term of a free text query.
+    Terms are quoted so punctuation and FTS5 keywords are searched as text, an identifier like `get_file_hash`
+    becomes the phrase "get file hash" and still matches it exactly."""
+    terms = re.findall(r"\w+", query)
+    return " OR ".join(f'"{term}"' for term in terms)
+
+def lexical_search(conn: sqlite3.Connection, query: str, k: int = 4, filters: dict | None = None, root: str = "") -> list[Document]:
+    """BM25 search of the chunks full-text index. Needs no embedding and no vector store.
+    Filters (see filters.make_filters) are applied by SQLite to the matching rows, root being the project root.
+
+    Raises sqlite3.OperationalError when the index has no chunks_fts table yet.
+    """
+    match = to_match_query(query)
+    if not match:
+        return []
+    condition, params = to_sql_condition(filters, root)
+    rows = conn.execute(
+        "SELECT text, id, source, content_type, language FROM chunks_fts WHERE chunks_fts MATCH ?"
+        + (f" AND {condition}" if condition else "") + " ORDER BY rank LIMIT ?",
+        (match, *params, k),
+    ).fetchall()
+    return [
+        Document(
+            page_content=text,
+            metadata={"uuid": id, "source": source, "content_type": content_type, "language": language},
+        )
+        for text, id, source, content_type, language in rows
+    ]
+
+def get_doc_key(doc: Document) -> str:
+    return doc.metadata.get("uuid") or doc.metadata.get("id") or doc.page_content
+
+def reciprocal_rank_fusion(rankings: list[list[Document]], k: int, rrf_k: int = RRF_K) -> list[Document]:
+    """Merges ranked lists, scoring each chunk by the sum of 1 / (rrf_k + rank) over the lists it appears in"""
+    scores, docs = {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, 1):
+            key = get_doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)[:k]]
+
+def vector_search(vector_store, query: str, k: int = 4, rescore: int = 1, metric_type: str = "L2", expr: str | None = None) -> list[Document]:
+    """Similarity search of a langchain Milvus store, restricted to the chunks matching the Milvus expression expr.
+    With rescore > 1, k * rescore candidates are fetched from the (quantized) index and ranked again
+    by their exact similarity to the query, computed on the stored float vectors."""
+    if rescore <= 1:
+        return vector_store.similarity_search(query, k=k, expr=expr)
+    query_vector = vector_store.embedding_func.embed_query(query)
+    docs = vector_store.similarity_search_by_vector(query_vector, k=k * rescore, expr=expr)
+    ids = [doc.metadata.get("uuid") or doc.metadata.get(vector_store._primary_field) for doc in docs]
+    rows = vector_store.client.get(
+        vector_store.collection_name, ids=ids, output_fields=[vector_store._primary_field, vector_store._vector_field]
+    )
+    vectors = {row[vector_store._primary_field]: row[vector_store._vector_field] for row in rows}
+    docs = [(doc, vectors[id]) for doc, id in zip(docs, ids) if id in vectors]
+    scores = exact_scores(query_vector, [vector for _, vector in docs], metric_type)
+    ranked = sorted(zip(scores, range(len(docs))), reverse=True)[:k]
+    return [docs[i][0] for _, i in ranked]
+
+def hybrid_search(vector_store, sql_URI: str, query: str, k: int = 4, rescore: int = 1, metric_type: str = "L2", filters: dict | None = None) -> list[Document]:
+    """Runs the vector and lexical searches concurrently and fuses their rankings.
+    Both searches apply the filters themselves, so every candidate fused matches them."""
+    candidates = k * CANDIDATES_PER_RESULT
+    root = get_project_root(sql_URI)
+
+    def lexical():
+        with pooled_connection(sql_URI) as conn:
+            try:
+                return lexical_search(conn, query, candidates, filters, root)
+            except sqlite3.OperationalError:
+                return []
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        lexical_docs = pool.submit(lexical)
+        vector_docs = vector_search(vector_store, query, candidates, rescore, metric_type, to_milvus_expr(filters, root))
+        return reciprocal_rank_fusion([vector_docs, lexical_docs.result()], k)
+
+def get_project_root(sql_URI: str) -> str:
+    """Root of the project whose .rag directory holds the database, path filters are relative to it"""
+    return os.path.dirname(os.path.dirname(os.path.abspath(sql_URI)))
+
+def search(query: str, vs_URI: str, sql_URI: str, k: int = 4, mode: str = "hybrid", filters: dict | None = None) -> list[Document]:
+    """Searches the index of a project.
+    Results are cached per index generation: a repeated query is answered without embedding it or opening
+    the vector store, and any write to the index makes the cached results unreachable.
+
+    Args:
+        query (str): the text to search for.
+        vs_URI (str): the Milvus Lite database.
+        sql_URI (str): the SQLite database.
+        k (int): number of chunks returned.
+        mode (str): "hybrid" fuses vector and lexical results, "vector" only uses embeddings and
+            "lexical" only uses the full-text index, without embedding the query or opening the vector store.
+        filters (dict): restricts the results to chunks matching filters.make_filters(...).
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode}, expected one of {', '.join(SEARCH_MODES)}")
+    with pooled_connection(sql_URI) as conn:
+        # vector results depend on the embedding model, a query with another model must reach the model check
+        key = (
+            normalize_query(query), k, mode, sql_URI, get_generation(conn),
+            None if mode == "lexical" else get_provider(), filters_key(filters),
+        )
+        docs = get_cached_results(key)
+        if docs is not None:
+            return docs
+        if mode == "lexical":
+            docs = lexical_search(conn, query, k, filters, get_project_root(sql_URI))
+            cache_results(key, docs)
+            return docs
+
+    from .document_processing import RAGStore
+
+    # opened per call and released after, so `perpetua watch` can keep updating the index meanwhile,
+    # unless this process already holds it open (the daemon)
+    store = RAGStore._instances.get((vs_URI, sql_URI))
+    owned = store is None
+    if owned:
+        store = RAGStore.open(vs_URI, sql_URI)
+    try:
+        rescore, metric_type = store.config["search"]["rescore"], store.config["index"]["metric_type"]
+        if mode == "vector":
+            docs = vector_search(store.vector_store, query, k, rescore, metric_type, to_milvus_expr(filters, get_project_root(sql_URI)))
+        else:
+            docs = hybrid_search(store.vector_store, sql_URI, query, k, rescore, metric_type, filters)
+    finally:
+        if owned:
+            store.release()
+    cache_results(key, docs)
+    return docs
@@ -0,0 +1,151 @@
+#Extraction and lookup of the definitions (functions, classes, methods...) found in source files
+import sqlite3
+
+# tree-sitter-languages grammar for each file extension
+SYMBOL_LANGUAGES = {
+    ".py": "python", ".js": "javascript", ".jsx": "javascript", ".ts": "typescript", ".tsx": "tsx",
+    ".java": "java", ".c": "c", ".h": "cpp", ".cpp": "cpp", ".cc": "cpp", ".cxx": "cpp", ".hpp": "cpp",
+    ".cs": "c_sharp", ".go": "go", ".rs": "rust", ".rb": "ruby", ".php": "php", ".kt": "kotlin",
+    ".scala": "scala", ".lua": "lua",
+}
+
+# Syntax nodes that define a function, across grammars
+FUNCTION_NODES = {
+    "function_definition", "function_declaration", "function_item", "method_declaration", "method_definition",
+    "constructor_declaration", "method", "singleton_method", "function_definition_statement",
+    "local_function_definition_statement",
+}
+
+# Syntax nodes that define a type and may contain methods, with the kind they are stored as
+TYPE_NODES = {
+    "class_definition": "class", "class_declaration": "class", "class_specifier": "class", "class": "class",
+    "object_definition": "class", "struct_specifier": "struct", "struct_item": "struct", "enum_item": "enum",
+    "enum_declaration": "enum", "interface_declaration": "interface", "trait_item": "trait",
+    "trait_definition": "trait", "trait_declaration": "trait", "module": "module", "type_spec": "type",
+}
+
+# Nodes that give methods a parent without being a definition themselves (rust `impl Foo`), and the field naming it
+CONTAINER_NODES = {"impl_item": "type"}
+
+NAME_NODES = {"identifier", "type_identifier", "field_identifier", "simple_identifier", "constant", "name", "property_identifier"}
+
+# A tree-sitter parser per grammar, built on first use in each process
+_parsers = {}
+
+def get_symbol_parser(language: str):
+    """tree-sitter parser for a grammar, or None if tree-sitter-languages does not have it"""
+    if language not in _parsers:
+        try:
+            from tree_sitter_languages import get_parser
+            _parsers[language] = get_parser(language)
+        except Exception:
+            # ImportError, or a grammar missing from the installed tree-sitter-languages
+            _parsers[language] = None
+    return _parsers[language]
+
+def get_name(node) -> str | None:
+    """Name of a definition node, following C/C++ declarators down to the identifier"""
+    name = node.child_by_field_name("name")
+    if name is None:
+        declarator = node.child_by_field_name("declarator")
+        while declarator is not None and declarator.type not in NAME_NODES and declarator.type not in ("qualified_identifier", "destructor_name", "operator_name"):
+            declarator = declarator.child_by_field_name("declarator")
+        name = declarator
+    if name is None:
+        # grammars like kotlin's do not use a name field
+        name = next((child for child in node.named_children if child.type in NAME_NODES), None)
+    return name.text.decode("utf-8", "replace") if name is not None else None
+
+def extract_symbols(suffix: str, data: bytes) -> list[tuple[str, str, str, str | None, int, int]]:
+    """Finds the definitions in a source file.
+
+    Args:
+        suffix (str): the file extension, picks the grammar.
+        data (bytes): the file's content.
+
+    Returns:
+        (name, qualified name, kind, parent, start line, end line) for each definition, lines starting at 1.
+        Empty for languages without a grammar.
+    """
+    language = SYMBOL_LANGUAGES.get(suffix)
+    parser = get_symbol_parser(language) if language else None
+    if parser is None:
+        return []
+
+    symbols = []
+    # (node, qualified name of the enclosing definition, whether that definition is a type)
+    stack = [(parser.parse(data).root_node, None, False)]
+    while stack:
+        node, scope, in_type = stack.pop()
+        child_scope, child_in_type = scope, in_type
+        if node.type in FUNCTION_NODES or node.type in TYPE_NODES:
+            name = get_name(node)
+            # `struct foo x;` mentions a struct without defining it
+            is_definition = node.type not in ("struct_specifier", "class_specifier") or node.child_by_field_name("body") is not None
+            if name and is_definition:
+                parent = scope
+                for separator in ("::", "."):
+                    # out of line definitions: `void A::m() {}` in C++, `function M.h() end` in lua
+                    if separator in name:
+                        owner, name = name.rsplit(separator, 1)
+                        parent = f"{scope}.{owner}" if scope else owner
+                receiver = node.child_by_field_name("receiver")
+                if receiver is not None:
+                    # go methods are declared outside of their type
+                    parent = next((n.text.decode("utf-8", "replace") for n in walk(receiver) if n.type == "type_identifier"), parent)
+                if node.type in TYPE_NODES:
+                    kind = TYPE_NODES[node.type]
+                else:
+                    kind = "method" if parent and (in_type or parent != scope) else "function"
+                qualified_name = f"{parent}.{name}" if parent else name
+                symbols.append((name, qualified_name, kind, parent, node.start_point[0] + 1, node.end_point[0] + 1))
+                child_scope, child_in_type = qualified_name, node.type in TYPE_NODES
+        elif node.type in CONTAINER_NODES:
+            container = node.child_by_field_name(CONTAINER_NODES[node.type])
+            if container is not None:
+                child_scope = container.text.decode("utf-8", "replace")
+                child_in_type = True
+        stack.extend((child, child_scope, child_in_type) for child in reversed(node.named_children))
+    return symbols
+
+def walk(node):
+    """Yields a node and all of its named descendants"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.named_children))
+
+def lookup_symbols(conn: sqlite3.Connection, name: str, limit: int = 20) -> list[tuple]:
+    """Definitions named `name`, or ending with it when it is qualified (`Parent.name`).
+    Matches with the same case are preferred, other matches are only returned when there are none.
+
+    Returns:
+        (qualified name, kind, file path, start line, end line) rows.
+    """
+    # name is indexed case-insensitively, the rest of the match is done on the few rows it selects
+    rows = conn.execute(
+        "SELECT qualified_name, kind, filepath, start_line, end_line FROM symbols WHERE name = ? ORDER BY filepath, start_line",
+        (name.rsplit(".", 1)[-1],),
+    ).fetchall()
+    matches = lambda qualified_name, name: qualified_name == name or qualified_name.endswith("." + name)
+    exact = [row for row in rows if matches(row[0], name)]
+    if not exact:
+        exact = [row for row in rows if matches(row[0].lower(), name.lower())]
+    return exact[:limit]
+
+def format_symbols(rows: list[tuple], max_lines: int = 80) -> str:
+    """Formats lookup_symbols rows with the source code of each definition, cut after max_lines lines"""
+    blocks = []
+    for qualified_name, kind, file_path, start_line, end_line in rows:
+        header = f"{kind} {qualified_name} ({file_path}:{start_line}-{end_line})"
+        try:
+            with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+                lines = f.read().splitlines()[start_line - 1:min(end_line, start_line + max_lines - 1)]
+        except OSError:
+            blocks.append(header + "\n(file is no longer on disk)")
+            continue
+        if end_line - start_line + 1 > max_lines:
+            lines.append(f"... {end_line - start_line + 1 - max_lines} more lines")
+        blocks.append(header + "\n" + "\n".join(lines))
+    return "\n\n".join(blocks)
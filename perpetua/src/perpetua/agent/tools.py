@@ -4,22 +4,27 @@ from ..repo_graph import RepoGraph
 
 load_env()
 
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from .document_processing import RAGStore
+from .retrieval import search, SEARCH_MODES
+from .embedding_providers import EmbeddingModelMismatch
+from .filters import make_filters
+from .symbols import lookup_symbols, format_symbols
+from ..setup_db import pooled_connection
 
 from langchain.tools import tool
 
-from langchain_ollama import ChatOllama
-
 from langchain_tavily import TavilySearch
 
 import os
+import sqlite3
 
 from pydantic import BaseModel, Field
 
 local = os.getenv('LOCAL') == "True"
 
+# only the client of the configured provider is imported
 if not local:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
     llm = ChatGoogleGenerativeAI(
         model="gemini-2.5-flash",
         temperature=0,
@@ -35,9 +40,9 @@ if not local:
         timeout=None,
         max_retries=2
     )
-
-    #embeddings = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001")
 else:
+    from langchain_ollama import ChatOllama
+
     llm = ChatOllama(
         model=os.getenv('LOCAL_MODEL'),
         temperature=0,
@@ -45,23 +50,13 @@ else:
 
     summarizer = llm
 
-    #local based emebdding function 
-    
 tavily_search = TavilySearch(max_results=3)
 
 class SearchQuery(BaseModel):
     search_query: str = Field(None, description="Search query for retrieval.")
 
-_ragstore_cache = {}
-
-def get_ragstore(vector_db_path: str, relational_db_path: str,):
-    if not relational_db_path in _ragstore_cache:
-        doc_processor = RAGStore(vector_db_path, relational_db_path)
-        _ragstore_cache[relational_db_path] = doc_processor
-    return _ragstore_cache[relational_db_path]
-
 @tool(response_format="content_and_artifact")
-def retrieve_context(query: str, vector_db_path: str = "", relational_db_path: str = "") -> tuple[str, list]:
+def retrieve_context(query: str, mode: str = "hybrid", language: str = "", content_type: str = "", path: str = "", indexed_after: str = "", vector_db_path: str = "", relational_db_path: str = "") -> tuple[str, list]:
     """Retrieve relevant context from the vector store based on a query.
     
     This is the PRIMARY tool you should use to answer questions about the codebase.
@@ -70,20 +65,63 @@ def retrieve_context(query: str, vector_db_path: str = "", relational_db_path: s
     
     Args:
         query: The search query to find relevant documents. Use specific keywords related to what the user is asking about.
+        mode: "hybrid" (default) combines semantic and keyword search. Use "lexical" to find exact identifiers,
+            error messages or configuration keys, "vector" for purely conceptual questions.
+        language: Optional. Only search chunks in these languages, comma separated, e.g. "python" or "python,go".
+            Use it when the question is about code in a specific language, so documentation does not crowd out the code.
+        content_type: Optional. "code" for source code only, "text" for documentation only.
+        path: Optional. Only search files under this directory or matching this glob, relative to the project root,
+            e.g. "src/perpetua/agent" or "tests/*.py".
+        indexed_after: Optional. Only search chunks indexed after an ISO date, or a relative time like "2d" or "12h",
+            e.g. to see recently changed code.
         vector_db_path: (Automatically handled - pass empty string)
         relational_db_path: (Automatically handled - pass empty string)
         
     Returns:
         A tuple containing (serialized_string, retrieved_documents).
     """
-    doc_processor = get_ragstore(vector_db_path, relational_db_path)
-    retrieved_docs = doc_processor.vector_store.similarity_search(query, k=10)
+    if mode not in SEARCH_MODES:
+        mode = "hybrid"
+    try:
+        filters = make_filters(language, content_type, path, indexed_after)
+    except ValueError as e:
+        return f"Invalid filter: {e}", []
+    try:
+        retrieved_docs = search(query, vector_db_path, relational_db_path, k=10, mode=mode, filters=filters)
+    except EmbeddingModelMismatch as e:
+        return f"{e} Only mode=\"lexical\" can be used until then.", []
     serialized = "\n\n".join(
-        (f"Source: {doc.metadata.get("source", "?")}\nContent: {doc.page_content}")
+        (f"Source: {doc.metadata.get('source', '?')}\nContent: {doc.page_content}")
         for doc in retrieved_docs
     )
     return serialized, retrieved_docs
 
+@tool(response_format="content")
+def lookup_symbol(name: str, relational_db_path: str = "") -> str:
+    """Find where a function, class, method or other definition is defined, by its exact name.
+
+    Use this tool instead of retrieve_context when the user names a specific symbol,
+    e.g. "what does RAGStore.add_documents do?" or "where is parse_config defined?".
+    It returns the file, the line range and the source code of every definition with that name.
+    The relational_db_path parameter is automatically handled - you can pass an empty string for it.
+
+    Args:
+        name: The symbol name, optionally qualified with its class, e.g. "add_documents" or "RAGStore.add_documents".
+        relational_db_path: (Automatically handled - pass empty string)
+
+    Returns:
+        The matching definitions with their source code.
+    """
+    with pooled_connection(relational_db_path) as conn:
+        try:
+            rows = lookup_symbols(conn, name)
+        except sqlite3.OperationalError:
+            # indexes built before the symbols table existed
+            return "No symbols recorded yet. Re-index with `perpetua symbols --rebuild` to build symbols, or use retrieve_context instead."
+    if not rows:
+        return f"No definition named {name} in the index. Try retrieve_context instead."
+    return format_symbols(rows)
+
 @tool(response_format="content")
 def search_web(search_terms: str):
     """ Searches the web for additional information """
@@ -117,13 +155,13 @@ def retrieve_repo_graph():
         A formatted string representation of the repository structure.
     """
     rag_dir = find_rag_directory(os.getcwd()) + "/.rag/"
-    graph_json = rag_dir + "repo-graph-lock.json"
-    repo_graph = RepoGraph.load_graph(graph_json).to_tree()
+    # rendered when the graph was saved by init, commit, sync or watch
+    repo_graph = RepoGraph.read_tree(rag_dir)
     
     return repo_graph
 
 
-TOOLS = [retrieve_context, search_web, retrieve_repo_graph]
+TOOLS = [retrieve_context, lookup_symbol, search_web, retrieve_repo_graph]
 TOOLS_BY_NAME = {tool.name : tool for tool in TOOLS}
 
 model_with_tools = llm.bind_tools(TOOLS)
\ No newline at end of file
@@ -0,0 +1,196 @@
+#Milvus vector index settings: rebuilding the index of a project and benchmarking candidate settings on its vectors
+import numpy as np
+from pymilvus import MilvusClient, DataType
+
+import os
+import shutil
+import tempfile
+import time
+
+from ..project_config import describe, parse_params
+from .compression import index_memory
+
+# Candidates benchmarked when none are given, as `INDEX_TYPE[:build params[:search params]]`
+DEFAULT_CANDIDATES = [
+    "FLAT",
+    "IVF_FLAT:nlist=128:nprobe=8",
+    "IVF_FLAT:nlist=128:nprobe=16",
+    "IVF_FLAT:nlist=128:nprobe=32",
+    "IVF_SQ8:nlist=128:nprobe=16",
+    "HNSW:M=16,efConstruction=200:ef=32",
+    "HNSW:M=16,efConstruction=200:ef=64",
+    "HNSW:M=16,efConstruction=200:ef=128",
+    "IVF_SQ8:nlist=128:nprobe=16,rescore=4",
+]
+
+# Rows inserted per request when loading the benchmark collections
+INSERT_BATCH = 1000
+
+def parse_candidate(spec: str, metric_type: str) -> dict:
+    """Project config for a candidate written `INDEX_TYPE[:name=value,...[:name=value,...]]`,
+    the first parameter list being the build params and the second the search params."""
+    parts = spec.split(":")
+    if len(parts) > 3 or not parts[0]:
+        raise ValueError(f"Expected INDEX_TYPE[:build params[:search params]], got {spec!r}")
+    build = parse_params([p for p in parts[1].split(",") if p]) if len(parts) > 1 else {}
+    search = parse_params([p for p in parts[2].split(",") if p]) if len(parts) > 2 else {}
+    return {
+        "index": {"index_type": parts[0].upper(), "metric_type": metric_type, "params": build},
+        "search": {"params": search, "rescore": search.pop("rescore", 1)},
+    }
+
+def rebuild_index(vector_store, config: dict) -> None:
+    """Replaces the index of a langchain Milvus store's collection with the configured one.
+    Vectors are kept, only the index over them is built again."""
+    client, collection, field = vector_store.client, vector_store.collection_name, vector_store._vector_field
+    vector_store.index_params = config["index"]
+    vector_store.search_params = {"metric_type": config["index"]["metric_type"], "params": dict(config["search"]["params"])}
+    if vector_store.col is None:
+        # created with the new settings on the first commit
+        return
+    client.release_collection(collection)
+    client.drop_index(collection, field)
+    index_params = client.prepare_index_params()
+    index_params.add_index(field_name=field, **config["index"])
+    client.create_index(collection, index_params)
+    client.load_collection(collection)
+
+def sample_vectors(vector_store, limit: int) -> np.ndarray:
+    """Up to limit vectors stored in a langchain Milvus store"""
+    if vector_store.col is None:
+        return np.empty((0, 0), dtype="float32")
+    field = vector_store._vector_field
+    iterator = vector_store.client.query_iterator(
+        vector_store.collection_name, batch_size=min(limit, INSERT_BATCH), limit=limit, filter="", output_fields=[field]
+    )
+    vectors = []
+    try:
+        while batch := iterator.next():
+            vectors.extend(row[field] for row in batch)
+    finally:
+        iterator.close()
+    return np.asarray(vectors, dtype="float32")
+
+def truncate_vectors(vectors: np.ndarray, dimension: int | None) -> np.ndarray:
+    """Matryoshka truncation of a matrix of vectors, rows scaled back to unit length"""
+    if not dimension or dimension >= vectors.shape[1]:
+        return vectors
+    head = vectors[:, :dimension]
+    return (head / np.maximum(np.linalg.norm(head, axis=1, keepdims=True), 1e-12)).astype("float32")
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def exact_neighbors(base: np.ndarray, queries: np.ndarray, metric_type: str, k: int) -> np.ndarray:
+    """Indices in base of the k nearest neighbors of each query, by exhaustive search"""
+    if metric_type == "COSINE":
+        base = base / np.maximum(np.linalg.norm(base, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    if metric_type == "L2":
+        # |q - b|^2 without the |q|^2 term, which does not change the ranking of a query
+        scores = 2 * queries @ base.T - (base * base).sum(axis=1)
+    else:
+        scores = queries @ base.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+def run_candidate(client: MilvusClient, name: str, base: np.ndarray, queries: np.ndarray, truth: np.ndarray, config: dict, k: int, data_dir: str) -> dict:
+    """Loads base into a fresh collection indexed as configured and times k nearest neighbor searches.
+    Candidates with a rescore factor fetch k * rescore neighbors and rank them again by exact similarity, like search does.
+
+    Returns: the recall@k against exact search, the p50 and p99 query latency in milliseconds,
+        the seconds taken to insert and index the vectors, the growth of data_dir in MB and the
+        MB of vector components held by the index.
+    """
+    rescore = config["search"].get("rescore", 1)
+    metric_type = config["index"]["metric_type"]
+    disk_before = directory_size(data_dir)
+    schema = client.create_schema(auto_id=False)
+    schema.add_field("id", DataType.INT64, is_primary=True)
+    schema.add_field("vector", DataType.FLOAT_VECTOR, dim=base.shape[1])
+    index_params = client.prepare_index_params()
+    index_params.add_index(field_name="vector", **config["index"])
+    client.create_collection(name, schema=schema, index_params=index_params)
+    try:
+        start = time.perf_counter()
+        for i in range(0, len(base), INSERT_BATCH):
+            client.insert(name, [{"id": j, "vector": base[j].tolist()} for j in range(i, min(i + INSERT_BATCH, len(base)))])
+        client.flush(name)
+        client.load_collection(name)
+        build_seconds = time.perf_counter() - start
+        disk_bytes = directory_size(data_dir) - disk_before
+
+        search_params = {"metric_type": config["index"]["metric_type"], "params": dict(config["search"]["params"])}
+        # first search may finish loading the index
+        client.search(name, [queries[0].tolist()], limit=k, search_params=search_params, output_fields=[])
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            result = client.search(name, [query.tolist()], limit=k * rescore, search_params=search_params, output_fields=[])
+            found = [hit["id"] for hit in result[0]]
+            if rescore > 1:
+                found = [found[i] for i in exact_neighbors(base[found], query[None, :], metric_type, min(k, len(found)))[0]]
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(set(found) & set(expected.tolist()))
+    finally:
+        client.drop_collection(name)
+    return {
+        "recall": hits / (len(queries) * k),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "build_s": build_seconds,
+        "disk_mb": disk_bytes / (1024 * 1024),
+        "memory_mb": index_memory(len(base), base.shape[1], config["index"]["index_type"]) / (1024 * 1024),
+    }
+
+def benchmark(vectors: np.ndarray, candidates: list[dict], k: int = 10, queries: int = 200, on_result=None, dimensions: list[int | None] | None = None) -> list[tuple[dict, int, dict]]:
+    """Benchmarks index configs on a sample of a project's vectors.
+
+    The last `queries` vectors are held out as queries, the others are indexed by each candidate in a
+    temporary Milvus Lite database, so the project's own index is never touched.
+    Recall is always measured against exact search on the vectors as sampled, so candidates using
+    truncated dimensions are compared with the full precision baseline.
+
+    Args:
+        vectors (np.ndarray): the sampled vectors.
+        candidates (list[dict]): index configs, shaped like the project config.
+        k (int): number of neighbors searched for, recall is measured at k.
+        queries (int): number of held out query vectors.
+        on_result: called with (config, dimension, result) as each candidate finishes.
+        dimensions (list[int | None]): Matryoshka dimensions each candidate is run at, None for the sampled dimension.
+
+    Returns:
+        (config, dimension, result) for each candidate and dimension, see run_candidate.
+    """
+    queries = min(queries, len(vectors) // 2)
+    if queries < 1 or len(vectors) - queries < k:
+        raise ValueError(f"Not enough vectors to benchmark: {len(vectors)} stored, at least {k + 1} needed")
+    base, held_out = vectors[:-queries], vectors[-queries:]
+    truths = {}
+    results = []
+    tmp_dir = tempfile.mkdtemp(prefix="perpetua-bench-")
+    client = MilvusClient(os.path.join(tmp_dir, "benchmark.db"))
+    try:
+        for dimension in dimensions or [None]:
+            dimension = dimension if dimension and dimension < vectors.shape[1] else vectors.shape[1]
+            for i, config in enumerate(candidates):
+                metric_type = config["index"]["metric_type"]
+                if metric_type not in truths:
+                    truths[metric_type] = exact_neighbors(base, held_out, metric_type, k)
+                result = run_candidate(
+                    client, f"candidate_{dimension}_{i}", truncate_vectors(base, dimension), truncate_vectors(held_out, dimension),
+                    truths[metric_type], config, k, tmp_dir,
+                )
+                results.append((config, dimension, result))
+                if on_result:
+                    on_result(config, dimension, result)
+    finally:
+        client.close()
+        try:
+            from milvus_lite.server_manager import server_manager_instance
+            server_manager_instance.release_server(os.path.join(tmp_dir, "benchmark.db"))
+        except ImportError:
+            pass
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
@@ -10,6 +10,8 @@ import shutil
 
 from pathlib import Path
 
+from typing import Optional
+
 import re
 
 import uuid
@@ -48,19 +50,38 @@ def config():
         console.print(f"""[green]Created config file in {HOME_DIR + "/perpetua"}.""")
 
 @app.command()
-def init():
+def init(dimension: Optional[int] = None, quantization: str = "none"):
     """Initializes Perpetua project by creating .rag directory.
     
-    This is required to use Perpetua in a project.
+    This is required to use Perpetua in a project. The embedding model configured with `perpetua config` is recorded
+    in .rag/config.json, the project is searched and committed to with that model only.
+
+    Args:
+        dimension (int): stores embeddings truncated to this Matryoshka dimension (e.g. 768 or 1536 for gemini-embedding-001)
+            instead of the model's full dimension. Smaller indexes and faster searches, for some recall.
+        quantization (str): "int8" indexes vectors with 1 byte per component and ranks the top candidates again
+            with the float vectors, "none" keeps a float index.
     """
+    import copy
     from .setup_db import DBManager
+    from .project_config import DEFAULT_CONFIG, save_config
+    from .agent.compression import apply_storage_options
+    from .agent.embedding_providers import get_provider
     from .agent.document_processing import RAGStore
 
     current_directory = Path(os.getcwd())
+    try:
+        config = apply_storage_options(copy.deepcopy(DEFAULT_CONFIG), dimension, quantization)
+        # the index only answers queries embedded by the model it was built with
+        provider, model = get_provider()
+        config["embedding"].update(provider=provider, model=model)
+    except ValueError as e:
+        console.print(f"[red]{e}")
+        return
     try:
         with console.status("intializing..."):
             os.mkdir(current_directory / ".rag")
-            os.mkdir(current_directory / ".rag/staging")
+            save_config(str(current_directory / ".rag"), config)
             db = DBManager(current_directory / ".rag/database.db")
             db.create_doc_table()
             rag = RAGStore(
@@ -86,19 +107,13 @@ def init():
 @app.command()
 def ls():
     """ Lists all files currently tracked by the project """
-    from .agent.document_processing import RAGStore
+    from .setup_db import pooled_connection
+    from rich.table import Table
 
     rag_dir = find_rag_directory(os.getcwd()) + "/.rag/"
 
-    rag = RAGStore(
-        vs_URI=rag_dir + "milvus.db",
-        sql_URI=rag_dir + "database.db",
-    )
-
-    rag.curr.execute("SELECT * FROM docs")
-    result = rag.curr.fetchall()
-    
-    from rich.table import Table
+    with pooled_connection(rag_dir + "database.db") as conn:
+        result = conn.execute("SELECT * FROM docs").fetchall()
 
     table = Table(show_lines=True)
     table.add_column("id")
@@ -110,51 +125,224 @@ def ls():
     for row in result:
         table.add_row(*list[str](map(str, row)))
 
-    rag.close()
-
     console.print(table)
 
 @app.command()
-def search(query: str):
-    """Similarity search from the vector database directly
+def search(query: str, mode: str = "hybrid", k: int = 4, language: Optional[list[str]] = None, content_type: Optional[str] = None, path: Optional[str] = None, indexed_after: Optional[str] = None):
+    """Searches the index directly
     
     Args:
-        query (str): the query we want to search the vector DB directly.
+        query (str): the query we want to search the index with directly.
+        mode (str): "hybrid" fuses vector and full-text (BM25) results, "vector" only uses embeddings and
+            "lexical" only uses the full-text index, which works offline and embeds nothing.
+        k (int): number of chunks returned.
+        language (list[str]): only chunks in these languages, e.g. `--language python --language go`.
+        content_type (str): only "code" or "text" chunks.
+        path (str): only files under this path prefix, or matching this glob (e.g. "src/**/*.py"), relative to the project root.
+        indexed_after (str): only chunks indexed after an ISO date or datetime, or a relative time like 2d or 12h.
     
     """
-    from .agent.document_processing import RAGStore
+    from .agent.filters import make_filters
+    from . import daemon
 
     try:
         assert check_initialization(), "This is not a perpetua project! Please initialize this repo."
         rag_path = find_rag_directory(os.getcwd())
-        rag = RAGStore(
-            vs_URI=rag_path + "/.rag/milvus.db", 
-            sql_URI=rag_path + "/.rag/database.db"
-        )
-        console.print(list(map(lambda x : x.page_content, rag.vector_store.similarity_search(query))))
+        try:
+            filters = make_filters(language, content_type, path, indexed_after)
+        except ValueError as e:
+            console.print(f"[red]{e}")
+            return
+        try:
+            try:
+                # answered by `perpetua serve` when it runs, without loading the index in this process
+                docs = [doc["page_content"] for doc in daemon.request(rag_path, "search", query=query, k=k, mode=mode, filters=filters)]
+            except daemon.DaemonUnavailable:
+                from .agent.retrieval import search as search_index
+                docs = [doc.page_content for doc in search_index(query, rag_path + "/.rag/milvus.db", rag_path + "/.rag/database.db", k, mode, filters)]
+        except Exception as e:
+            # raised here, or by the daemon and reported by name
+            error_type = e.type if isinstance(e, daemon.DaemonError) else type(e).__name__
+            if error_type == "OperationalError":
+                console.print("[red]This index has no full-text index yet. Run a hybrid search or a commit once to build it.")
+                return
+            if error_type == "EmbeddingModelMismatch":
+                console.print(f"[red]{e} `--mode lexical` still works.")
+                return
+            raise
+        console.print(docs)
     except Exception as e:
         raise e
 
+@app.command()
+def symbols(name: str = typer.Argument(""), rebuild: bool = False):
+    """Looks up where a function, class or method is defined, by its exact name
+
+    Args:
+        name (str): the symbol, optionally qualified with its class e.g. `RAGStore.add_documents`.
+        rebuild (bool): extracts the symbols of every indexed file again, for indexes committed before symbols were recorded.
+
+    """
+    import sqlite3
+    from .agent.symbols import lookup_symbols
+    from .setup_db import pooled_connection
+
+    try:
+        assert check_initialization(), "This is not a perpetua project! Please initialize this repo."
+        rag_path = find_rag_directory(os.getcwd())
+        if rebuild:
+            from .agent.document_processing import RAGStore
+            rag = RAGStore.open(
+                vs_URI=rag_path + "/.rag/milvus.db",
+                sql_URI=rag_path + "/.rag/database.db"
+            )
+            console.print(f"[green]Recorded {rag.rebuild_symbols()} symbols.")
+            rag.close()
+        if not name:
+            return
+        with pooled_connection(rag_path + "/.rag/database.db") as conn:
+            try:
+                rows = lookup_symbols(conn, name)
+            except sqlite3.OperationalError:
+                console.print("[red]No symbols recorded yet. Run `perpetua symbols --rebuild` first.")
+                return
+        if not rows:
+            console.print(f"[yellow]No definition named {name}.")
+        for qualified_name, kind, file_path, start_line, end_line in rows:
+            console.print(f"{kind} [bold]{qualified_name}[/bold] {os.path.relpath(file_path, rag_path)}:{start_line}-{end_line}")
+    except Exception as e:
+        raise e
+
+
+@app.command()
+def index(index_type: Optional[str] = None, metric: Optional[str] = None, param: Optional[list[str]] = None, search_param: Optional[list[str]] = None):
+    """Shows or changes the vector index settings of the project, kept in .rag/config.json
+
+    Changing the index type, metric or build params rebuilds the index over the stored vectors, nothing is embedded again.
+    Search params (e.g. nprobe for IVF indexes, ef for HNSW) take effect on the next search.
+
+    Args:
+        index_type (str): Milvus index type, e.g. FLAT, IVF_FLAT, IVF_SQ8 or HNSW.
+        metric (str): L2, IP or COSINE.
+        param (list[str]): build params as name=value, e.g. `--param nlist=256` or `--param M=16`. Replaces the previous ones.
+        search_param (list[str]): search params as name=value, e.g. `--search-param nprobe=32`. Replaces the previous ones.
+    """
+    from .project_config import describe, load_config, save_config, parse_params
+
+    try:
+        assert check_initialization(), "This is not a perpetua project! Please initialize this repo."
+        rag_path = find_rag_directory(os.getcwd())
+        rag_dir = rag_path + "/.rag"
+        config = load_config(rag_dir)
+        old_index, old_search = dict(config["index"]), dict(config["search"])
+        if index_type:
+            config["index"]["index_type"] = index_type.upper()
+            if not param:
+                # build params rarely carry over between index types
+                config["index"]["params"] = {}
+        if metric:
+            config["index"]["metric_type"] = metric.upper()
+        if param:
+            config["index"]["params"] = parse_params(param)
+        if search_param:
+            config["search"]["params"] = parse_params(search_param)
+        elif index_type:
+            config["search"]["params"] = {}
+
+        if config["index"] != old_index:
+            from .agent.document_processing import RAGStore
+            from .agent.vector_index import rebuild_index
+            with console.status("rebuilding the vector index..."):
+                rag = RAGStore.open(rag_dir + "/milvus.db", rag_dir + "/database.db")
+                try:
+                    rebuild_index(rag.vector_store, config)
+                    rag.bump_generation()
+                    rag.conn.commit()
+                finally:
+                    rag.release()
+        save_config(rag_dir, config)
+        if config["index"] != old_index or config["search"] != old_search:
+            # a running daemon reads the config when it opens the store, it opens it again on its next search
+            from . import daemon
+            try:
+                daemon.request(rag_path, "release")
+            except daemon.DaemonUnavailable:
+                pass
+        console.print(f"Vector index: {describe(config)}")
+    except ValueError as e:
+        console.print(f"[red]{e}")
+
+@app.command()
+def benchmark(candidate: Optional[list[str]] = None, metric: Optional[str] = None, k: int = 10, sample: int = 10000, queries: int = 200, dimension: Optional[list[int]] = None):
+    """Measures recall@k and query latency of vector index settings on the project's own vectors
+
+    Each candidate indexes a sample of the stored vectors in a temporary database, the project's index is not changed.
+    Apply the chosen settings with `perpetua index`.
+
+    Args:
+        candidate (list[str]): settings to compare, as INDEX_TYPE[:build params[:search params]],
+            e.g. `--candidate HNSW:M=16,efConstruction=200:ef=64`. A default set of FLAT, IVF_FLAT, IVF_SQ8 and HNSW settings is used otherwise.
+            A `rescore=N` search param ranks N times more candidates again with the float vectors, e.g. `IVF_SQ8:nlist=128:nprobe=16,rescore=4`.
+        metric (str): metric of the candidates, defaults to the project's.
+        k (int): number of neighbors searched for, recall is measured against exact search at k.
+        sample (int): number of stored vectors used, at most.
+        queries (int): number of the sampled vectors held out and used as queries.
+        dimension (list[int]): Matryoshka dimensions to truncate the vectors to, e.g. `--dimension 768 --dimension 256`.
+            Recall is still measured against exact search on the stored vectors.
+    """
+    from .project_config import describe, load_config
+    from .agent.vector_index import DEFAULT_CANDIDATES, benchmark as run_benchmark, parse_candidate, sample_vectors
+    from .agent.document_processing import RAGStore
+    from rich.table import Table
+
+    try:
+        assert check_initialization(), "This is not a perpetua project! Please initialize this repo."
+        rag_dir = find_rag_directory(os.getcwd()) + "/.rag"
+        config = load_config(rag_dir)
+        metric = (metric or config["index"]["metric_type"]).upper()
+        candidates = [parse_candidate(spec, metric) for spec in candidate or DEFAULT_CANDIDATES]
+
+        rag = RAGStore.open(rag_dir + "/milvus.db", rag_dir + "/database.db")
+        try:
+            vectors = sample_vectors(rag.vector_store, sample)
+        finally:
+            rag.release()
+        console.print(f"Benchmarking {len(candidates)} settings on {len(vectors)} vectors, current index: {describe(config)}")
+
+        table = Table()
+        for column in ("index", "dim", f"recall@{k}", "p50 (ms)", "p99 (ms)", "build (s)", "disk (MB)", "memory (MB)"):
+            table.add_column(column)
+        with console.status("benchmarking...") as status:
+            def on_result(candidate, dim, result):
+                status.update(f"benchmarked {describe(candidate)} at {dim} dimensions")
+                table.add_row(
+                    describe(candidate), str(dim), f"{result['recall']:.3f}", f"{result['p50_ms']:.2f}", f"{result['p99_ms']:.2f}",
+                    f"{result['build_s']:.1f}", f"{result['disk_mb']:.1f}", f"{result['memory_mb']:.1f}",
+                )
+            run_benchmark(vectors, candidates, k, queries, on_result, dimension)
+        console.print(table)
+    except ValueError as e:
+        console.print(f"[red]{e}")
 
-        
 @app.command()
 def add(path: str):
     """ Adds a file or directory to the staging area 
     
+    Only the path, stat info and (when already known) hash of each file are recorded in the staging index,
+    files are read from the working tree when committed.
+
     Args:
         path (str): the path to the file/directory we want to add to the staging area
     
     """
+    from .staging import StagingIndex
+
     try:
         assert check_initialization(), "This is not a perpetua project! Please initialize this repo."
         rag_directory = find_rag_directory(os.getcwd())
-        if os.path.isdir(path):
-            for root, dir, files in os.walk(path):
-                if not (re.search(r"[/\\]\.git[\\/]*", root) or re.search(r"[/\\]\.rag[\\/]*", root)):
-                    for file in files:
-                        shutil.copy2(root + "/" + file, rag_directory + "/.rag/staging/" + file.split("/")[-1])
-        else:
-            shutil.copy2(path, rag_directory + "/.rag/staging/" + path.split("/")[-1])
+        index = StagingIndex(rag_directory)
+        index.add(path)
+        index.save()
     except AssertionError as e:
         raise e   
 
@@ -165,10 +353,15 @@ def rm(path: str):
     Args: 
         path (str): the string representation of the path to the file we want to remove from the staging area.
     """
+    from .staging import StagingIndex
+
     try: 
-        assert check_initialization, "This is not a perpetua project! Please initialize this repo."
+        assert check_initialization(), "This is not a perpetua project! Please initialize this repo."
         rag_directory = find_rag_directory(os.getcwd())
-        os.remove(rag_directory + "/.rag/staging/" + path.split("/")[-1])   
+        index = StagingIndex(rag_directory)
+        if not index.remove(path):
+            raise FileNotFoundError(f"{path} is not in the staging area")
+        index.save()
     except Exception as e: 
         raise e       
 
@@ -180,16 +373,45 @@ def reset(hard: bool = False):
         hard (bool): dictates whether the directory needs to be reinitialized.
     """
     try: 
-        assert check_initialization, "This is not a perpetua project! Please initialize this repo."
+        assert check_initialization(), "This is not a perpetua project! Please initialize this repo."
         rag_directory = find_rag_directory(os.getcwd())
         if hard:
-            os.remove(rag_directory + "/.rag")
-            init()
+            from .project_config import load_config, save_config
+            from .agent.embedding_cache import EMBEDDING_CACHE_FILE
+            from .agent.embedding_providers import get_provider
+            from .setup_db import close_pool
+            from . import daemon
+            # the new index keeps the storage and index settings chosen for the project,
+            # and is built with the embedding model configured now
+            config = load_config(rag_directory + "/.rag")
+            provider, model = get_provider()
+            config["embedding"].update(provider=provider, model=model)
+            # Keep the embedding cache so reindexing the same content costs no embedding calls
+            cache = rag_directory + "/.rag/" + EMBEDDING_CACHE_FILE
+            kept_cache = rag_directory + "/." + EMBEDDING_CACHE_FILE
+            if os.path.exists(cache):
+                shutil.move(cache, kept_cache)
+            # a daemon would keep serving the deleted index
+            try:
+                daemon.request(rag_directory, "shutdown")
+            except daemon.DaemonUnavailable:
+                pass
+            close_pool(rag_directory + "/.rag/database.db")
+            shutil.rmtree(rag_directory + "/.rag")
+            init(config["embedding"]["dimension"], config["embedding"]["quantization"])
+            save_config(os.getcwd() + "/.rag", config)
+            if os.path.exists(kept_cache):
+                shutil.move(kept_cache, os.getcwd() + "/.rag/" + EMBEDDING_CACHE_FILE)
         else:
-            i = 0
-            for f in os.listdir(rag_directory + "/.rag/staging"):
-                os.remove(rag_directory + "/.rag/staging/" + f)
-                i += 1
+            from .staging import StagingIndex
+
+            index = StagingIndex(rag_directory)
+            i = index.clear()
+            index.save()
+            # copies staged by older versions of perpetua
+            if os.path.isdir(rag_directory + "/.rag/staging"):
+                i += len(os.listdir(rag_directory + "/.rag/staging"))
+                shutil.rmtree(rag_directory + "/.rag/staging")
             console.print(f"[yellow]Deleted {i} files from staging area.")
     except Exception as e:
         raise e
@@ -203,55 +425,190 @@ def diff():
         Very rudimentary. Just shows that file hashes are different.
     
     """
-    from .agent.document_processing import RAGStore
+    from .staging import StagingIndex
+
     try:
         assert check_initialization(), "This is not a Perpetua project! Please initialize this repo."
         rag_path = find_rag_directory(os.getcwd())
-        rag = RAGStore(
-            vs_URI=rag_path + "/.rag/milvus.db", 
-            sql_URI=rag_path + "/.rag/database.db"
-        )
-        path = rag_path + "/.rag/staging"
-        files_to_process = [path + "/" + file for file in os.listdir(path=path)]
-
-        if not files_to_process:
+        index = StagingIndex(rag_path)
+        if not index.entries:
             console.print("Staging area clean.")
-            typer.Exit()
-
-        current_hashes = rag.get_current_hashes(files_to_process)
-        updated_hashes = [rag.get_file_hash(file) for file in files_to_process]
-        for file in files_to_process:
-            if current_hashes[file] != updated_hashes:
-                console.print(f"[bold] {file}: [/bold] [red]different")
+            return
+
+        files = {relative: index.absolute(relative) for relative in sorted(index.entries)}
+        current_hashes = index.get_indexed_hashes(list(files.values()))
+        # hashes recorded when staging hold as long as the file was not touched since
+        staged_hashes = {
+            files[relative]: entry["hash"] for relative, entry in index.entries.items()
+            if entry["hash"] and not index.is_modified(relative)
+        }
+        updated_hashes = index.get_file_hashes([
+            file for file in files.values() if file not in staged_hashes and os.path.exists(file)
+        ])
+        updated_hashes.update(staged_hashes)
+        for relative, file in files.items():
+            if not os.path.exists(file):
+                console.print(f"[bold] {relative}: [/bold] [red]deleted")
+            elif current_hashes.get(file) != updated_hashes.get(file):
+                console.print(f"[bold] {relative}: [/bold] [red]different")
             else:
-                console.print(f"[bold] {file}: [/bold] [green]no changes")
+                console.print(f"[bold] {relative}: [/bold] [green]no changes")
     except Exception as e:
         raise e
 
 @app.command()
-def commit(verbose: bool = False):
-    """ Adds files from staging area to vector database """
-    from .agent.document_processing import RAGStore
+def commit(verbose: bool = False, jobs: int = 1, batch_size: Optional[int] = None, concurrency: Optional[int] = None):
+    """ Adds files from staging area to vector database 
+    
+    Args:
+        verbose (bool): prints how each file was split, embedding cache hits and embedding throughput.
+        jobs (int): number of processes used to hash, parse and split the staged files in parallel.
+        batch_size (int): number of chunks sent per embedding request. Defaults to EMBEDDING_BATCH_SIZE or the embedding provider's default (100 for Gemini).
+        concurrency (int): number of embedding requests in flight at once. Defaults to EMBEDDING_CONCURRENCY or the embedding provider's default (4 for Gemini).
+    """
+    from .agent.document_processing import RAGStore, is_supported
+    from .agent.embedding_providers import EmbeddingModelMismatch
+    from .staging import StagingIndex
 
     try:
         assert check_initialization(), "This is not a Perpetua project! Please initialize this repo."
         rag_path = find_rag_directory(os.getcwd())
-        rag = RAGStore(
+        rag = RAGStore.open(
             vs_URI=rag_path + "/.rag/milvus.db", 
             sql_URI=rag_path + "/.rag/database.db"
         )
-        path = rag_path + "/.rag/staging"
-        files_to_process = [path + "/" + file for file in os.listdir(path=path)]
-        
-        rag.add_documents_batch(files_to_process, verbose)
+        if batch_size:
+            rag.embeddings.batch_size = batch_size
+        if concurrency:
+            rag.embeddings.concurrency = concurrency
+        index = StagingIndex(rag_path)
+        staged = [index.absolute(relative) for relative in sorted(index.entries)]
+        # staged files are read from the working tree, files deleted since they were added leave the index
+        deleted = [file for file in staged if not os.path.exists(file)]
+        files_to_process = [file for file in staged if os.path.exists(file) and is_supported(file)]
+        skipped = len(staged) - len(deleted) - len(files_to_process)
+        if skipped:
+            console.print(f"[yellow]Skipped {skipped} files with unsupported extensions.")
+
+        if deleted:
+            rag.remove_documents(deleted)
+        rag.add_documents_batch(files_to_process, verbose, jobs)
+
+        update_repo_structure_doc(added=staged)
+
+        index.clear()
+        index.save()
+
+    except EmbeddingModelMismatch as e:
+        console.print(f"[red]{e}")
+    except AssertionError as e:
+        raise e
 
-        os.remove(rag_path + "/.rag/repo-graph-lock.json")
+@app.command()
+def sync(verbose: bool = False, jobs: int = 1):
+    """ Indexes the files git reports as changed since the last sync, without going through the staging area.
 
-        create_repo_structure_doc()
+    The first sync indexes every tracked file. Later syncs index added and modified files, delete removed ones
+    and move renamed ones without embedding them again.
 
-        for file in os.listdir(path=path):
-            os.remove(path + "/" + file)
+    Args:
+        verbose (bool): prints how each file was split.
+        jobs (int): number of processes used to hash, parse and split the changed files in parallel.
+    """
+    from .agent.document_processing import RAGStore, is_supported
+    from .agent.embedding_providers import EmbeddingModelMismatch
+    from .sync import get_changes, get_dirty_files, get_head, read_sync_state, write_sync_state
 
+    try:
+        assert check_initialization(), "This is not a Perpetua project! Please initialize this repo."
+        rag_path = find_rag_directory(os.getcwd())
+        head = get_head(rag_path)
+        dirty = get_dirty_files(rag_path)
+        changed, deleted, renamed = get_changes(rag_path, read_sync_state(rag_path))
+        structure_changes = {"added": sorted(changed), "removed": sorted(deleted), "renamed": renamed}
+
+        rag = RAGStore.open(
+            vs_URI=rag_path + "/.rag/milvus.db", 
+            sql_URI=rag_path + "/.rag/database.db"
+        )
+        # renamed across supported and unsupported types, the file leaves the index or is new to it
+        deleted |= {old for old, new in renamed if is_supported(old) and not is_supported(new)}
+        changed |= {new for old, new in renamed if is_supported(new) and not is_supported(old)}
+        renamed = [(old, new) for old, new in renamed if is_supported(old) and is_supported(new)]
+        for old, new in renamed:
+            rag.rename_document(rag_path + "/" + old, rag_path + "/" + new)
+        if deleted:
+            rag.remove_documents([rag_path + "/" + path for path in sorted(deleted)])
+        files_to_process = [rag_path + "/" + path for path in sorted(changed) if is_supported(path)]
+        if files_to_process:
+            rag.add_documents_batch(files_to_process, verbose, jobs)
+
+        write_sync_state(rag_path, head, dirty)
+        update_repo_structure_doc(**structure_changes)
+        console.print(f"[green]Synced with {head[:7]}: {len(files_to_process)} files checked, {len(deleted)} deleted, {len(renamed)} renamed.")
+    except EmbeddingModelMismatch as e:
+        console.print(f"[red]{e}")
+    except AssertionError as e:
+        raise e
+
+@app.command()
+def watch(verbose: bool = False, debounce: float = 0.5, poll: bool = False):
+    """ Watches the project and indexes files as they are saved, until interrupted with Ctrl-C.
+
+    Bursts of saves are indexed together once the tree has been quiet for `debounce` seconds. Deleted files
+    are removed from the index and the repo graph is updated in place when files are added or removed.
+    The index is released between updates, so `perpetua ask` can be used while watching.
+
+    Args:
+        verbose (bool): prints how each file was split.
+        debounce (float): seconds without changes to wait for before indexing.
+        poll (bool): rescans the tree every second instead of using inotify. Used automatically when inotify is not available.
+    """
+    from .agent.document_processing import RAGStore, is_supported
+    from .agent.embedding_providers import EmbeddingModelMismatch
+    from .watch import debounced, make_watcher, split_changes
+    from .repo_graph import RepoGraph
+
+    try:
+        assert check_initialization(), "This is not a Perpetua project! Please initialize this repo."
+        rag_path = find_rag_directory(os.getcwd())
+        graph = RepoGraph(rag_path)
+        graph.save_graph(rag_path + "/.rag/")
+        watcher = make_watcher(rag_path, poll)
+        console.print(f"[green]Watching {rag_path} ({type(watcher).__name__}). Press Ctrl-C to stop.")
+
+        try:
+            for paths in debounced(watcher, debounce):
+                changed, deleted, structure_changed = split_changes(paths, graph)
+                files_to_process = sorted(path for path in changed if is_supported(path))
+                deleted = sorted(path for path in deleted if is_supported(path))
+                if files_to_process or deleted:
+                    rag = RAGStore.open(
+                        vs_URI=rag_path + "/.rag/milvus.db",
+                        sql_URI=rag_path + "/.rag/database.db"
+                    )
+                    try:
+                        # files deleted or renamed away since they were reported leave the index
+                        gone = [path for path in files_to_process if not os.path.exists(path)]
+                        if gone:
+                            files_to_process = [path for path in files_to_process if path not in gone]
+                            deleted = sorted(set(deleted) | set(gone))
+                        if deleted:
+                            rag.remove_documents(deleted)
+                        if files_to_process:
+                            rag.add_documents_batch(files_to_process, verbose)
+                    finally:
+                        rag.release()
+                if structure_changed:
+                    graph.save_changes(rag_path + "/.rag/")
+                if files_to_process or deleted:
+                    console.print(f"[italic]{datetime.now():%H:%M:%S} {len(files_to_process)} files checked, {len(deleted)} deleted.")
+        except KeyboardInterrupt:
+            console.print("[yellow]Stopped watching.")
+        finally:
+            watcher.close()
+    except EmbeddingModelMismatch as e:
+        console.print(f"[red]{e}")
     except AssertionError as e:
         raise e
 
@@ -262,7 +619,7 @@ def ask(save: bool = False):
     Args:
         save (bool) (default -- false): saves the conversation in the config folder. Not super easy to read.
     """
-    from .agent.agent import invoke_agent
+    from . import daemon
     from rich.markdown import Markdown
     from rich.prompt import Prompt
 
@@ -289,7 +646,12 @@ def ask(save: bool = False):
         if initial_message == "q" or initial_message == "Q":
             break
 
-        msg = invoke_agent(initial_message, rag_path + "/.rag/milvus.db", rag_path + "/.rag/database.db", config)
+        try:
+            # answered by `perpetua serve` when it runs, its agent is already compiled
+            msg = daemon.request(rag_path, "ask", content=initial_message, thread=thread)
+        except daemon.DaemonUnavailable:
+            from .agent.agent import invoke_agent
+            msg = invoke_agent(initial_message, rag_path + "/.rag/milvus.db", rag_path + "/.rag/database.db", config)
         conversation += USER_DELIMETER + "\n" + initial_message + AGENT_DELIMETER + "\n" + msg + "\n"
 
         console.print(Markdown(msg), 1)
@@ -299,14 +661,67 @@ def ask(save: bool = False):
             f.write(conversation)
         
 
+@app.command()
+def serve(stop: bool = False, foreground: bool = False, http_port: Optional[int] = None):
+    """ Starts a background daemon that keeps this project's index, embedding model and agent loaded.
+
+    While it runs, `perpetua search` and `perpetua ask` are answered by the daemon instead of loading everything
+    again, so repeated searches take milliseconds instead of seconds. Commands writing to the index (commit, sync,
+    watch) make it release the index while they run. It listens on a Unix socket in the .rag directory and
+    logs to .rag/daemon.log.
+
+    Args:
+        stop (bool): stops the running daemon.
+        foreground (bool): serves in this process until interrupted with Ctrl-C, logging to the terminal.
+        http_port (int): also serves the HTTP/JSON API (search, symbols, files, tree, stats) on this port of 127.0.0.1, 0 picks a free port.
+    """
+    from . import daemon
+
+    assert check_initialization(), "This is not a Perpetua project! Please initialize this repo."
+    rag_path = find_rag_directory(os.getcwd())
+    try:
+        status = daemon.request(rag_path, "ping")
+    except daemon.DaemonUnavailable:
+        status = None
+    if stop:
+        if status is None:
+            console.print("[yellow]No daemon is running for this project.")
+            return
+        daemon.request(rag_path, "shutdown")
+        console.print(f"[green]Stopped the daemon (pid {status['pid']}).")
+    elif status is not None:
+        console.print(f"[yellow]A daemon is already running for this project (pid {status['pid']}).")
+        if status.get("http_port"):
+            console.print(f"HTTP API on http://127.0.0.1:{status['http_port']}")
+    elif foreground:
+        console.print(f"[green]Serving {rag_path}. Press Ctrl-C to stop.")
+        daemon.Daemon(rag_path, http_port).serve()
+    else:
+        try:
+            pid = daemon.start(rag_path, http_port)
+        except RuntimeError as e:
+            console.print(f"[red]{e}")
+            return
+        console.print(f"[green]Daemon started (pid {pid}). Stop it with `perpetua serve --stop`.")
+        if http_port is not None:
+            console.print(f"HTTP API on http://127.0.0.1:{daemon.request(rag_path, 'ping')['http_port']}")
+
 @app.command()
 def status():
     """ Provides a status update of what files are currently in the staging area """
+    from .staging import StagingIndex
+
     if check_initialization():
         rag_path = find_rag_directory(os.getcwd())
+        index = StagingIndex(rag_path)
         status = ""
-        for file in os.listdir(rag_path + "/.rag/staging"):
-            status += "[red]\t" + file + "\n"
+        for file in sorted(index.entries):
+            if not os.path.exists(index.absolute(file)):
+                status += "[red]\t" + file + " (deleted)\n"
+            elif index.is_modified(file):
+                status += "[red]\t" + file + " (modified since added)\n"
+            else:
+                status += "[red]\t" + file + "\n"
         console.print("The following files have not been committed: \n")
         console.print(status)
     else:
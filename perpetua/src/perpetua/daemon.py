@@ -0,0 +1,306 @@
+#Background daemon keeping a project's index, embedding model and agent loaded between CLI invocations
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SOCKET_FILE = "daemon.sock"
+PID_FILE = "daemon.pid"
+LOG_FILE = "daemon.log"
+
+# sun_path holds 108 bytes on Linux and 104 on macOS, longer socket paths go to the temp directory
+MAX_SOCKET_PATH = 100
+
+# Seconds the CLI waits to connect before running the command itself
+CONNECT_TIMEOUT = 1.0
+# Seconds `perpetua serve` waits for a new daemon to answer
+START_TIMEOUT = 120.0
+
+# rag_path of the project this process serves, requests to itself would wait on its own lock
+_serving: str | None = None
+
+class DaemonUnavailable(Exception):
+    """No daemon is running for the project"""
+
+class DaemonError(Exception):
+    """The daemon failed to run a request. type is the name of the exception it raised.
+
+    Args:
+    message: the exception's message
+    type: the exception's class name, e.g. "EmbeddingModelMismatch"
+    """
+
+    def __init__(self, message: str, type: str):
+        super().__init__(message)
+        self.type = type
+
+def socket_path(rag_path: str) -> str:
+    """Unix socket of the project's daemon"""
+    rag_path = os.path.abspath(rag_path)
+    path = rag_path + "/.rag/" + SOCKET_FILE
+    if len(path.encode()) <= MAX_SOCKET_PATH:
+        return path
+    digest = hashlib.sha1(rag_path.encode()).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"perpetua-{digest}.sock")
+
+def request(rag_path: str, command: str, **args):
+    """Runs a command in the project's daemon and returns its result.
+    Requests and responses are one line of JSON each, one request per connection.
+
+    Raises DaemonUnavailable when no daemon is running, so the caller runs the command itself,
+    and DaemonError when the command failed in the daemon.
+    """
+    if _serving == os.path.abspath(rag_path):
+        raise DaemonUnavailable(f"This process is the daemon of {rag_path}")
+    path = socket_path(rag_path)
+    if not os.path.exists(path):
+        raise DaemonUnavailable(f"No daemon is running for {rag_path}")
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(CONNECT_TIMEOUT)
+        try:
+            client.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError, socket.timeout):
+            raise DaemonUnavailable(f"The daemon of {rag_path} is not answering")
+        # asking the agent can take as long as the LLM does
+        client.settimeout(None)
+        client.sendall(json.dumps({"command": command, "args": args}).encode() + b"\n")
+        with client.makefile("rb") as f:
+            line = f.readline()
+    finally:
+        client.close()
+    if not line:
+        raise DaemonUnavailable(f"The daemon of {rag_path} stopped")
+    response = json.loads(line)
+    if "error" in response:
+        raise DaemonError(response["error"], response["type"])
+    return response["result"]
+
+def is_running(rag_path: str) -> bool:
+    try:
+        request(rag_path, "ping")
+        return True
+    except DaemonUnavailable:
+        return False
+
+def start(rag_path: str, http_port: int | None = None) -> int:
+    """Starts the project's daemon in the background, logging to .rag/daemon.log.
+
+    Returns: its pid, once it answers requests
+    """
+    args = [rag_path] if http_port is None else [rag_path, str(http_port)]
+    with open(rag_path + "/.rag/" + LOG_FILE, "a") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "perpetua.daemon", *args],
+            cwd=rag_path, stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True,
+        )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The daemon exited with code {process.returncode}, see {rag_path}/.rag/{LOG_FILE}")
+        if is_running(rag_path):
+            return process.pid
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"The daemon did not start within {START_TIMEOUT:.0f}s, see {rag_path}/.rag/{LOG_FILE}")
+
+class Daemon:
+    """Serves CLI requests for one project over a Unix socket, from one warm process.
+
+    The process keeps what every CLI invocation otherwise rebuilds: imported modules, the embedding client,
+    the compiled agent, the search result cache and an open RAGStore. Milvus Lite can only be opened by one
+    process at a time, so the store is released whenever another process asks for it (see RAGStore.open)
+    and opened again by the next search.
+
+    Requests are served concurrently and share the store. A release waits for the requests using it and holds new ones back.
+    With an http_port, the same process also serves the HTTP API of http_api.APIServer on localhost.
+
+    Args:
+    rag_path: the directory containing the .rag directory
+    http_port: port of the HTTP API, None to only listen on the Unix socket
+    """
+
+    def __init__(self, rag_path: str, http_port: int | None = None):
+        self.rag_path = os.path.abspath(rag_path)
+        self.vs_URI = self.rag_path + "/.rag/milvus.db"
+        self.sql_URI = self.rag_path + "/.rag/database.db"
+        self.http_port = http_port
+        self.started = time.time()
+        self.store = None
+        # requests using the store, it is only released once they are done
+        self.users = 0
+        # releases waiting for the users, and whether a request is opening the store
+        self.releasing = 0
+        self.opening = False
+        self.condition = threading.Condition()
+        self.server = None
+        self.api = None
+
+    def open_store(self):
+        """The store, opened if it was released. RAGStore.open can wait for another process to unlock
+        the database, so it runs outside the lock while other requests for the store wait for it"""
+        with self.using_store() as store:
+            return store
+
+    @contextmanager
+    def using_store(self):
+        """Keeps the store open while a request uses it, opening it again if it was released.
+        Requests wait while a release is pending, so a commit waiting for the store is not starved by searches"""
+        from .agent.document_processing import RAGStore
+
+        with self.condition:
+            self.condition.wait_for(lambda: not self.releasing and not self.opening)
+            store = self.store
+            if store is None:
+                self.opening = True
+            else:
+                self.users += 1
+        if store is None:
+            try:
+                store = RAGStore.open(self.vs_URI, self.sql_URI)
+            finally:
+                with self.condition:
+                    self.opening = False
+                    if store is not None:
+                        self.store = store
+                        self.users += 1
+                    self.condition.notify_all()
+        try:
+            yield store
+        finally:
+            with self.condition:
+                self.users -= 1
+                self.condition.notify_all()
+
+    def release_store(self) -> None:
+        with self.condition:
+            self.releasing += 1
+            try:
+                self.condition.wait_for(lambda: self.users == 0 and not self.opening)
+                if self.store is not None:
+                    self.store.release()
+                    self.store = None
+            finally:
+                self.releasing -= 1
+                self.condition.notify_all()
+
+    def warm(self) -> None:
+        """Loads the search stack and the agent before the first request.
+        Failures are logged and left for the requests that need them to report."""
+        try:
+            self.open_store()
+        except Exception as e:
+            # e.g. EmbeddingModelMismatch, lexical searches still work
+            print(f"Index not opened: {e!r}", file=sys.stderr, flush=True)
+        try:
+            from .agent.agent import choose_agent
+            choose_agent(self.sql_URI)
+        except Exception as e:
+            print(f"Agent not loaded: {e!r}", file=sys.stderr, flush=True)
+
+    def handle(self, message: dict) -> dict:
+        """Runs one request, {"command": ..., "args": {...}}, and returns {"result": ...} or {"error": ..., "type": ...}"""
+        handler = getattr(self, "command_" + str(message.get("command")), None)
+        if handler is None:
+            return {"error": f"Unknown command {message.get('command')}", "type": "ValueError"}
+        try:
+            return {"result": handler(**message.get("args", {}))}
+        except Exception as e:
+            return {"error": str(e), "type": type(e).__name__}
+
+    def command_ping(self) -> dict:
+        return {
+            "pid": os.getpid(), "rag_path": self.rag_path, "uptime": time.time() - self.started,
+            "store_open": self.store is not None, "http_port": self.api.port if self.api else None,
+        }
+
+    def search(self, query: str, k: int = 4, mode: str = "hybrid", filters: dict | None = None) -> list:
+        """retrieval.search with the warm store, lexical searches do not open it"""
+        from .agent.retrieval import search
+
+        if mode == "lexical":
+            return search(query, self.vs_URI, self.sql_URI, k, mode, filters)
+        with self.using_store():
+            return search(query, self.vs_URI, self.sql_URI, k, mode, filters)
+
+    def command_search(self, query: str, k: int = 4, mode: str = "hybrid", filters: dict | None = None) -> list[dict]:
+        docs = self.search(query, k, mode, filters)
+        return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+    def command_ask(self, content: str, thread: str) -> str:
+        from .agent.agent import invoke_agent
+
+        with self.using_store():
+            return invoke_agent(content, self.vs_URI, self.sql_URI, {"configurable": {"thread_id": thread}})
+
+    def command_release(self) -> None:
+        self.release_store()
+
+    def command_shutdown(self) -> None:
+        # shutdown() waits for serve_forever to return, which this request is keeping busy
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def serve(self) -> None:
+        """Serves requests until shutdown is requested or the process gets SIGTERM or SIGINT"""
+        global _serving
+        path = socket_path(self.rag_path)
+        if is_running(self.rag_path):
+            raise RuntimeError(f"A daemon is already running for {self.rag_path}")
+        if os.path.exists(path):
+            # left behind by a daemon that was killed
+            os.unlink(path)
+        _serving = self.rag_path
+        os.chdir(self.rag_path)
+        self.warm()
+        self.server = _Server(path, _Handler)
+        self.server.owner = self
+        if self.http_port is not None:
+            from .http_api import APIServer
+            self.api = APIServer(self, port=self.http_port)
+            self.api.start()
+            print(f"HTTP API on http://{self.api.host}:{self.api.port}", file=sys.stderr, flush=True)
+        with open(self.rag_path + "/.rag/" + PID_FILE, "w") as f:
+            f.write(str(os.getpid()))
+        stop = lambda signum, frame: threading.Thread(target=self.server.shutdown, daemon=True).start()
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        print(f"Serving {self.rag_path} on {path}", file=sys.stderr, flush=True)
+        try:
+            self.server.serve_forever()
+        finally:
+            if self.api is not None:
+                self.api.stop()
+            self.server.server_close()
+            for file in (path, self.rag_path + "/.rag/" + PID_FILE):
+                try:
+                    os.unlink(file)
+                except FileNotFoundError:
+                    pass
+            self.release_store()
+            _serving = None
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            response = self.server.owner.handle(json.loads(line))
+        except json.JSONDecodeError as e:
+            response = {"error": f"Invalid request: {e}", "type": "ValueError"}
+        # metadata read back from Milvus may hold values json does not know, they are sent as text
+        self.wfile.write(json.dumps(response, default=str).encode() + b"\n")
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+if __name__ == "__main__":
+    Daemon(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None).serve()
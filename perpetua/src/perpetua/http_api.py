@@ -0,0 +1,315 @@
+#Local HTTP/JSON API of a project's index, served by the `perpetua serve` daemon
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Requests run in these threads, so a slow search does not hold up a symbol lookup
+WORKERS = 8
+
+# Latencies kept per endpoint for the percentiles of /stats
+LATENCY_SAMPLES = 1024
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+# Seconds an idle keep-alive connection stays open
+IDLE_TIMEOUT = 30.0
+
+# Host headers accepted, a web page resolving its own domain to 127.0.0.1 still cannot read the index
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "[::1]")
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+           413: "Payload Too Large", 421: "Misdirected Request", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class HTTPError(Exception):
+    """Ends a request with an error status and {"error": message} """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class LatencyStats:
+    """Request counts and latencies per endpoint, safe to share between threads"""
+
+    def __init__(self, samples: int = LATENCY_SAMPLES):
+        self.samples = samples
+        self.endpoints: dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, status: int) -> None:
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, {"count": 0, "errors": 0, "total": 0.0, "max": 0.0, "recent": deque(maxlen=self.samples)})
+            stats["count"] += 1
+            stats["errors"] += status >= 400
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["recent"].append(seconds)
+
+    def snapshot(self) -> dict:
+        """{endpoint: {"count", "errors", "mean_ms", "p50_ms", "p95_ms", "max_ms"}}, percentiles of the recent requests"""
+        with self.lock:
+            endpoints = {endpoint: (dict(stats), sorted(stats["recent"])) for endpoint, stats in self.endpoints.items()}
+        percentile = lambda recent, p: recent[min(len(recent) - 1, int(p * len(recent)))] * 1000
+        return {
+            endpoint: {
+                "count": stats["count"],
+                "errors": stats["errors"],
+                "mean_ms": round(stats["total"] / stats["count"] * 1000, 3),
+                "p50_ms": round(percentile(recent, 0.5), 3),
+                "p95_ms": round(percentile(recent, 0.95), 3),
+                "max_ms": round(stats["max"] * 1000, 3),
+            }
+            for endpoint, (stats, recent) in sorted(endpoints.items())
+        }
+
+class APIServer:
+    """HTTP/JSON API of a project, for editors and scripts. Only listens on localhost.
+
+    GET /search?q=...&k=4&mode=hybrid&language=python&content_type=code&path=src&indexed_after=2d
+    GET /symbols?name=RAGStore.add_documents
+    GET /files?path=src/perpetua
+    GET /tree
+    GET /stats
+    POST /search takes the same parameters as a JSON object.
+
+    Connections are handled by an asyncio event loop and requests run in a thread pool, so they are served
+    concurrently: SQLite reads use a pooled connection per thread instead of RAGStore.curr, and vector searches
+    share the daemon's warm store. Every response has a Server-Timing header, and /stats reports the latency
+    of each endpoint.
+
+    Args:
+    daemon: the daemon.Daemon whose store and project are served
+    host: a loopback address
+    port: 0 picks a free port
+    """
+
+    def __init__(self, daemon, host: str = HOST, port: int = DEFAULT_PORT):
+        if host not in ("127.0.0.1", "localhost", "::1"):
+            raise ValueError(f"The API only listens on localhost, got {host}")
+        self.daemon = daemon
+        self.host = host
+        self.port = port
+        self.stats = LatencyStats()
+        self.routes = {
+            "/search": self.search,
+            "/symbols": self.symbols,
+            "/files": self.files,
+            "/tree": self.tree,
+            "/stats": lambda params: self.stats.snapshot(),
+        }
+        self.executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="perpetua-api")
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.connections: set[asyncio.StreamWriter] = set()
+        # (mtime of the rendered tree file, its text)
+        self.tree_cache = (None, None)
+
+    def start(self) -> None:
+        """Serves from a background thread, returns once the port is bound"""
+        ready = threading.Event()
+        failure = []
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            try:
+                self.server = self.loop.run_until_complete(
+                    asyncio.start_server(self.handle_connection, self.host, self.port, limit=MAX_HEADER_BYTES)
+                )
+            except OSError as e:
+                failure.append(e)
+                ready.set()
+                return
+            self.port = self.server.sockets[0].getsockname()[1]
+            ready.set()
+            # start_server already accepts connections, the loop runs until stop()
+            self.loop.run_forever()
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, name="perpetua-api", daemon=True)
+        self.thread.start()
+        ready.wait()
+        if failure:
+            raise failure[0]
+
+    def stop(self) -> None:
+        if self.loop is not None and self.server is not None and self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.close_connections(), self.loop).result(5)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(5)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def close_connections(self) -> None:
+        """Stops accepting connections and closes the open ones, their handlers return once they read the end of the stream"""
+        self.server.close()
+        for writer in list(self.connections):
+            writer.close()
+        deadline = time.monotonic() + 1.0
+        while self.connections and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serves the requests of one connection, kept alive between them unless the client closes it"""
+        self.connections.add(writer)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self.respond(writer, 413, {"error": "Headers too large"}, 0.0, close=True)
+                    return
+                start = time.perf_counter()
+                try:
+                    method, target, headers = parse_head(head)
+                    length = int(headers.get("content-length", 0))
+                    if length > MAX_BODY_BYTES:
+                        raise HTTPError(413, "Body too large")
+                    body = await reader.readexactly(length) if length else b""
+                except HTTPError as e:
+                    await self.respond(writer, e.status, {"error": str(e)}, time.perf_counter() - start, close=True)
+                    return
+                except (ValueError, asyncio.IncompleteReadError):
+                    await self.respond(writer, 400, {"error": "Malformed request"}, time.perf_counter() - start, close=True)
+                    return
+                close = headers.get("connection", "").lower() == "close"
+                endpoint, status, payload = await self.dispatch(method, target, headers, body)
+                elapsed = time.perf_counter() - start
+                self.stats.record(endpoint, elapsed, status)
+                await self.respond(writer, status, payload, elapsed, close)
+                if close:
+                    return
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def dispatch(self, method: str, target: str, headers: dict, body: bytes) -> tuple[str, int, dict]:
+        """Runs a request in the thread pool. Returns (endpoint, status, JSON payload)"""
+        url = urlsplit(target)
+        handler = self.routes.get(url.path)
+        endpoint = url.path if handler else "other"
+        try:
+            if headers.get("host", "").rsplit(":", 1)[0] not in LOCAL_HOSTS:
+                raise HTTPError(421, "Only requests to localhost are served")
+            if handler is None:
+                raise HTTPError(404, f"Unknown endpoint {url.path}, expected one of {', '.join(self.routes)}")
+            if method == "GET":
+                params = {name: values if len(values) > 1 else values[0] for name, values in parse_qs(url.query).items()}
+            elif method == "POST" and url.path == "/search":
+                params = json.loads(body or b"{}")
+                if not isinstance(params, dict):
+                    raise HTTPError(400, "Expected a JSON object")
+            else:
+                raise HTTPError(405, f"{method} is not supported by {url.path}")
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, handler, params)
+            return endpoint, 200, result
+        except HTTPError as e:
+            return endpoint, e.status, {"error": str(e)}
+        except json.JSONDecodeError as e:
+            return endpoint, 400, {"error": f"Invalid JSON: {e}"}
+        except Exception as e:
+            return endpoint, error_status(e), {"error": str(e), "type": type(e).__name__}
+
+    async def respond(self, writer: asyncio.StreamWriter, status: int, payload: dict, elapsed: float, close: bool) -> None:
+        # metadata read back from Milvus may hold values json does not know, they are sent as text
+        body = json.dumps(payload, default=str).encode()
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Server-Timing: app;dur={elapsed * 1000:.3f}\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+        )
+        try:
+            writer.write(head.encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def search(self, params: dict) -> dict:
+        from .agent.filters import make_filters
+
+        query = params.get("q") or params.get("query")
+        if not query:
+            raise HTTPError(400, "Missing q, the text to search for")
+        try:
+            k = int(params.get("k", 4))
+            filters = make_filters(params.get("language"), params.get("content_type"), params.get("path"), params.get("indexed_after"))
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        docs = self.daemon.search(query, k, params.get("mode", "hybrid"), filters)
+        return {"results": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]}
+
+    def symbols(self, params: dict) -> dict:
+        from .agent.symbols import lookup_symbols
+        from .setup_db import pooled_connection
+
+        if not params.get("name"):
+            raise HTTPError(400, "Missing name, e.g. RAGStore.add_documents")
+        with pooled_connection(self.daemon.sql_URI) as conn:
+            rows = lookup_symbols(conn, params["name"])
+        return {"symbols": [
+            {"name": name, "kind": kind, "path": os.path.relpath(file_path, self.daemon.rag_path), "start_line": start, "end_line": end}
+            for name, kind, file_path, start, end in rows
+        ]}
+
+    def files(self, params: dict) -> dict:
+        """Indexed files from the docs table, optionally under a path prefix relative to the project root"""
+        from .agent.filters import resolve_path, to_glob_pattern
+        from .setup_db import pooled_connection
+
+        sql, args = "SELECT filepath, file_hash, chunk_count, last_indexed FROM docs", []
+        if params.get("path"):
+            sql += " WHERE filepath GLOB ?"
+            args.append(to_glob_pattern(*resolve_path(params["path"], self.daemon.rag_path)))
+        with pooled_connection(self.daemon.sql_URI) as conn:
+            rows = conn.execute(sql + " ORDER BY filepath", args).fetchall()
+        return {"files": [
+            {"path": os.path.relpath(file_path, self.daemon.rag_path), "file_hash": file_hash, "chunk_count": chunk_count, "last_indexed": last_indexed}
+            for file_path, file_hash, chunk_count, last_indexed in rows
+        ]}
+
+    def tree(self, params: dict) -> dict:
+        """The repository tree rendered when the repo graph was last saved, read again when it changes"""
+        from .repo_graph import TREE_FILE, RepoGraph
+
+        rag_dir = self.daemon.rag_path + "/.rag/"
+        mtime = os.stat(rag_dir + TREE_FILE).st_mtime_ns if os.path.exists(rag_dir + TREE_FILE) else None
+        cached_mtime, tree = self.tree_cache
+        if tree is None or mtime is None or cached_mtime != mtime:
+            tree = RepoGraph.read_tree(rag_dir)
+            self.tree_cache = (mtime, tree)
+        return {"tree": tree}
+
+def parse_head(head: bytes) -> tuple[str, str, dict]:
+    """(method, target, headers with lowercase names) of a request's head"""
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, version = lines[0].split(" ")
+    if not version.startswith("HTTP/1."):
+        raise ValueError(f"Unsupported version {version}")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+def error_status(e: Exception) -> int:
+    """Status of an exception raised by a handler"""
+    name = type(e).__name__
+    if name == "EmbeddingModelMismatch":
+        return 409
+    if name == "OperationalError":
+        # e.g. no full-text index or symbols table yet
+        return 503
+    if isinstance(e, ValueError):
+        return 400
+    return 500
@@ -0,0 +1,72 @@
+#Per project settings of the index, kept in .rag/config.json
+import copy
+import json
+import os
+
+CONFIG_FILE = "config.json"
+
+# Settings of new projects. Embeddings are compared by cosine similarity.
+# Projects are indexed with Gemini unless init records another embedding model.
+DEFAULT_CONFIG = {
+    "embedding": {"provider": "gemini", "model": "models/gemini-embedding-001", "dimension": None, "quantization": "none"},
+    "index": {"index_type": "IVF_FLAT", "metric_type": "COSINE", "params": {"nlist": 128}},
+    "search": {"params": {"nprobe": 16}, "rescore": 1},
+}
+
+# What projects initialized before config.json existed were created with
+LEGACY_CONFIG = {
+    "embedding": {"provider": "gemini", "model": "models/gemini-embedding-001", "dimension": None, "quantization": "none"},
+    "index": {"index_type": "IVF_FLAT", "metric_type": "L2", "params": {}},
+    "search": {"params": {"nprobe": 10}, "rescore": 1},
+}
+
+def merge(defaults: dict, values: dict) -> dict:
+    """values on top of defaults, section by section. Values within a section, like params, replace the defaults whole."""
+    merged = copy.deepcopy(defaults)
+    for section, value in values.items():
+        if isinstance(value, dict) and isinstance(merged.get(section), dict):
+            merged[section].update(copy.deepcopy(value))
+        else:
+            merged[section] = value
+    return merged
+
+def load_config(rag_dir: str) -> dict:
+    """Settings of the project whose .rag directory is rag_dir, filled in with defaults"""
+    path = os.path.join(rag_dir, CONFIG_FILE)
+    if not os.path.exists(path):
+        return copy.deepcopy(LEGACY_CONFIG)
+    with open(path, "r") as f:
+        return merge(DEFAULT_CONFIG, json.load(f))
+
+def save_config(rag_dir: str, config: dict) -> None:
+    """Writes the settings, replacing the previous ones atomically"""
+    path = os.path.join(rag_dir, CONFIG_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(config, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def get_search_params(config: dict) -> dict:
+    """Milvus search params matching the configured index"""
+    return {"metric_type": config["index"]["metric_type"], "params": dict(config["search"]["params"])}
+
+def describe(config: dict) -> str:
+    """One line summary of an index config"""
+    index = config["index"]
+    params = {**index["params"], **config["search"]["params"]}
+    if config["search"].get("rescore", 1) > 1:
+        params["rescore"] = config["search"]["rescore"]
+    summary = ", ".join(f"{k}={v}" for k, v in params.items())
+    return f"{index['index_type']} {index['metric_type']}" + (f" ({summary})" if summary else "")
+
+def parse_params(values: list[str] | None) -> dict:
+    """Parses `name=value` pairs given on the command line, numbers are converted"""
+    params = {}
+    for value in values or []:
+        name, sep, raw = value.partition("=")
+        if not sep or not name:
+            raise ValueError(f"Expected name=value, got {value!r}")
+        try:
+            params[name] = json.loads(raw)
+        except json.JSONDecodeError:
+            params[name] = raw
+    return params
@@ -1,17 +1,51 @@
-import networkx as nx
+from array import array
 import os
+import struct
+import sys
 
 from datetime import datetime
 
 import json
 
+from .utils import EXCLUDED_DIRS
+
+GRAPH_FILE = "repo-graph.bin"
+# Node-link JSON written before the binary format, read once and replaced by the next save
+LEGACY_GRAPH_FILE = "repo-graph-lock.json"
+# Changes saved since the graph file was written, one JSON entry per line
+DELTA_FILE = "repo-graph-delta.jsonl"
+# The tree rendered by to_tree, written with the graph and its changes so the agent reads it as is
+TREE_FILE = "repo-tree.txt"
+
+# The delta is compacted into a new graph file once it holds more entries than this fraction of the nodes,
+# past that, replaying it on load costs about as much as reading the graph
+COMPACT_RATIO = 0.25
+
+# Graph file layout, little endian:
+#   header: magic, format version, node count, name count
+#   root path: u32 length + UTF-8
+#   names: u32 length + the distinct node names, UTF-8, separated by NUL
+#   name ids (u32), parent ids (i32, -1 for the root) and kinds (u8), one per node, in preorder
+#   children: offsets (u32, node count + 1) into the child ids (u32) of every node, in order
+MAGIC = b"PRGB"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHII")
+
+# Kinds of nodes. Paths that are neither, like a deleted path added by add_path, are OTHER
+OTHER, FILE, DIR = 0, 1, 2
+# Parent of the nodes removed since the graph was built or loaded, they are dropped when it is saved
+REMOVED = -2
+
 class Node:
-    """A class that represents a node in the graph."""
-    def __init__(self, name: str, path: str):
+    """A class that represents a node in the graph.
+    is_file and is_dir are looked up on disk unless they are given, e.g. from an os.scandir entry."""
+    def __init__(self, name: str, path: str, is_file: bool | None = None, is_dir: bool | None = None):
         self.name: str = name
         self.path: str = path
-        self.is_file: bool = os.path.isfile(path)
-        self.is_dir: bool = os.path.isdir(path)
+        if is_file is None or is_dir is None:
+            is_file, is_dir = os.path.isfile(path), os.path.isdir(path)
+        self.is_file: bool = is_file
+        self.is_dir: bool = is_dir
 
     def to_json(self):
         return {"name": self.name, "path": self.path, "is_file": self.is_file, "is_dir": self.is_dir}
@@ -31,41 +65,282 @@ class Node:
         return False
 
 class RepoGraph:
-    """A class that represents the graph of a repository."""
-    EXCLUDED_DIRS = [".git", ".rag", "__pycache__", ".DS_Store", "dist", "build", "env", "venv", "pytest_cache", ".pytest_cache"]
+    """A class that represents the graph of a repository.
+
+    Nodes are kept in arrays indexed by node id: their name, parent id, kind and child ids. Node 0 is the root.
+    Paths are not stored, they are joined from the names when a path lookup is first needed. G builds the
+    equivalent networkx graph of Node objects on demand.
+
+    Updates made after the graph was built or loaded are recorded in changes, as ("+", path, is_dir) and ("-", path)
+    entries, so save_changes only writes what changed instead of the whole graph."""
+    EXCLUDED_DIRS = EXCLUDED_DIRS
     def __init__(self, path: str) -> None:
         self.path = path
-        self.G = nx.DiGraph()
-        self.create_graph(path)
+        self.reset()
+        self.add_node(path.split("/")[-1], -1, DIR, path)
+        self.create_graph(path, 0)
+        # built from disk, it is saved whole with save_graph
+        self.changes = []
+
+    def reset(self) -> None:
+        self.names: list[str] = []
+        self.parents = array("i")
+        self.kinds = bytearray()
+        self.children: list[list[int]] = []
+        # path of every node and node id of every path, joined from the names on first use
+        self.paths: list[str] | None = None
+        self.ids: dict[str, int] | None = None
+        self.changes: list[tuple] = []
+        self.delta_entries = 0
+        self._G = None
 
     @staticmethod
-    def load_graph(path: str):
-        """Loads a graph from a json file."""
-        with open(path + "repo_graph-lock.json", "r") as f:
+    def load_graph(path: str) -> "RepoGraph":
+        """Loads the graph saved in a .rag directory by save_graph, with the changes saved since by save_changes.
+        Graphs saved as node-link JSON by earlier versions are read as well.
+
+        Args:
+            path (str): the .rag directory, ending with a slash.
+
+        Raises ValueError when the graph file is not one this version can read.
+        """
+        instance = RepoGraph.__new__(RepoGraph)
+        instance.reset()
+        if os.path.exists(path + GRAPH_FILE):
+            with open(path + GRAPH_FILE, "rb") as f:
+                data = f.read()
+            try:
+                instance.read_graph(data)
+            except (struct.error, IndexError):
+                raise ValueError(f"Corrupted repo graph file {path + GRAPH_FILE}")
+        else:
+            instance.read_legacy_graph(path)
+        if os.path.exists(path + DELTA_FILE):
+            with open(path + DELTA_FILE, "r") as f:
+                for line in f:
+                    instance.replay(json.loads(line))
+                    instance.delta_entries += 1
+            instance.changes = []
+        return instance
+
+    def read_graph(self, data: bytes) -> None:
+        magic, version, count, name_count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported repo graph file (version {version})")
+        view = memoryview(data)
+        offset = HEADER.size
+
+        def read_bytes() -> bytes:
+            nonlocal offset
+            (length,) = struct.unpack_from("<I", data, offset)
+            offset += 4 + length
+            return bytes(view[offset - length:offset])
+
+        def read_array(typecode: str, length: int) -> array:
+            nonlocal offset
+            values = array(typecode)
+            values.frombytes(view[offset:offset + length * values.itemsize])
+            offset += length * values.itemsize
+            if sys.byteorder == "big":
+                values.byteswap()
+            return values
+
+        self.path = read_bytes().decode()
+        names = read_bytes().decode().split("\0")
+        if len(names) != name_count:
+            raise ValueError("Corrupted repo graph file")
+        self.names = [names[i] for i in read_array("I", count)]
+        self.parents = read_array("i", count)
+        self.kinds = bytearray(view[offset:offset + count])
+        offset += count
+        offsets = read_array("I", count + 1)
+        children = read_array("I", count - 1).tolist()
+        if offset != len(data):
+            raise ValueError("Corrupted repo graph file")
+        self.children = [children[offsets[i]:offsets[i + 1]] for i in range(count)]
+
+    def read_legacy_graph(self, path: str) -> None:
+        with open(path + LEGACY_GRAPH_FILE, "r") as f:
             data = json.load(f)
-            G = nx.node_link_graph(data)
-            instance = RepoGraph.__new__(RepoGraph)
-            instance.G = G
-            instance.path = path
-            return instance
-
-    def create_graph(self, path: str):
-        """Creates the graph for the repository."""
-        current_directory = Node(path.split("/")[-1], path)
-        self.G.add_node(current_directory)
-        for obj in os.listdir(path):
-            if os.path.isdir(path + "/" + obj) and obj not in RepoGraph.EXCLUDED_DIRS:
-                sub_dir = self.create_graph(path + "/" + obj)
-                self.G.add_edge(current_directory, sub_dir)
-            elif os.path.isfile(path + "/" + obj):
-                name = obj.split("/")[-1]
-                self.G.add_node(Node(name, path + "/" + obj))
-                self.G.add_edge(current_directory, Node(name, path + "/" + obj))
+        # graphs saved before the root was recorded belong to the directory containing .rag
+        self.path = data.get("graph", {}).get("root") or os.path.dirname(os.path.normpath(path))
+        self.paths, self.ids = [], {}
+        children = {}
+        # the key networkx writes edges under changed from "links" to "edges"
+        for edge in data.get("edges", data.get("links", [])):
+            children.setdefault(edge["source"]["path"], []).append(edge["target"])
+        kind = lambda node: FILE if node["is_file"] else DIR if node["is_dir"] else OTHER
+        stack = [(self.add_node(self.path.split("/")[-1], -1, DIR, self.path), self.path)]
+        while stack:
+            parent, parent_path = stack.pop()
+            for child in children.get(parent_path, []):
+                stack.append((self.add_node(child["name"], parent, kind(child), child["path"]), child["path"]))
+        self.changes = []
+
+    def replay(self, change: list) -> None:
+        """Applies a change recorded by add_node or remove_path"""
+        if change[0] == "+":
+            path, is_dir = change[1], change[2]
+            parent = self.node_id(os.path.dirname(path))
+            if parent is not None and self.node_id(path) is None:
+                self.add_node(os.path.basename(path), parent, DIR if is_dir else FILE, path)
+        else:
+            self.remove_path(change[1])
+
+    def index_paths(self) -> None:
+        """Joins the path of every node, nodes come after their parent"""
+        self.paths, self.ids = [self.path], {self.path: 0}
+        for i in range(1, len(self.names)):
+            parent = self.parents[i]
+            path = None if parent == REMOVED else self.paths[parent] + "/" + self.names[i]
+            self.paths.append(path)
+            if path is not None:
+                self.ids[path] = i
+
+    def node_id(self, path: str) -> int | None:
+        if self.ids is None:
+            self.index_paths()
+        return self.ids.get(path)
+
+    def is_excluded(self, path: str) -> bool:
+        """Whether a path is outside the repository or inside a directory the graph leaves out"""
+        relative = os.path.relpath(path, self.path)
+        return relative.startswith("..") or any(part in RepoGraph.EXCLUDED_DIRS for part in relative.split("/"))
+
+    def add_node(self, name: str, parent: int, kind: int, path: str) -> int:
+        node = len(self.names)
+        self.names.append(name)
+        self.parents.append(parent)
+        self.kinds.append(kind)
+        self.children.append([])
+        if parent >= 0:
+            self.children[parent].append(node)
+            self.changes.append(("+", path, kind == DIR))
+        if self.ids is not None:
+            self.paths.append(path)
+            self.ids[path] = node
+        self._G = None
+        return node
+
+    def create_graph(self, path: str, current_directory: int):
+        """Adds everything under a directory node.
+        File types come from the directory entries, so listing a directory costs no stat call per entry."""
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir() and entry.name not in RepoGraph.EXCLUDED_DIRS:
+                    sub_dir = self.add_node(entry.name, current_directory, DIR, entry.path)
+                    self.create_graph(entry.path, sub_dir)
+                elif entry.is_file():
+                    self.add_node(entry.name, current_directory, FILE, entry.path)
         return current_directory
 
+    def add_path(self, path: str) -> bool:
+        """Adds a file or directory created inside the repository, and any of its parents missing from the graph.
+
+        Returns: whether the graph changed
+        """
+        if self.node_id(path) is not None:
+            return False
+        parent = os.path.dirname(path)
+        if parent != self.path and self.add_path(parent) and self.node_id(path) is not None:
+            # the parent was new as well, adding it added everything under it
+            return True
+        kind = DIR if os.path.isdir(path) else FILE if os.path.isfile(path) else OTHER
+        node = self.add_node(os.path.basename(path), self.node_id(parent), kind, path)
+        if kind == DIR:
+            self.create_graph(path, node)
+        return True
+
+    def remove_path(self, path: str) -> list[str]:
+        """Removes a deleted file or directory, along with everything under it.
+
+        Returns: the paths of the files that were removed
+        """
+        node = self.node_id(path)
+        if node is None or node == 0:
+            return []
+        self.children[self.parents[node]].remove(node)
+        removed, stack = [], [node]
+        while stack:
+            i = stack.pop()
+            removed.append(i)
+            stack.extend(self.children[i])
+        files = []
+        for i in removed:
+            if self.kinds[i] == FILE:
+                files.append(self.paths[i])
+            del self.ids[self.paths[i]]
+            self.paths[i] = None
+            self.parents[i] = REMOVED
+            self.children[i] = []
+        self.changes.append(("-", path))
+        self._G = None
+        return files
+
+    def apply_changes(self, added=(), removed=(), renamed=()) -> bool:
+        """Updates the graph with paths that changed on disk, instead of building it again.
+        Paths may be absolute or relative to the repository. Added paths that no longer exist are removed,
+        as are directories left behind by removed paths once they are gone from disk.
+
+        Args:
+            added: files or directories created or modified.
+            removed: files or directories deleted.
+            renamed: (old path, new path) pairs.
+
+        Returns: whether the graph changed
+        """
+        before = len(self.changes)
+        absolute = lambda path: os.path.join(self.path, path)
+        removed = [absolute(path) for path in [*removed, *(old for old, _ in renamed)]]
+        added = [absolute(path) for path in [*added, *(new for _, new in renamed)]]
+        for path in added:
+            if not os.path.exists(path):
+                removed.append(path)
+            elif not self.is_excluded(path):
+                self.add_path(path)
+        for path in removed:
+            if self.is_excluded(path) or os.path.exists(path):
+                continue
+            self.remove_path(path)
+            parent = os.path.dirname(path)
+            while parent != self.path and not self.is_excluded(parent) and not os.path.isdir(parent):
+                self.remove_path(parent)
+                parent = os.path.dirname(parent)
+        return len(self.changes) > before
+
+    def preorder(self) -> list[tuple[int, int]]:
+        """(node id, depth) of every node, parents before their children and children in order"""
+        order, stack = [], [(0, 0)]
+        while stack:
+            node, depth = stack.pop()
+            order.append((node, depth))
+            stack.extend((child, depth + 1) for child in reversed(self.children[node]))
+        return order
+
+    @property
+    def G(self):
+        """The graph as a networkx DiGraph of Node objects, built on first use after a change"""
+        if self._G is None:
+            import networkx as nx
+
+            if self.paths is None:
+                self.index_paths()
+            nodes = {}
+            G = nx.DiGraph()
+            for node, _ in self.preorder():
+                kind = self.kinds[node]
+                nodes[node] = Node(self.names[node], self.paths[node], kind == FILE, kind == DIR)
+                if node == 0:
+                    G.add_node(nodes[node])
+                else:
+                    G.add_edge(nodes[self.parents[node]], nodes[node])
+            self._G = G
+        return self._G
+
     def draw_graph(self):
         """Draws the graph using matplotlib and pydot."""
         import matplotlib.pyplot as plt
+        import networkx as nx
         import pydot
         from networkx.drawing.nx_pydot import graphviz_layout
 
@@ -76,18 +351,110 @@ class RepoGraph:
         plt.show()
 
     def save_graph(self, path: str):
-        """Saves the graph to a json file title repo-graph-lock.json. 
-        
-        Returns: path to the JSON lock file
+        """Saves the graph to repo-graph.bin, replacing the changes saved by save_changes, and renders its tree.
+        Removed nodes are left out and the others are numbered again in preorder.
+
+        Returns: path to the graph file
+        """
+        order = self.preorder()
+        new_ids = {node: i for i, (node, _) in enumerate(order)}
+        name_ids, names = {}, []
+        node_names, parents, offsets, children = array("I"), array("i"), array("I", [0]), array("I")
+        for node, _ in order:
+            name = self.names[node]
+            if name not in name_ids:
+                name_ids[name] = len(names)
+                names.append(name)
+            node_names.append(name_ids[name])
+            parents.append(-1 if node == 0 else new_ids[self.parents[node]])
+            children.extend(new_ids[child] for child in self.children[node])
+            offsets.append(len(children))
+        if sys.byteorder == "big":
+            for values in (node_names, parents, offsets, children):
+                values.byteswap()
+        with_length = lambda data: struct.pack("<I", len(data)) + data
+        data = b"".join([
+            HEADER.pack(MAGIC, FORMAT_VERSION, len(order), len(names)),
+            with_length(self.path.encode()),
+            with_length("\0".join(names).encode()),
+            node_names.tobytes(),
+            parents.tobytes(),
+            bytes(self.kinds[node] for node, _ in order),
+            offsets.tobytes(),
+            children.tobytes(),
+        ])
+        # written aside and moved in place, a graph file is never left half written
+        write_file(path + GRAPH_FILE, data)
+        for file in (DELTA_FILE, LEGACY_GRAPH_FILE):
+            if os.path.exists(path + file):
+                os.remove(path + file)
+        self.changes = []
+        self.delta_entries = 0
+        self.save_tree(path)
+        return path + GRAPH_FILE
+
+    def save_changes(self, path: str):
+        """Appends the changes made since the graph was loaded or saved to repo-graph-delta.jsonl,
+        or saves the whole graph when there is no graph file yet or the delta grew too large.
+        The tree is rendered again when the graph changed.
+
+        Returns: path to the graph file
         """
-        data = nx.node_link_data(self.G)
-        with open(path + "repo-graph-lock.json", "w") as f:
-            json.dump(data, f, default=lambda obj: obj.to_json() if isinstance(obj, Node) else obj)
-        return path + "repo-graph-lock.json"
+        if not os.path.exists(path + GRAPH_FILE) or self.delta_entries + len(self.changes) > COMPACT_RATIO * len(self.names):
+            return self.save_graph(path)
+        if self.changes:
+            # replaying the delta is idempotent, entries left over from an interrupted save are harmless
+            with open(path + DELTA_FILE, "a") as f:
+                f.writelines(json.dumps(change) + "\n" for change in self.changes)
+            self.delta_entries += len(self.changes)
+            self.changes = []
+            self.save_tree(path)
+        return path + GRAPH_FILE
+
+    def save_tree(self, path: str) -> None:
+        write_file(path + TREE_FILE, self.to_tree().encode())
+
+    @staticmethod
+    def read_tree(path: str) -> str:
+        """The tree saved in a .rag directory with the graph, rendered and saved first if it is missing.
+        The graph is built from the project and saved as well when it was never saved or cannot be read.
+
+        Args:
+            path (str): the .rag directory, ending with a slash.
+        """
+        try:
+            with open(path + TREE_FILE, "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        try:
+            graph = RepoGraph.load_graph(path)
+            graph.save_tree(path)
+        except (FileNotFoundError, ValueError):
+            graph = RepoGraph(os.path.dirname(os.path.normpath(path)))
+            graph.save_graph(path)
+        return graph.to_tree()
 
     def to_tree(self):
-        """Formats repo graph as a tree in string representation"""     
-        tree = ""
-        for x in nx.generate_network_text(self.G):
-            tree += x
-        return tree
+        """Formats repo graph as a tree in string representation, the way networkx.generate_network_text does"""
+        lines = []
+        # prefix of the children of each open directory, by depth
+        prefixes = [""]
+        for node, depth in self.preorder():
+            if node == 0:
+                lines.append("╙── " + self.names[node])
+                prefixes = ["    "]
+                continue
+            siblings = self.children[self.parents[node]]
+            last = siblings[-1] == node
+            prefix = prefixes[depth - 1]
+            lines.append(prefix + ("└─╼ " if last else "├─╼ ") + self.names[node])
+            del prefixes[depth:]
+            prefixes.append(prefix + ("    " if last else "│   "))
+        return "\n".join(lines)
+
+def write_file(path: str, data: bytes) -> None:
+    """Writes a file aside and moves it in place, readers never see it half written"""
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
@@ -1,4 +1,6 @@
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
 # Get the directory where this script is located
@@ -6,9 +8,154 @@ script_dir = Path(__file__).parent
 # Connect to database.db in the same directory as this script
 URI = script_dir / 'database.db'
 
+# (path, size, mtime_ns, inode) -> hash, lets unchanged files skip hashing
+STAT_TABLE = """
+    CREATE TABLE IF NOT EXISTS file_stats(
+    filepath TEXT PRIMARY KEY,
+    size INT,
+    mtime_ns INT,
+    inode INT,
+    file_hash TEXT
+    )
+"""
+
+# Definitions found in the indexed files, for exact lookups by name
+SYMBOL_TABLE = """
+    CREATE TABLE IF NOT EXISTS symbols(
+    filepath TEXT,
+    name TEXT COLLATE NOCASE,
+    qualified_name TEXT,
+    kind TEXT,
+    parent TEXT,
+    start_line INT,
+    end_line INT
+    )
+"""
+SYMBOL_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_symbol_name ON symbols(name)",
+    "CREATE INDEX IF NOT EXISTS idx_symbol_filepath ON symbols(filepath)",
+]
+
+# Chunks of each indexed file, written in the same transaction as its docs row.
+# A file's chunks are found here and deleted from the vector store by primary key, without scanning it
+CHUNK_TABLE = """
+    CREATE TABLE IF NOT EXISTS chunks(
+    id TEXT PRIMARY KEY,
+    doc_id TEXT,
+    start_index INT,
+    length INT,
+    chunk_hash TEXT
+    )
+"""
+CHUNK_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_chunk_doc ON chunks(doc_id)",
+]
+
+# Full-text (BM25) index of every chunk in the vector store, rowids come from get_chunk_rowid
+CHUNK_FTS_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    text,
+    id UNINDEXED,
+    source UNINDEXED,
+    content_type UNINDEXED,
+    language UNINDEXED
+    )
+"""
+
+# Counters describing the index, e.g. its generation, bumped by every write so cached search results expire
+INDEX_STATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS index_state(
+    key TEXT PRIMARY KEY,
+    value INT
+    )
+"""
+
+# Applied to every connection to database.db. WAL lets readers (searches, the agent's checkpointer, `perpetua ask`)
+# run while a commit writes, and NORMAL sync only fsyncs at checkpoints, which WAL keeps safe against crashes.
+# busy_timeout makes a second writer wait for the first instead of failing with "database is locked".
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+]
+
+# Prepared statements each connection keeps, keyed by their SQL text
+CACHED_STATEMENTS = 256
+
+# Idle connections kept per database by the pool
+POOL_SIZE = 4
+
+def connect(URI, check_same_thread: bool = True) -> sqlite3.Connection:
+    """Opens a connection to a Perpetua database with the PRAGMAS applied.
+    Statements are prepared once per connection and reused, so queries should keep the same SQL text
+    and pass their values as parameters."""
+    conn = sqlite3.connect(URI, check_same_thread=check_same_thread, cached_statements=CACHED_STATEMENTS)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+class ConnectionPool:
+    """Connections to one database, shared by the threads of a process.
+    A connection is used by one thread at a time, and is kept open for the next one when it is released,
+    so short reads do not pay for opening the database and preparing their statements again.
+
+    Args:
+    URI: the database
+    size: idle connections kept, the pool opens more when they are all in use
+    """
+
+    def __init__(self, URI, size: int = POOL_SIZE):
+        self.URI = str(URI)
+        self.size = size
+        self.idle: list[sqlite3.Connection] = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+        if conn is None:
+            conn = connect(self.URI, check_same_thread=False)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self.lock:
+                if len(self.idle) < self.size:
+                    self.idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def close(self) -> None:
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def pooled_connection(URI):
+    """Context manager lending a connection to a database from the process' pool, e.g.
+    `with pooled_connection(sql_URI) as conn: ...`. Uncommitted changes are rolled back when it is returned."""
+    with _pools_lock:
+        pool = _pools.setdefault(str(URI), ConnectionPool(URI))
+    return pool.connection()
+
+def close_pool(URI) -> None:
+    """Closes the idle pooled connections to a database, e.g. before it is deleted"""
+    with _pools_lock:
+        pool = _pools.pop(str(URI), None)
+    if pool:
+        pool.close()
+
 class DBManager:
     def __init__(self, URI): 
-        self.conn = sqlite3.connect(URI)
+        self.conn = connect(URI)
         self.cur = self.conn.cursor()
 
     def create_doc_table(self):
@@ -23,6 +170,15 @@ class DBManager:
         """)
         self.cur.execute("CREATE INDEX IF NOT EXISTS idx_filepath ON docs(filepath)")
         self.cur.execute("CREATE INDEX IF NOT EXISTS idx_file_hash ON docs(file_hash)")
+        self.cur.execute(STAT_TABLE)
+        self.cur.execute(SYMBOL_TABLE)
+        for index in SYMBOL_INDEXES:
+            self.cur.execute(index)
+        self.cur.execute(CHUNK_TABLE)
+        for index in CHUNK_INDEXES:
+            self.cur.execute(index)
+        self.cur.execute(CHUNK_FTS_TABLE)
+        self.cur.execute(INDEX_STATE_TABLE)
         self.conn.commit()
 
     def drop_doc_table(self):
@@ -32,6 +188,13 @@ class DBManager:
         print("Table 'docs' dropped successfully")
     
     def reset(self):
-        self.cur.execute("DELETE FROM docs")
-        self.conn.commit()
-        print(f"Deleted {self.cur.rowcount} rows")
+        """Deletes every indexed file from each per-file table, in one transaction"""
+        # databases created before some of these tables existed
+        for table in (CHUNK_TABLE, CHUNK_FTS_TABLE, SYMBOL_TABLE, STAT_TABLE):
+            self.cur.execute(table)
+        with self.conn:
+            self.cur.execute("DELETE FROM docs")
+            deleted = self.cur.rowcount
+            for table in ("chunks", "chunks_fts", "symbols", "file_stats"):
+                self.cur.execute(f"DELETE FROM {table}")
+        print(f"Deleted {deleted} rows")
@@ -0,0 +1,156 @@
+#Staging index, records what `perpetua add` staged for the next commit
+import json
+import os
+import sqlite3
+
+from .utils import walk_files, get_file_hash
+from .setup_db import pooled_connection
+
+INDEX_FILE = "index.json"
+INDEX_VERSION = 1
+
+# SQLite caps the number of host parameters in a single statement
+MAX_SQL_VARIABLES = 900
+
+class StagingIndex:
+    """Git-like index of the staged files, kept in .rag/index.json.
+
+    Each entry maps a path relative to the project root to the file's size, mtime and inode when it was
+    staged, and its hash when the stat cache already knows it. Nothing is copied: staging is metadata only
+    and commit reads staged files from the working tree. Directories are expanded when added, skipping
+    RepoGraph.EXCLUDED_DIRS.
+
+    Args:
+    rag_path: the directory containing the .rag directory
+    """
+
+    def __init__(self, rag_path: str):
+        self.rag_path = rag_path
+        self.path = rag_path + "/.rag/" + INDEX_FILE
+        self.entries: dict[str, dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION:
+                raise ValueError(f"Unsupported staging index version {data.get('version')} in {self.path}")
+            self.entries = data["entries"]
+
+    def relative(self, path: str) -> str:
+        """Path relative to the project root, raises ValueError for paths outside of it"""
+        relative = os.path.relpath(os.path.abspath(path), self.rag_path)
+        if relative == ".." or relative.startswith("../"):
+            raise ValueError(f"{path} is outside of the Perpetua project {self.rag_path}")
+        return relative
+
+    def absolute(self, relative: str) -> str:
+        return self.rag_path + "/" + relative
+
+    def add(self, path: str) -> int:
+        """Stages a file, or every file under a directory.
+
+        Returns: the number of files staged
+        """
+        if os.path.isdir(path):
+            files = list(walk_files(os.path.abspath(path)))
+        elif os.path.isfile(path):
+            files = [os.path.abspath(path)]
+        else:
+            raise FileNotFoundError(f"{path} does not exist")
+        stats = {file: os.stat(file) for file in files}
+        known_hashes = self.get_cached_hashes(stats)
+        for file, stat in stats.items():
+            self.entries[self.relative(file)] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "ino": stat.st_ino,
+                "hash": known_hashes.get(file),
+            }
+        return len(files)
+
+    def remove(self, path: str) -> int:
+        """Unstages a file, or every staged file under a directory.
+
+        Returns: the number of files unstaged
+        """
+        relative = self.relative(path)
+        removed = [entry for entry in self.entries if relative == "." or entry == relative or entry.startswith(relative + "/")]
+        for entry in removed:
+            del self.entries[entry]
+        return len(removed)
+
+    def clear(self) -> int:
+        count = len(self.entries)
+        self.entries = {}
+        return count
+
+    def is_modified(self, relative: str) -> bool:
+        """Whether a staged file was changed or deleted since it was staged"""
+        entry = self.entries[relative]
+        try:
+            stat = os.stat(self.absolute(relative))
+        except FileNotFoundError:
+            return True
+        return (stat.st_size, stat.st_mtime_ns, stat.st_ino) != (entry["size"], entry["mtime_ns"], entry["ino"])
+
+    def get_cached_hashes(self, stats: dict[str, os.stat_result]) -> dict:
+        """Hashes the stat cache in database.db holds for files that did not change since they were hashed"""
+        database = self.rag_path + "/.rag/database.db"
+        if not stats or not os.path.exists(database):
+            return {}
+        files = list(stats)
+        cached = {}
+        with pooled_connection(database) as conn:
+            try:
+                for i in range(0, len(files), MAX_SQL_VARIABLES):
+                    batch = files[i:i + MAX_SQL_VARIABLES]
+                    placeholders = ", ".join("?" for unused in batch)
+                    rows = conn.execute(
+                        f"SELECT filepath, size, mtime_ns, inode, file_hash FROM file_stats WHERE filepath IN ({placeholders})", batch
+                    ).fetchall()
+                    for path, size, mtime_ns, inode, file_hash in rows:
+                        stat = stats[path]
+                        if (stat.st_size, stat.st_mtime_ns, stat.st_ino) == (size, mtime_ns, inode):
+                            cached[path] = file_hash
+            except sqlite3.OperationalError:
+                # database predates the stat cache
+                pass
+        return cached
+
+    def get_indexed_hashes(self, files: list[str]) -> dict:
+        """Hashes the files had when they were last committed, for the files in the index"""
+        database = self.rag_path + "/.rag/database.db"
+        if not files or not os.path.exists(database):
+            return {}
+        indexed = {}
+        with pooled_connection(database) as conn:
+            for i in range(0, len(files), MAX_SQL_VARIABLES):
+                batch = files[i:i + MAX_SQL_VARIABLES]
+                placeholders = ", ".join("?" for unused in batch)
+                indexed.update(conn.execute(f"SELECT filepath, file_hash FROM docs WHERE filepath IN ({placeholders})", batch).fetchall())
+        return indexed
+
+    def get_file_hashes(self, files: list[str]) -> dict:
+        """Current hashes of files, only reading the ones the stat cache does not know in their current state.
+        Hashes that had to be computed are recorded in the stat cache for the next commit."""
+        stats = {file: os.stat(file) for file in files}
+        hashes = self.get_cached_hashes(stats)
+        fresh = [(file, get_file_hash(file)) for file in files if file not in hashes]
+        database = self.rag_path + "/.rag/database.db"
+        if fresh and os.path.exists(database):
+            with pooled_connection(database) as conn:
+                try:
+                    conn.executemany("INSERT OR REPLACE INTO file_stats VALUES (?, ?, ?, ?, ?)", [
+                        (file, stats[file].st_size, stats[file].st_mtime_ns, stats[file].st_ino, file_hash) for file, file_hash in fresh
+                    ])
+                    conn.commit()
+                except sqlite3.OperationalError:
+                    # database predates the stat cache
+                    pass
+        hashes.update(fresh)
+        return hashes
+
+    def save(self) -> None:
+        """Writes the index, replacing the previous one atomically"""
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"version": INDEX_VERSION, "entries": self.entries}, f)
+        os.replace(self.path + ".tmp", self.path)
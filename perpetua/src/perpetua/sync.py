@@ -0,0 +1,79 @@
+import json
+import os
+import subprocess
+
+from .utils import EXCLUDED_DIRS
+
+SYNC_FILE = "sync.json"
+
+def is_excluded(path: str) -> bool:
+    """ Whether a path lies inside one of the directories the repo graph ignores, .rag included """
+    return any(part in EXCLUDED_DIRS for part in path.split("/")[:-1])
+
+def git(cwd: str, *args: str) -> str:
+    """Runs a git command in cwd and returns its output"""
+    result = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} failed: {result.stderr.strip()}")
+    return result.stdout
+
+def read_sync_state(rag_path: str) -> dict:
+    """ Reads the commit SHA and locally modified files recorded by the last sync """
+    try:
+        with open(rag_path + "/.rag/" + SYNC_FILE, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def write_sync_state(rag_path: str, sha: str, dirty: list[str]) -> None:
+    with open(rag_path + "/.rag/" + SYNC_FILE, "w") as f:
+        json.dump({"sha": sha, "dirty": dirty}, f)
+
+def get_head(rag_path: str) -> str:
+    return git(rag_path, "rev-parse", "HEAD").strip()
+
+def get_dirty_files(rag_path: str) -> list[str]:
+    """ Tracked files whose working tree content differs from HEAD """
+    return sorted(path for path in git(rag_path, "diff", "--name-only", "-z", "--relative", "HEAD").split("\0") if path)
+
+def get_changes(rag_path: str, state: dict) -> tuple[set[str], set[str], list[tuple[str, str]]]:
+    """ Works out what changed in the working tree since the last sync.
+
+    Args:
+        rag_path (str): the directory containing the .rag directory. Paths are relative to it.
+        state (dict): the state recorded by the last sync, empty if there was none.
+
+    Returns:
+        the files to (re)index, the files to delete and the (old, new) pairs of renamed files.
+    """
+    if not state.get("sha"):
+        tracked = {path for path in git(rag_path, "ls-files", "-z").split("\0") if path and not is_excluded(path)}
+        # tracked files deleted from the working tree are not indexed
+        missing = {path for path in tracked if not os.path.exists(os.path.join(rag_path, path))}
+        return tracked - missing, missing, []
+
+    changed, deleted, renamed = set(state.get("dirty", [])), set(), []
+    fields = git(rag_path, "diff", "--name-status", "-M", "-z", "--relative", state["sha"]).split("\0")
+    i = 0
+    while i < len(fields) - 1:
+        status = fields[i]
+        if status.startswith("R"):
+            old, new = fields[i + 1], fields[i + 2]
+            renamed.append((old, new))
+            # the content may have changed as well, indexing only re-embeds the chunks that did
+            changed.add(new)
+            i += 3
+        elif status.startswith("C"):
+            changed.add(fields[i + 2])
+            i += 3
+        elif status.startswith("D"):
+            deleted.add(fields[i + 1])
+            i += 2
+        else:
+            changed.add(fields[i + 1])
+            i += 2
+    changed = {path for path in changed - deleted if not is_excluded(path)}
+    deleted |= {path for path in changed if not os.path.exists(os.path.join(rag_path, path))}
+    changed -= deleted
+    renamed = [(old, new) for old, new in renamed if not is_excluded(old) and not is_excluded(new)]
+    return changed, deleted, renamed
@@ -1,15 +1,16 @@
+import hashlib
 import os
 
 from pathlib import Path
 
-from dotenv import load_dotenv
-
-from .repo_graph import RepoGraph
+# Imported by every command: heavy modules (networkx, dotenv) are imported by the functions that use them
 
 HOME_DIR = str(Path.home())
 
 def load_env():
     """ Loads environment from config directory """
+    from dotenv import load_dotenv
+
     if os.path.exists(HOME_DIR + "/perpetua/.env"):
         load_dotenv(HOME_DIR + "/perpetua/.env")
     else:
@@ -38,19 +39,90 @@ def find_rag_directory(current_dir: str) -> str:
         _rag_dirs[current_dir] = dir
     return ""
 
+# Directories never indexed nor drawn in the repo graph, RepoGraph.EXCLUDED_DIRS
+EXCLUDED_DIRS = [".git", ".rag", "__pycache__", ".DS_Store", "dist", "build", "env", "venv", "pytest_cache", ".pytest_cache"]
+
+def walk_dirs(root: str):
+    """Yields root and every directory under it, skipping EXCLUDED_DIRS"""
+    yield root
+    try:
+        entries = list(os.scandir(root))
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False) and entry.name not in EXCLUDED_DIRS:
+            yield from walk_dirs(entry.path)
+
+def walk_files(root: str):
+    """Yields every file under root, skipping EXCLUDED_DIRS"""
+    for directory in walk_dirs(root):
+        try:
+            entries = list(os.scandir(directory))
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                yield entry.path
+
+# Files are hashed in blocks of this size instead of being read whole
+HASH_BLOCK_SIZE = 1 << 20
+
+def get_bytes_hash(data: bytes) -> str:
+    """Hash of a file's content already in memory, equal to get_file_hash of that file"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def get_file_hash(file_path) -> str:
+    """Hash for change detection"""
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def get_stat_key(file_path) -> tuple[int, int, int]:
+    """(size, mtime_ns, inode) of a file. If it did not change, neither did the file's hash."""
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
 def create_repo_structure_doc() -> str:
-    """ Creates a JSON in the .rag directory that keeps track of the repo structure.
+    """ Creates the repo graph in the .rag directory that keeps track of the repo structure, and its rendered tree.
     
     Returns: 
         string representation of absolute path to this file
     """
 
+    from .repo_graph import RepoGraph
+
     rag_dir = find_rag_directory(os.getcwd())
 
     graph = RepoGraph(rag_dir)
 
     return graph.save_graph(rag_dir + "/.rag/")
 
+def update_repo_structure_doc(added=(), removed=(), renamed=()) -> str:
+    """ Applies changed paths to the repo structure saved in the .rag directory, only writing what changed.
+    Builds it again when it was never saved or cannot be read.
+
+    Args:
+        added: files or directories created or modified, absolute or relative to the project root.
+        removed: files or directories deleted.
+        renamed: (old path, new path) pairs.
+
+    Returns:
+        string representation of absolute path to this file
+    """
+
+    from .repo_graph import RepoGraph
+
+    rag_dir = find_rag_directory(os.getcwd())
+
+    try:
+        graph = RepoGraph.load_graph(rag_dir + "/.rag/")
+    except (OSError, ValueError, KeyError, TypeError):
+        return create_repo_structure_doc()
+    graph.apply_changes(added, removed, renamed)
+    return graph.save_changes(rag_dir + "/.rag/")
+
 
 MSGS = ([r"""
     ____  ______ ____  ____  ______ ______ __  __    ___ 
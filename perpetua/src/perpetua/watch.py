@@ -0,0 +1,190 @@
+#Watches the project tree for saved, created, moved and deleted files
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+from .repo_graph import RepoGraph
+from .utils import EXCLUDED_DIRS, walk_dirs, walk_files
+
+# inotify(7) event flags
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+DEFAULT_DEBOUNCE = 0.5
+# A burst of saves never delays indexing by more than this
+MAX_DELAY = 5.0
+POLL_INTERVAL = 1.0
+
+class InotifyWatcher:
+    """Reports changed paths using Linux inotify, called through ctypes so nothing needs to be installed.
+    Each directory of the tree gets a watch, directories created or moved in later are watched as they appear.
+
+    Args:
+    root: the directory to watch
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs: dict[int, str] = {}
+        self.add_watches(root)
+
+    def add_watches(self, root: str) -> None:
+        for directory in walk_dirs(root):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                if directory == self.root:
+                    raise OSError(ctypes.get_errno(), f"Cannot watch {directory}")
+                # removed before we got to it, or over the max_user_watches limit
+                continue
+            self.dirs[wd] = directory
+
+    def read(self, timeout: float) -> set[str]:
+        """Waits up to timeout seconds and returns the paths that changed.
+        A directory is returned when it was created, moved or deleted as a whole."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        paths = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return paths
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0"))
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # the kernel dropped events, anything may have changed
+                    paths.update(walk_files(self.root))
+                    continue
+                if mask & IN_IGNORED:
+                    self.dirs.pop(wd, None)
+                    continue
+                directory = self.dirs.get(wd)
+                if directory is None or not name:
+                    continue
+                if mask & IN_ISDIR and name in EXCLUDED_DIRS:
+                    continue
+                path = directory + "/" + name
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_watches(path)
+                paths.add(path)
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Reports changed paths by rescanning the tree and comparing sizes and modification times.
+    Used where inotify is not available.
+
+    Args:
+    root: the directory to watch
+    interval: seconds between scans
+    """
+
+    def __init__(self, root: str, interval: float = POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self) -> dict[str, tuple[int, int] | None]:
+        """Maps every file to its (size, mtime_ns) and every directory to None"""
+        snapshot = {}
+        for directory in walk_dirs(self.root):
+            snapshot[directory] = None
+            try:
+                entries = list(os.scandir(directory))
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                continue
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def read(self, timeout: float) -> set[str]:
+        time.sleep(min(timeout, self.interval))
+        snapshot = self.scan()
+        paths = {path for path, stat in snapshot.items() if path not in self.snapshot or (stat and self.snapshot[path] != stat)}
+        paths |= self.snapshot.keys() - snapshot.keys()
+        self.snapshot = snapshot
+        return paths
+
+    def close(self) -> None:
+        pass
+
+def make_watcher(root: str, poll: bool = False):
+    """Returns an InotifyWatcher, or a PollingWatcher if polling was asked for or inotify is unavailable"""
+    if not poll:
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError):
+            # AttributeError: the C library has no inotify, i.e. this is not Linux
+            pass
+    return PollingWatcher(root)
+
+def debounced(watcher, debounce: float = DEFAULT_DEBOUNCE, max_delay: float = MAX_DELAY):
+    """Groups the paths reported by a watcher into bursts.
+    A burst is yielded once no new change arrived for debounce seconds, or max_delay seconds after it started."""
+    pending = set()
+    first = last = 0.0
+    while True:
+        paths = watcher.read(debounce if pending else POLL_INTERVAL)
+        now = time.monotonic()
+        if paths:
+            if not pending:
+                first = now
+            pending |= paths
+            last = now
+        if pending and (now - last >= debounce or now - first >= max_delay):
+            yield pending
+            pending = set()
+
+def split_changes(paths: set[str], graph: RepoGraph) -> tuple[set[str], set[str], bool]:
+    """Applies changed paths to the repo graph and works out what to index.
+
+    Args:
+        paths (set[str]): absolute paths reported by a watcher.
+        graph (RepoGraph): the graph of the repository, updated in place.
+
+    Returns:
+        the files to (re)index, the files to delete and whether the structure of the graph changed.
+    """
+    changed, deleted, structure_changed = set(), set(), False
+    for path in sorted(paths):
+        relative = os.path.relpath(path, graph.path)
+        if relative.startswith("..") or any(part in EXCLUDED_DIRS for part in relative.split("/")):
+            continue
+        if os.path.isfile(path):
+            changed.add(path)
+            structure_changed |= graph.add_path(path)
+        elif os.path.isdir(path):
+            changed.update(walk_files(path))
+            structure_changed |= graph.add_path(path)
+        else:
+            removed = graph.remove_path(path)
+            deleted.update(removed)
+            structure_changed |= bool(removed)
+    return changed - deleted, deleted, structure_changed
@@ -32,7 +32,6 @@ def initialized_project(temp_dir):
         # Create .rag directory structure manually to avoid API calls
         rag_dir = Path(temp_dir) / ".rag"
         rag_dir.mkdir()
-        (rag_dir / "staging").mkdir()
         
         # Create threads.txt
         import uuid
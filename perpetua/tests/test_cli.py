@@ -1,5 +1,6 @@
 """Unit tests for CLI commands."""
 import os
+import json
 import shutil
 import pytest
 from pathlib import Path
@@ -34,7 +35,8 @@ class TestInit:
                         
                         assert result.exit_code == 0
                         assert (Path(temp_dir) / ".rag").exists()
-                        assert (Path(temp_dir) / ".rag" / "staging").exists()
+                        # staging is recorded in .rag/index.json, nothing is copied
+                        assert not (Path(temp_dir) / ".rag" / "staging").exists()
                         assert (Path(temp_dir) / ".rag" / "threads.txt").exists()
                         mock_db_instance.create_doc_table.assert_called_once()
         finally:
@@ -140,31 +142,47 @@ class TestAdd:
             os.chdir(original_cwd)
     
     def test_add_file_initialized(self, runner, initialized_project, sample_file):
-        """Test add copies file to staging area."""
+        """Test add records the file in the staging index."""
         original_cwd = os.getcwd()
         try:
             os.chdir(initialized_project)
             result = runner.invoke(app, ["add", sample_file])
             assert result.exit_code == 0
             
-            staging_path = Path(initialized_project) / ".rag" / "staging" / "test_file.txt"
-            assert staging_path.exists()
-            assert staging_path.read_text() == "This is a test file.\nIt has multiple lines."
+            index = json.loads((Path(initialized_project) / ".rag" / "index.json").read_text())
+            assert list(index["entries"]) == ["test_file.txt"]
+            assert index["entries"]["test_file.txt"]["size"] == os.path.getsize(sample_file)
+            assert not (Path(initialized_project) / ".rag" / "staging").exists()
         finally:
             os.chdir(original_cwd)
     
     def test_add_directory_initialized(self, runner, initialized_project, sample_directory):
-        """Test add copies directory contents to staging area."""
+        """Test add records every file of a directory in the staging index."""
         original_cwd = os.getcwd()
         try:
             os.chdir(initialized_project)
             result = runner.invoke(app, ["add", sample_directory])
             assert result.exit_code == 0
             
-            staging_dir = Path(initialized_project) / ".rag" / "staging"
-            # Check that files from directory were copied
-            files = list(staging_dir.glob("file_*.txt"))
-            assert len(files) == 3
+            index = json.loads((Path(initialized_project) / ".rag" / "index.json").read_text())
+            assert sorted(index["entries"]) == [f"test_dir/file_{i}.txt" for i in range(3)]
+        finally:
+            os.chdir(original_cwd)
+
+    def test_add_same_name_in_different_directories(self, runner, initialized_project):
+        """Test files with the same name in different directories do not overwrite each other."""
+        original_cwd = os.getcwd()
+        try:
+            os.chdir(initialized_project)
+            for package in ("a", "b"):
+                (Path(initialized_project) / package).mkdir()
+                (Path(initialized_project) / package / "utils.py").write_text(f"NAME = {package!r}")
+            
+            result = runner.invoke(app, ["add", "."])
+            assert result.exit_code == 0
+            
+            index = json.loads((Path(initialized_project) / ".rag" / "index.json").read_text())
+            assert {"a/utils.py", "b/utils.py"} <= set(index["entries"])
         finally:
             os.chdir(original_cwd)
     
@@ -183,9 +201,9 @@ class TestAdd:
             result = runner.invoke(app, ["add", str(test_dir)])
             assert result.exit_code == 0
             
-            staging_dir = Path(initialized_project) / ".rag" / "staging"
+            index = json.loads((Path(initialized_project) / ".rag" / "index.json").read_text())
             # .git files should not be in staging
-            assert not any(".git" in str(f) for f in staging_dir.iterdir())
+            assert not any(".git" in entry for entry in index["entries"])
         finally:
             os.chdir(original_cwd)
 
@@ -208,13 +226,16 @@ class TestRm:
         original_cwd = os.getcwd()
         try:
             os.chdir(initialized_project)
-            staging_dir = Path(initialized_project) / ".rag" / "staging"
-            test_file = staging_dir / "test.txt"
+            test_file = Path(initialized_project) / "test.txt"
             test_file.write_text("test content")
+            runner.invoke(app, ["add", "test.txt"])
             
             result = runner.invoke(app, ["rm", "test.txt"])
             assert result.exit_code == 0
-            assert not test_file.exists()
+            # unstaged, the file itself is left alone
+            assert test_file.exists()
+            index = json.loads((Path(initialized_project) / ".rag" / "index.json").read_text())
+            assert index["entries"] == {}
         finally:
             os.chdir(original_cwd)
 
@@ -237,14 +258,15 @@ class TestReset:
         original_cwd = os.getcwd()
         try:
             os.chdir(initialized_project)
-            staging_dir = Path(initialized_project) / ".rag" / "staging"
             # Add some files to staging
-            (staging_dir / "file1.txt").write_text("content1")
-            (staging_dir / "file2.txt").write_text("content2")
+            (Path(initialized_project) / "file1.txt").write_text("content1")
+            (Path(initialized_project) / "file2.txt").write_text("content2")
+            runner.invoke(app, ["add", "."])
             
             result = runner.invoke(app, ["reset"])
             assert result.exit_code == 0
-            assert len(list(staging_dir.iterdir())) == 0
+            index = json.loads((Path(initialized_project) / ".rag" / "index.json").read_text())
+            assert index["entries"] == {}
         finally:
             os.chdir(original_cwd)
     
@@ -301,8 +323,8 @@ class TestDiff:
         original_cwd = os.getcwd()
         try:
             os.chdir(initialized_project)
-            staging_dir = Path(initialized_project) / ".rag" / "staging"
-            (staging_dir / "test.txt").write_text("test content")
+            (Path(initialized_project) / "test.txt").write_text("test content")
+            runner.invoke(app, ["add", "test.txt"])
             
             with patch('localrag.app.RAGStore') as mock_rag_class:
                 mock_rag = MagicMock()
@@ -335,8 +357,8 @@ class TestCommit:
         original_cwd = os.getcwd()
         try:
             os.chdir(initialized_project)
-            staging_dir = Path(initialized_project) / ".rag" / "staging"
-            (staging_dir / "test.txt").write_text("test content")
+            (Path(initialized_project) / "test.txt").write_text("test content")
+            runner.invoke(app, ["add", "test.txt"])
             
             with patch('localrag.app.RAGStore') as mock_rag_class:
                 mock_rag = MagicMock()
@@ -346,8 +368,11 @@ class TestCommit:
                 result = runner.invoke(app, ["commit"])
                 assert result.exit_code == 0
                 mock_rag.add_documents_batch.assert_called_once()
+                # Staged files are read from the working tree
+                assert mock_rag.add_documents_batch.call_args[0][0] == [str(Path(initialized_project) / "test.txt")]
                 # Files should be removed from staging after commit
-                assert len(list(staging_dir.iterdir())) == 0
+                index = json.loads((Path(initialized_project) / ".rag" / "index.json").read_text())
+                assert index["entries"] == {}
         finally:
             os.chdir(original_cwd)
     
@@ -356,8 +381,8 @@ class TestCommit:
         original_cwd = os.getcwd()
         try:
             os.chdir(initialized_project)
-            staging_dir = Path(initialized_project) / ".rag" / "staging"
-            (staging_dir / "test.txt").write_text("test content")
+            (Path(initialized_project) / "test.txt").write_text("test content")
+            runner.invoke(app, ["add", "test.txt"])
             
             with patch('localrag.app.RAGStore') as mock_rag_class:
                 mock_rag = MagicMock()
@@ -402,9 +427,9 @@ class TestStatus:
         original_cwd = os.getcwd()
         try:
             os.chdir(initialized_project)
-            staging_dir = Path(initialized_project) / ".rag" / "staging"
-            (staging_dir / "file1.txt").write_text("content1")
-            (staging_dir / "file2.txt").write_text("content2")
+            (Path(initialized_project) / "file1.txt").write_text("content1")
+            (Path(initialized_project) / "file2.txt").write_text("content2")
+            runner.invoke(app, ["add", "."])
             
             result = runner.invoke(app, ["status"])
             assert result.exit_code == 0
@@ -0,0 +1,42 @@
+"""Unit tests for the commit journal."""
+import os
+
+from perpetua.agent.commit_journal import CommitJournal
+
+
+class TestCommitJournal:
+    """Tests for CommitJournal."""
+
+    def test_completed_commit_removes_journal(self, tmp_path):
+        """Test the journal is deleted once a commit completes."""
+        path = str(tmp_path / "journal.jsonl")
+        journal = CommitJournal(path)
+        assert not journal.resumed
+        journal.start(["a.py"])
+        journal.finish(["a.py"])
+        journal.close(completed=True)
+        assert not os.path.exists(path)
+
+    def test_interrupted_commit_is_resumed(self, tmp_path):
+        """Test files started but not done are reported after an interruption."""
+        path = str(tmp_path / "journal.jsonl")
+        journal = CommitJournal(path)
+        journal.start(["a.py", "b.py"])
+        journal.finish(["a.py"])
+        journal.close(completed=False)
+
+        resumed = CommitJournal(path)
+        assert resumed.resumed
+        assert resumed.done == {"a.py"}
+        assert resumed.interrupted() == {"b.py"}
+
+    def test_truncated_last_line_is_ignored(self, tmp_path):
+        """Test a line cut off by a crash does not break resuming."""
+        path = str(tmp_path / "journal.jsonl")
+        journal = CommitJournal(path)
+        journal.start(["a.py"])
+        journal.close(completed=False)
+        with open(path, "a") as f:
+            f.write('{"event": "done", "fil')
+
+        assert CommitJournal(path).interrupted() == {"a.py"}
@@ -0,0 +1,97 @@
+"""Unit tests for reduced-dimension and quantized embedding storage."""
+import copy
+import math
+import pytest
+from unittest.mock import MagicMock
+from langchain_core.documents import Document
+
+from perpetua.project_config import DEFAULT_CONFIG
+from perpetua.agent.compression import apply_storage_options, exact_scores, truncate
+from perpetua.agent.embedding_cache import CachedEmbeddings
+from perpetua.agent.embedding_scheduler import EmbeddingScheduler
+from perpetua.agent.retrieval import vector_search
+
+
+class TestTruncate:
+    """Tests for Matryoshka truncation."""
+
+    def test_truncated_vectors_have_unit_length(self):
+        """Test the kept components are scaled back to unit length."""
+        vector = truncate([3.0, 4.0, 12.0], 2)
+        assert vector == pytest.approx([0.6, 0.8])
+        assert math.hypot(*vector) == pytest.approx(1.0)
+
+    def test_full_dimension_is_unchanged(self):
+        """Test no dimension, or one not smaller than the vector's, keeps the vector."""
+        assert truncate([3.0, 4.0], None) == [3.0, 4.0]
+        assert truncate([3.0, 4.0], 8) == [3.0, 4.0]
+
+    def test_scheduler_truncates_and_caches_full_vectors(self, tmp_path):
+        """Test stored vectors are truncated while the cache keeps them whole for other dimensions."""
+        model = MagicMock()
+        model.embed_documents.side_effect = lambda texts: [[3.0, 4.0, 12.0] for _ in texts]
+        model.embed_query.return_value = [3.0, 4.0, 12.0]
+        cache = CachedEmbeddings(model, "model", str(tmp_path / "cache.db"))
+        scheduler = EmbeddingScheduler(model, cache=cache, batch_size=10, concurrency=1, requests_per_minute=60000, dimension=2)
+        assert scheduler.embed_documents(["a"]) == [pytest.approx([0.6, 0.8])]
+        assert scheduler.embed_query("a") == pytest.approx([0.6, 0.8])
+        assert list(cache.lookup([CachedEmbeddings.text_hash("a")]).values()) == [[3.0, 4.0, 12.0]]
+        assert cache.get_query("a") == [3.0, 4.0, 12.0]
+
+
+class TestStorageOptions:
+    """Tests for the storage options chosen at init."""
+
+    def test_int8_picks_a_quantized_index_and_rescores(self):
+        """Test int8 storage indexes 1 byte per component and ranks the top candidates again."""
+        config = apply_storage_options(copy.deepcopy(DEFAULT_CONFIG), 768, "int8")
+        assert (config["embedding"]["dimension"], config["embedding"]["quantization"]) == (768, "int8")
+        assert config["index"]["index_type"] == "IVF_SQ8"
+        assert config["search"]["rescore"] > 1
+
+    def test_hnsw_keeps_a_graph_index(self):
+        """Test an HNSW index is quantized as HNSW_SQ."""
+        config = copy.deepcopy(DEFAULT_CONFIG)
+        config["index"]["index_type"] = "HNSW"
+        assert apply_storage_options(config, None, "int8")["index"]["index_type"] == "HNSW_SQ"
+
+    def test_float_storage_keeps_the_index(self):
+        """Test no quantization leaves the default index and search."""
+        config = apply_storage_options(copy.deepcopy(DEFAULT_CONFIG), 256, "none")
+        assert config["index"] == DEFAULT_CONFIG["index"]
+        assert config["search"] == DEFAULT_CONFIG["search"]
+
+    @pytest.mark.parametrize("dimension, quantization", [(0, "none"), (None, "binary"), (None, "float16")])
+    def test_unsupported_options(self, dimension, quantization):
+        """Test invalid dimensions and vector types Milvus Lite cannot store are rejected."""
+        with pytest.raises(ValueError):
+            apply_storage_options(copy.deepcopy(DEFAULT_CONFIG), dimension, quantization)
+
+
+class TestRescoring:
+    """Tests for ranking candidates again by exact similarity."""
+
+    @pytest.mark.parametrize("metric_type, expected", [("L2", [1, 0, 2]), ("IP", [2, 1, 0]), ("COSINE", [1, 2, 0])])
+    def test_exact_scores(self, metric_type, expected):
+        """Test higher scores are closer for every metric."""
+        scores = exact_scores([1.0, 0.0], [[0.0, 1.0], [1.0, 0.1], [3.0, 1.0]], metric_type)
+        assert sorted(range(3), key=lambda i: scores[i], reverse=True) == expected
+
+    def test_vector_search_reranks_candidates(self):
+        """Test k * rescore candidates are fetched and the exact top k returned."""
+        store = MagicMock()
+        store._primary_field, store._vector_field = "uuid", "vector"
+        store.embedding_func.embed_query.return_value = [1.0, 0.0]
+        # the quantized index ranked the closest vector last
+        store.similarity_search_by_vector.return_value = [Document("far", metadata={"uuid": "a"}), Document("near", metadata={"uuid": "b"})]
+        store.client.get.return_value = [{"uuid": "a", "vector": [0.0, 1.0]}, {"uuid": "b", "vector": [1.0, 0.0]}]
+        docs = vector_search(store, "query", k=1, rescore=2, metric_type="L2")
+        assert [doc.page_content for doc in docs] == ["near"]
+        assert store.similarity_search_by_vector.call_args.kwargs["k"] == 2
+
+    def test_no_rescore_is_a_plain_search(self):
+        """Test float indexes are searched once."""
+        store = MagicMock()
+        vector_search(store, "query", k=3)
+        store.similarity_search.assert_called_once_with("query", k=3, expr=None)
+        store.client.get.assert_not_called()
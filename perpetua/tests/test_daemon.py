@@ -0,0 +1,160 @@
+"""Unit tests for the perpetua serve daemon."""
+import os
+import threading
+import time
+import pytest
+from langchain_core.documents import Document
+
+from perpetua import daemon
+
+
+@pytest.fixture
+def serving(tmp_path):
+    """Serve a Daemon for tmp_path from a thread, without opening its index."""
+    (tmp_path / ".rag").mkdir()
+    owner = daemon.Daemon(str(tmp_path))
+    owner.server = daemon._Server(daemon.socket_path(str(tmp_path)), daemon._Handler)
+    owner.server.owner = owner
+    thread = threading.Thread(target=owner.server.serve_forever, daemon=True)
+    thread.start()
+    yield owner
+    owner.server.shutdown()
+    owner.server.server_close()
+    thread.join()
+
+
+class TestSocketPath:
+    """Tests for where the daemon listens."""
+
+    def test_socket_in_rag_directory(self, tmp_path):
+        """Test the socket is kept in the project's .rag directory."""
+        if len(str(tmp_path)) > 60:
+            pytest.skip("temporary directory too long for a socket path")
+        assert daemon.socket_path(str(tmp_path)) == str(tmp_path / ".rag" / daemon.SOCKET_FILE)
+
+    def test_long_paths_use_the_temp_directory(self):
+        """Test projects too deep for a Unix socket path get a socket named after their path."""
+        path = "/" + "d" * 200
+        socket = daemon.socket_path(path)
+        assert len(socket.encode()) <= daemon.MAX_SOCKET_PATH
+        assert socket == daemon.socket_path(path + "/")
+        assert socket != daemon.socket_path(path + "e")
+
+
+class TestRequest:
+    """Tests for requests sent by the CLI."""
+
+    def test_no_daemon(self, tmp_path):
+        """Test the CLI is told to run the command itself when nothing listens."""
+        with pytest.raises(daemon.DaemonUnavailable):
+            daemon.request(str(tmp_path), "ping")
+        assert not daemon.is_running(str(tmp_path))
+
+    def test_ping(self, serving):
+        """Test a running daemon answers with its status."""
+        status = daemon.request(serving.rag_path, "ping")
+        assert status["pid"] == os.getpid()
+        assert status["store_open"] is False
+
+    def test_errors_keep_their_type(self, serving):
+        """Test failed commands raise DaemonError with the name of the exception raised in the daemon."""
+        with pytest.raises(daemon.DaemonError) as error:
+            daemon.request(serving.rag_path, "unknown")
+        assert error.value.type == "ValueError"
+        with pytest.raises(daemon.DaemonError) as error:
+            daemon.request(serving.rag_path, "search", query="q", unexpected=1)
+        assert error.value.type == "TypeError"
+
+    def test_search(self, serving, monkeypatch):
+        """Test search results are sent back as page_content and metadata."""
+        calls = []
+
+        def search(query, vs_URI, sql_URI, k, mode, filters):
+            calls.append((query, k, mode, filters))
+            return [Document("def f(): pass", metadata={"source": "a.py", "id": "1"})]
+
+        monkeypatch.setattr("perpetua.agent.retrieval.search", search)
+        result = daemon.request(serving.rag_path, "search", query="f", k=2, mode="lexical", filters={"language": ["python"]})
+        assert result == [{"page_content": "def f(): pass", "metadata": {"source": "a.py", "id": "1"}}]
+        assert calls == [("f", 2, "lexical", {"language": ["python"]})]
+
+    def test_daemon_does_not_call_itself(self, serving, monkeypatch):
+        """Test commands run inside the daemon process do not send requests to it."""
+        monkeypatch.setattr(daemon, "_serving", serving.rag_path)
+        with pytest.raises(daemon.DaemonUnavailable):
+            daemon.request(serving.rag_path, "ping")
+
+    def test_config_changes_release_the_store(self, serving, monkeypatch):
+        """Test changing the search params makes the daemon open its store again with them."""
+        from perpetua import app
+        released = []
+        monkeypatch.setattr(serving, "release_store", lambda: released.append(True))
+        monkeypatch.chdir(serving.rag_path)
+        app.index(search_param=["nprobe=32"])
+        assert released == [True]
+        app.index()
+        assert released == [True]
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+class FakeStore:
+    def __init__(self, events):
+        self.events = events
+
+    def release(self):
+        self.events.append("release")
+
+
+class TestStoreHandoff:
+    """Tests for sharing the store between requests and releasing it to other processes."""
+
+    def test_pending_release_is_not_starved(self, tmp_path, monkeypatch):
+        """Test requests arriving while a release waits are held back until it is done."""
+        from perpetua.agent.document_processing import RAGStore
+        events = []
+        owner = daemon.Daemon(str(tmp_path))
+        owner.store = FakeStore(events)
+        monkeypatch.setattr(RAGStore, "open", classmethod(lambda cls, vs_URI, sql_URI: events.append("open") or FakeStore(events)))
+
+        search_done = threading.Event()
+
+        def search():
+            with owner.using_store():
+                search_done.wait(5)
+
+        first = threading.Thread(target=search)
+        first.start()
+        wait_until(lambda: owner.users == 1)
+        release = threading.Thread(target=owner.release_store)
+        release.start()
+        wait_until(lambda: owner.releasing)
+        second = threading.Thread(target=lambda: owner.using_store().__enter__())
+        second.start()
+        second.join(0.2)
+        assert second.is_alive() and events == []
+        search_done.set()
+        for thread in (first, release, second):
+            thread.join(5)
+        assert events == ["release", "open"]
+
+    def test_store_opens_outside_the_lock(self, tmp_path, monkeypatch):
+        """Test a slow open does not hold up requests that do not need the store."""
+        from perpetua.agent.document_processing import RAGStore
+        opened = threading.Event()
+        monkeypatch.setattr(RAGStore, "open", classmethod(lambda cls, vs_URI, sql_URI: opened.wait(5) and FakeStore([])))
+        owner = daemon.Daemon(str(tmp_path))
+        opening = threading.Thread(target=owner.open_store)
+        opening.start()
+        wait_until(lambda: owner.opening)
+        assert owner.condition.acquire(timeout=1)
+        owner.condition.release()
+        assert owner.command_ping()["store_open"] is False
+        opened.set()
+        opening.join(5)
+        assert owner.store is not None and owner.users == 0
@@ -0,0 +1,349 @@
+"""Unit tests for document processing helpers."""
+import os
+import time
+import pytest
+from pathlib import Path
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from perpetua.setup_db import DBManager
+from perpetua.agent import document_processing
+from perpetua.agent.commit_journal import JOURNAL_FILE
+from perpetua.agent.document_processing import (
+    RAGStore,
+    get_bytes_hash,
+    get_chunk_hash,
+    get_file_hash,
+    get_parser,
+    get_splitter,
+    get_stat_key,
+    ingest_file,
+    split_file,
+    threaded,
+)
+
+
+@pytest.fixture
+def code_file(tmp_path):
+    """Create a small python file for testing."""
+    file_path = tmp_path / "module.py"
+    file_path.write_text("\n".join(f"def f{i}():\n    return {i}\n" for i in range(100)))
+    return str(file_path)
+
+
+class TestIngestFile:
+    """Tests for the worker used by parallel commits."""
+
+    def test_ingest_file_splits_new_file(self, code_file):
+        """Test a file that is not indexed yet is hashed and split."""
+        file_path, file_hash, splits_uuids, symbols = ingest_file((code_file, None, None, False))
+        assert file_path == code_file
+        assert file_hash == get_file_hash(code_file)
+        docs, ids = splits_uuids
+        assert len(docs) == len(ids) > 0
+        assert all(doc.metadata["source"] == code_file for doc in docs)
+        assert isinstance(symbols, list)
+
+    def test_ingest_file_skips_unchanged_file(self, code_file):
+        """Test a file whose hash is already indexed is not split again."""
+        _, _, splits_uuids, symbols = ingest_file((code_file, get_file_hash(code_file), None, False))
+        assert splits_uuids is None and symbols is None
+
+    def test_ingest_file_uses_known_hash(self, code_file):
+        """Test a hash coming from the stat cache is not computed again."""
+        file_path, file_hash, _, _ = ingest_file((code_file, None, "cached", False))
+        assert file_hash == "cached"
+
+    def test_ingest_file_matches_split_file(self, code_file):
+        """Test the worker produces the same chunks as the serial path."""
+        _, file_hash, (docs, _), _ = ingest_file((code_file, None, None, False))
+        expected, _ = split_file(Path(code_file), file_hash)
+        assert [doc.page_content for doc in docs] == [doc.page_content for doc in expected]
+
+
+class TestSplitFile:
+    """Tests for in-memory parsing and splitting."""
+
+    def test_parsers_and_splitters_are_reused(self):
+        """Test one parser and one splitter is built per language."""
+        from langchain_text_splitters import Language
+        assert get_parser(Language.PYTHON) is get_parser(Language.PYTHON)
+        assert get_splitter(Language.PYTHON) is get_splitter(Language.PYTHON)
+        assert get_splitter(None) is not get_splitter(Language.PYTHON)
+
+    def test_split_bytes_already_read(self, code_file):
+        """Test passing the file's content gives the same chunks as reading it."""
+        data = Path(code_file).read_bytes()
+        docs, ids = split_file(Path(code_file), "hash", data=data)
+        expected, expected_ids = split_file(Path(code_file), "hash")
+        assert [doc.page_content for doc in docs] == [doc.page_content for doc in expected]
+        assert ids == expected_ids
+        assert all(doc.metadata["source"] == code_file for doc in docs)
+
+    def test_split_text_file(self, tmp_path):
+        """Test text files are decoded and split without a loader."""
+        file_path = tmp_path / "notes.md"
+        file_path.write_text("# Notes\n\nnaïve café " * 200)
+        docs, _ = split_file(file_path, "hash")
+        assert len(docs) > 1
+        assert docs[0].page_content.startswith("# Notes")
+        assert all(doc.metadata["content_type"] == "text" for doc in docs)
+
+    def test_unsupported_extension(self, tmp_path):
+        file_path = tmp_path / "data.json"
+        file_path.write_text("{}")
+        with pytest.raises(ValueError):
+            split_file(file_path, "hash")
+
+
+class TestFileHash:
+    """Tests for change detection helpers."""
+
+    def test_bytes_hash_matches_file_hash(self, code_file):
+        """Test hashing bytes in memory matches hashing the file."""
+        assert get_bytes_hash(Path(code_file).read_bytes()) == get_file_hash(code_file)
+
+    def test_hash_is_computed_in_blocks(self, tmp_path, monkeypatch):
+        """Test files larger than a block hash the same as reading them whole."""
+        import hashlib
+        import perpetua.utils as utils
+        monkeypatch.setattr(utils, "HASH_BLOCK_SIZE", 7)
+        file_path = tmp_path / "big.txt"
+        file_path.write_bytes(b"0123456789" * 100)
+        assert get_file_hash(file_path) == hashlib.blake2b(b"0123456789" * 100, digest_size=16).hexdigest()
+
+    def test_stat_key_changes_on_edit(self, code_file):
+        """Test rewriting a file changes its stat key."""
+        before = get_stat_key(code_file)
+        with open(code_file, "a") as f:
+            f.write("# edit\n")
+        assert get_stat_key(code_file) != before
+
+
+class TestChunkIds:
+    """Tests for content-addressed chunk ids."""
+
+    def test_chunk_ids_are_stable(self, code_file):
+        """Test splitting the same file twice yields the same ids."""
+        _, first = split_file(Path(code_file), "hash")
+        _, second = split_file(Path(code_file), "hash")
+        assert first == second
+
+    def test_edit_only_changes_affected_chunks(self, code_file):
+        """Test a one-line edit keeps the ids of untouched chunks."""
+        docs, before = split_file(Path(code_file), "hash")
+        content = Path(code_file).read_text().replace("return 50", "return 51")
+        Path(code_file).write_text(content)
+        _, after = split_file(Path(code_file), "hash")
+        assert len(set(before) - set(after)) == 1
+        assert len(set(after) - set(before)) == 1
+
+    def test_chunk_hash_metadata(self, code_file):
+        """Test every chunk carries the hash of its own text."""
+        docs, _ = split_file(Path(code_file), "hash")
+        assert all(doc.metadata["chunk_hash"] == get_chunk_hash(doc.page_content) for doc in docs)
+
+
+class TestThreaded:
+    """Tests for the bounded-queue pipeline stages."""
+
+    def test_items_keep_their_order(self):
+        """Test a threaded stage yields every item in order."""
+        assert list(threaded(iter(range(100)))) == list(range(100))
+
+    def test_errors_reach_the_consumer(self):
+        """Test an exception raised inside a stage is re-raised downstream."""
+        def failing():
+            yield 1
+            raise RuntimeError("stage failed")
+
+        stage = threaded(failing())
+        assert next(stage) == 1
+        with pytest.raises(RuntimeError):
+            next(stage)
+
+    def test_producer_is_bounded(self):
+        """Test a stage does not run ahead of its consumer by more than the queue size."""
+        produced = []
+
+        def producer():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        stage = threaded(producer(), maxsize=2)
+        next(stage)
+        time.sleep(0.2)
+        assert len(produced) <= 4
+        stage.close()
+
+
+@pytest.fixture
+def open_store(tmp_path, monkeypatch):
+    """Opens a RAGStore embedding with a fake model in a temporary .rag directory."""
+    monkeypatch.delenv("EMBEDDING_PROVIDER", raising=False)
+    monkeypatch.delenv("LOCAL", raising=False)
+    monkeypatch.setattr(document_processing, "get_embeddings", lambda provider, model: DeterministicFakeEmbedding(size=16))
+    rag_dir = tmp_path / ".rag"
+    rag_dir.mkdir()
+    db = DBManager(str(rag_dir / "database.db"))
+    db.create_doc_table()
+    db.conn.close()
+    stores = []
+
+    def open_store():
+        if stores:
+            stores[-1].release()
+            RAGStore._instances.clear()
+        stores.append(RAGStore(vs_URI=str(rag_dir / "milvus.db"), sql_URI=str(rag_dir / "database.db")))
+        return stores[-1]
+
+    yield open_store
+    stores[-1].release()
+    RAGStore._instances.clear()
+
+
+class TestChunkTable:
+    """Tests for the chunks table kept in step with the vector store."""
+
+    def commit(self, open_store, file_paths):
+        """Commits the files and reopens the store, as each command does"""
+        open_store().add_documents_batch(file_paths, verbose=False)
+        return open_store()
+
+    def stored(self, store, field="source"):
+        """field of each chunk id in the vector store"""
+        vector_store = store.vector_store
+        rows = vector_store.client.query(vector_store.collection_name, filter="", output_fields=[field], limit=10000)
+        return {row["id"]: row[field] for row in rows}
+
+    def recorded(self, store):
+        """filepath of each chunk id in the chunks table"""
+        store.curr.execute("SELECT chunks.id, docs.filepath FROM chunks JOIN docs ON docs.id = chunks.doc_id")
+        return dict(store.curr.fetchall())
+
+    def test_commits_record_every_chunk(self, open_store, code_file):
+        """Test the chunks table lists the stored chunks after a commit and after an edit."""
+        store = self.commit(open_store, [code_file])
+        assert self.recorded(store) == self.stored(store)
+        Path(code_file).write_text(Path(code_file).read_text().replace("return 50", "return 51"))
+        store = self.commit(open_store, [code_file])
+        assert self.recorded(store) == self.stored(store)
+        texts = self.stored(store, "text")
+        store.curr.execute("SELECT id, length, chunk_hash FROM chunks")
+        assert all((length, chunk_hash) == (len(texts[id]), get_chunk_hash(texts[id])) for id, length, chunk_hash in store.curr.fetchall())
+
+    def test_quoted_paths_are_renamed_and_removed(self, open_store, tmp_path):
+        """Test files whose path holds quotes are moved and deleted by chunk id."""
+        old = tmp_path / "it's" / "notes.md"
+        old.parent.mkdir()
+        old.write_text("# Notes\n\n" + "Some text.\n" * 50)
+        store = self.commit(open_store, [str(old)])
+        new = tmp_path / "it's" / "moved \"notes\".md"
+        old.rename(new)
+        store.rename_document(str(old), str(new))
+        assert set(self.stored(store).values()) == {str(new)}
+        assert self.recorded(store) == self.stored(store)
+        store.remove_documents([str(new)])
+        assert self.stored(store) == {}
+        assert self.recorded(store) == {}
+        store.curr.execute("SELECT count(*) FROM chunks_fts")
+        assert store.curr.fetchone()[0] == 0
+
+    def interrupt(self, store, file_paths, calls=2):
+        """Commits the files in batches of two chunks, failing after calls embedding requests"""
+        store.embeddings.batch_size, store.embeddings.concurrency = 2, 1
+        embed_documents = store.embeddings.embed_documents
+        made = []
+
+        def failing(texts):
+            made.append(texts)
+            if len(made) > calls:
+                raise RuntimeError("embedding failed")
+            return embed_documents(texts)
+
+        store.embeddings.embed_documents = failing
+        with pytest.raises(RuntimeError):
+            store.add_documents_batch(file_paths, verbose=False)
+
+    def source_files(self, tmp_path, names):
+        paths = []
+        for name in names:
+            path = tmp_path / name
+            path.write_text("\n".join(f"def {name[:-3]}_{i}():\n    return {i}\n" for i in range(300)))
+            paths.append(str(path))
+        return paths
+
+    def test_interrupted_commit_is_completed(self, open_store, tmp_path):
+        """Test committing the same files again after an interruption leaves no duplicate or orphan chunks."""
+        file_paths = self.source_files(tmp_path, ["a.py", "b.py"])
+        store = open_store()
+        self.interrupt(store, file_paths)
+        assert os.path.exists(os.path.join(store.rag_dir, JOURNAL_FILE))
+        store = self.commit(open_store, file_paths)
+        assert self.recorded(store) == self.stored(store)
+        assert set(self.stored(store).values()) == set(file_paths)
+        assert not os.path.exists(os.path.join(store.rag_dir, JOURNAL_FILE))
+
+    def test_interrupted_files_left_out_of_the_next_commit(self, open_store, tmp_path):
+        """Test chunks written for files the next commit does not include are deleted."""
+        file_paths = self.source_files(tmp_path, ["a.py", "b.py", "c.py"])
+        store = open_store()
+        self.interrupt(store, file_paths[:2])
+        assert self.stored(store)
+        store = self.commit(open_store, file_paths[2:])
+        assert self.recorded(store) == self.stored(store)
+        assert set(self.stored(store).values()) == {file_paths[2]}
+
+    def test_failed_checks_leave_no_journal(self, open_store, tmp_path):
+        """Test a commit failing before it writes anything is not resumed by the next one."""
+        store = open_store()
+        with pytest.raises(FileNotFoundError):
+            store.add_documents_batch([str(tmp_path / "missing.py")], verbose=False)
+        assert not os.path.exists(os.path.join(store.rag_dir, JOURNAL_FILE))
+
+    def test_edit_only_embeds_the_changed_chunk(self, open_store, code_file):
+        """Test a one-line edit embeds one chunk, deletes the stale one and keeps the others in the vector store."""
+        store = self.commit(open_store, [code_file])
+        before = set(self.stored(store))
+        assert len(before) > 2
+        Path(code_file).write_text(Path(code_file).read_text().replace("return 50", "return 51"))
+        store = open_store()
+        embedded = []
+        embed_documents = store.embeddings.embed_documents
+        store.embeddings.embed_documents = lambda texts: embedded.extend(texts) or embed_documents(texts)
+        store.add_documents_batch([code_file], verbose=False)
+        store = open_store()
+        after = set(self.stored(store))
+        assert len(embedded) == 1 and "return 51" in embedded[0]
+        assert len(before - after) == 1 and len(after - before) == 1
+        assert len(before & after) == len(before) - 1
+
+    def test_parallel_commit_matches_serial_commit(self, open_store, tmp_path):
+        """Test committing with worker processes stores the same chunks, and records files in the same order, as one process."""
+        file_paths = self.source_files(tmp_path, ["a.py", "b.py", "c.py", "d.py"])
+        (tmp_path / "notes.md").write_text("# Notes\n\n" + "Some text.\n" * 300)
+        file_paths.append(str(tmp_path / "notes.md"))
+
+        def commit(jobs):
+            store = open_store()
+            store.add_documents_batch(file_paths, verbose=False, jobs=jobs)
+            store = open_store()
+            store.curr.execute("SELECT filepath FROM docs ORDER BY rowid")
+            docs = [path for (path,) in store.curr.fetchall()]
+            store.curr.execute("SELECT id, start_index, length, chunk_hash FROM chunks ORDER BY id")
+            chunks = store.curr.fetchall()
+            result = docs, chunks, self.stored(store, "text")
+            store.remove_documents(file_paths)
+            return result
+
+        parallel = commit(jobs=2)
+        assert parallel[0] == file_paths
+        assert parallel == commit(jobs=1)
+
+    def test_missing_table_is_filled_from_the_vector_store(self, open_store, code_file):
+        """Test indexes built before the chunks table existed get it when opened."""
+        store = self.commit(open_store, [code_file])
+        expected = self.recorded(store)
+        store.curr.execute("DROP TABLE chunks")
+        store.conn.commit()
+        assert self.recorded(open_store()) == expected
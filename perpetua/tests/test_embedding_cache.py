@@ -0,0 +1,96 @@
+"""Unit tests for the persistent embedding cache."""
+import pytest
+from unittest.mock import MagicMock
+
+from perpetua.agent import embedding_cache
+from perpetua.agent.embedding_cache import CachedEmbeddings
+
+
+@pytest.fixture
+def model():
+    """Mock embedding model returning one small vector per text."""
+    mock = MagicMock()
+    mock.embed_documents.side_effect = lambda texts: [[float(len(text)), 0.5] for text in texts]
+    mock.embed_query.side_effect = lambda text: [float(len(text)), 1.0]
+    return mock
+
+
+class TestCachedEmbeddings:
+    """Tests for CachedEmbeddings."""
+
+    def test_second_call_is_served_from_cache(self, model, tmp_path):
+        """Test already embedded texts are not sent to the model again."""
+        cache = CachedEmbeddings(model, "model", str(tmp_path / "cache.db"))
+        first = cache.embed_documents(["a", "bb"])
+        second = cache.embed_documents(["bb", "a"])
+        assert second == [first[1], first[0]]
+        assert model.embed_documents.call_count == 1
+        assert (cache.hits, cache.misses) == (2, 2)
+
+    def test_cache_persists_across_instances(self, model, tmp_path):
+        """Test vectors survive reopening the cache file."""
+        CachedEmbeddings(model, "model", str(tmp_path / "cache.db")).embed_documents(["a"])
+        cache = CachedEmbeddings(model, "model", str(tmp_path / "cache.db"))
+        cache.embed_documents(["a"])
+        assert model.embed_documents.call_count == 1
+
+    def test_cache_is_keyed_by_model(self, model, tmp_path):
+        """Test vectors from another embedding model are not reused."""
+        CachedEmbeddings(model, "model-a", str(tmp_path / "cache.db")).embed_documents(["a"])
+        CachedEmbeddings(model, "model-b", str(tmp_path / "cache.db")).embed_documents(["a"])
+        assert model.embed_documents.call_count == 2
+
+    def test_eviction_keeps_cache_under_limit(self, model, tmp_path):
+        """Test least recently used vectors are evicted past max_bytes."""
+        cache = CachedEmbeddings(model, "model", str(tmp_path / "cache.db"), max_bytes=40)
+        for text in ["a", "b", "c", "d", "e", "f"]:
+            cache.embed_documents([text])
+        assert cache.size <= 40
+        cache.embed_documents(["f"])
+        assert model.embed_documents.call_count == 6
+
+    def test_size_counts_replaced_entries_once(self, model, tmp_path):
+        """Test storing a cached vector again does not grow the recorded size."""
+        cache = CachedEmbeddings(model, "model", str(tmp_path / "cache.db"))
+        cache.store({"key": [1.0, 2.0]})
+        cache.store({"key": [1.0, 2.0]})
+        cache.store_query("q", [1.0, 2.0])
+        cache.store_query("q", [1.0, 2.0])
+        assert cache.size == cache.conn.execute("SELECT SUM(size) FROM embeddings").fetchone()[0] == 16
+
+
+class TestQueryCache:
+    """Tests for the query embedding cache."""
+
+    @pytest.fixture(autouse=True)
+    def empty_lru(self):
+        """Start each test without query vectors in memory."""
+        embedding_cache._query_vectors.clear()
+
+    def test_near_identical_queries_share_a_vector(self, model, tmp_path):
+        """Test queries differing only by whitespace are embedded once."""
+        cache = CachedEmbeddings(model, "model", str(tmp_path / "cache.db"))
+        assert cache.embed_query("where is  the config") == cache.embed_query(" where is the config\n")
+        assert model.embed_query.call_count == 1
+
+    def test_query_vectors_persist_on_disk(self, model, tmp_path):
+        """Test a query embedded by a previous process is read back from the cache file."""
+        CachedEmbeddings(model, "model", str(tmp_path / "cache.db")).embed_query("query")
+        embedding_cache._query_vectors.clear()
+        CachedEmbeddings(model, "model", str(tmp_path / "cache.db")).embed_query("query")
+        assert model.embed_query.call_count == 1
+
+    def test_queries_and_documents_are_cached_apart(self, model, tmp_path):
+        """Test a query never reuses the vector of a document with the same text."""
+        cache = CachedEmbeddings(model, "model", str(tmp_path / "cache.db"))
+        cache.embed_documents(["text"])
+        assert cache.embed_query("text") == [4.0, 1.0]
+        assert model.embed_query.call_count == 1
+
+    def test_lru_is_bounded(self, model, tmp_path, monkeypatch):
+        """Test the in-memory LRU drops the least recently used queries."""
+        monkeypatch.setattr(embedding_cache, "QUERY_LRU_SIZE", 2)
+        cache = CachedEmbeddings(model, "model", str(tmp_path / "cache.db"))
+        for query in ("a", "b", "a", "c"):
+            cache.embed_query(query)
+        assert [key[1] for key in embedding_cache._query_vectors] == [cache.text_hash("a"), cache.text_hash("c")]
@@ -0,0 +1,71 @@
+"""Unit tests for embedding providers."""
+import json
+import pytest
+
+from perpetua.project_config import load_config
+from perpetua.agent import embedding_providers
+from perpetua.agent.embedding_providers import (
+    PROVIDERS, EmbeddingModelMismatch, cache_key, check_model, get_embeddings, get_provider, request_settings,
+)
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    """Start each test without embedding settings in the environment."""
+    for name in ("EMBEDDING_PROVIDER", "LOCAL", "LOCAL_EMBD_MODEL", "EMBEDDING_BATCH_SIZE", "EMBEDDING_CONCURRENCY", "EMBEDDING_RPM"):
+        monkeypatch.delenv(name, raising=False)
+
+
+class TestProviderSelection:
+    """Tests for choosing the provider from the config .env."""
+
+    def test_gemini_by_default(self):
+        """Test projects use Gemini unless configured otherwise."""
+        assert get_provider() == ("gemini", PROVIDERS["gemini"]["model"])
+
+    def test_local_uses_the_local_embedding_model(self, monkeypatch):
+        """Test LOCAL=True embeds with Ollama and LOCAL_EMBD_MODEL."""
+        monkeypatch.setenv("LOCAL", "True")
+        monkeypatch.setenv("LOCAL_EMBD_MODEL", "mxbai-embed-large")
+        assert get_provider() == ("ollama", "mxbai-embed-large")
+
+    def test_explicit_provider(self, monkeypatch):
+        """Test EMBEDDING_PROVIDER picks the provider, with its default model."""
+        monkeypatch.setenv("EMBEDDING_PROVIDER", "local")
+        assert get_provider() == ("local", PROVIDERS["local"]["model"])
+        monkeypatch.setenv("EMBEDDING_PROVIDER", "openai")
+        with pytest.raises(ValueError):
+            get_provider()
+
+    def test_request_settings(self, monkeypatch):
+        """Test each provider has its own batch size and the .env overrides it."""
+        assert request_settings("ollama")["batch_size"] == PROVIDERS["ollama"]["batch_size"]
+        assert request_settings("local")["concurrency"] == 1
+        monkeypatch.setenv("EMBEDDING_BATCH_SIZE", "8")
+        assert request_settings("gemini")["batch_size"] == 8
+
+    def test_clients_are_reused(self, monkeypatch):
+        """Test one client per model is created in a process."""
+        monkeypatch.setattr(embedding_providers, "_models", {})
+        assert get_embeddings("ollama", "nomic-embed-text") is get_embeddings("ollama", "nomic-embed-text")
+        assert get_embeddings("ollama", "nomic-embed-text") is not get_embeddings("ollama", "all-minilm")
+
+
+class TestModelIdentity:
+    """Tests for the embedding model recorded in config.json."""
+
+    def test_projects_without_a_recorded_model_are_gemini(self, tmp_path):
+        """Test projects indexed before the model was recorded keep using Gemini."""
+        (tmp_path / "config.json").write_text(json.dumps({"index": {"index_type": "FLAT"}}))
+        check_model(load_config(str(tmp_path)), *get_provider())
+        check_model(load_config(str(tmp_path / "missing")), *get_provider())
+
+    def test_other_model_is_rejected(self, tmp_path):
+        """Test an index is not searched with vectors of another model."""
+        with pytest.raises(EmbeddingModelMismatch, match="reset --hard"):
+            check_model(load_config(str(tmp_path)), "ollama", "nomic-embed-text")
+
+    def test_cache_keys(self):
+        """Test Gemini keeps its cached vectors and providers sharing a model name do not collide."""
+        assert cache_key("gemini", PROVIDERS["gemini"]["model"]) == PROVIDERS["gemini"]["model"]
+        assert cache_key("ollama", "all-minilm") != cache_key("local", "all-minilm")
@@ -0,0 +1,98 @@
+"""Unit tests for the embedding scheduler."""
+import pytest
+from unittest.mock import MagicMock, patch
+
+from perpetua.agent.embedding_cache import CachedEmbeddings
+from perpetua.agent.embedding_scheduler import EmbeddingScheduler, TokenBucket, is_rate_limit_error
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+@pytest.fixture
+def model():
+    """Mock embedding model returning one small vector per text."""
+    mock = MagicMock()
+    mock.embed_documents.side_effect = lambda texts: [[float(len(text)), 0.5] for text in texts]
+    return mock
+
+
+class TestEmbeddingScheduler:
+    """Tests for EmbeddingScheduler."""
+
+    def test_texts_are_sent_in_batches(self, model):
+        """Test texts are split into batches and results keep their order."""
+        scheduler = EmbeddingScheduler(model, batch_size=3, concurrency=2, requests_per_minute=60000)
+        texts = ["a" * i for i in range(1, 11)]
+        vectors = scheduler.embed_documents(texts)
+        assert vectors == [[float(i), 0.5] for i in range(1, 11)]
+        assert model.embed_documents.call_count == 4
+        assert all(len(call.args[0]) <= 3 for call in model.embed_documents.call_args_list)
+
+    def test_rate_limited_batches_are_retried(self, model):
+        """Test a 429 slows the bucket down and the batch is retried."""
+        model.embed_documents.side_effect = [RateLimited("quota"), [[1.0, 0.5]]]
+        scheduler = EmbeddingScheduler(model, batch_size=10, concurrency=1, requests_per_minute=60000)
+        with patch("perpetua.agent.embedding_scheduler.time.sleep"):
+            assert scheduler.embed_documents(["a"]) == [[1.0, 0.5]]
+        assert scheduler.rate_limited == 1
+        assert scheduler.bucket.rate < scheduler.bucket.max_rate
+
+    def test_other_errors_are_raised(self, model):
+        """Test errors that are not rate limits are not retried."""
+        model.embed_documents.side_effect = ValueError("bad input")
+        scheduler = EmbeddingScheduler(model, batch_size=10, concurrency=1, requests_per_minute=60000)
+        with pytest.raises(ValueError):
+            scheduler.embed_documents(["a"])
+        assert model.embed_documents.call_count == 1
+
+    def test_finished_batches_are_cached_before_a_failure(self, model, tmp_path):
+        """Test batches embedded before an error are not lost."""
+        cache = CachedEmbeddings(model, "model", str(tmp_path / "cache.db"))
+        model.embed_documents.side_effect = [[[1.0, 0.5]], ValueError("network")]
+        scheduler = EmbeddingScheduler(model, cache=cache, batch_size=1, concurrency=1, requests_per_minute=60000)
+        with pytest.raises(ValueError):
+            scheduler.embed_documents(["a", "b"])
+        assert cache.lookup([CachedEmbeddings.text_hash("a")])
+
+
+class TestRateLimitDetection:
+    """Tests for is_rate_limit_error."""
+
+    def test_status_code(self):
+        assert is_rate_limit_error(RateLimited())
+
+    def test_gemini_message(self):
+        assert is_rate_limit_error(Exception("429 RESOURCE_EXHAUSTED: quota exceeded"))
+
+    def test_unrelated_error(self):
+        assert not is_rate_limit_error(Exception("connection reset"))
+
+    def test_exception_type(self):
+        """Test SDK exceptions meaning a 429 are recognized by their class."""
+        ResourceExhausted = type("ResourceExhausted", (Exception,), {})
+        assert is_rate_limit_error(ResourceExhausted("quota"))
+
+    def test_429_elsewhere_in_the_message(self):
+        """Test a 429 that is not a status, e.g. in a path or an id, is not a rate limit."""
+        assert not is_rate_limit_error(FileNotFoundError("/tmp/run-429/chunk.md"))
+        assert not is_rate_limit_error(Exception("batch 429 failed: connection reset"))
+        assert is_rate_limit_error(Exception("HTTP error 429: Too Many Requests"))
+
+    def test_other_status_code(self):
+        """Test an error whose status is not 429 is not a rate limit, whatever its message says."""
+        error = Exception("Client error '500' for url https://host/429")
+        error.status_code = 500
+        assert not is_rate_limit_error(error)
+
+
+class TestTokenBucket:
+    """Tests for TokenBucket."""
+
+    def test_slow_down_counts_once_per_burst(self):
+        """Test concurrent 429s only halve the rate once."""
+        bucket = TokenBucket(10, 4)
+        bucket.slow_down()
+        bucket.slow_down()
+        assert bucket.rate == 5
@@ -0,0 +1,70 @@
+"""Unit tests for search filters."""
+import sqlite3
+from datetime import datetime, timedelta
+import pytest
+
+from perpetua.agent.filters import filters_key, make_filters, to_milvus_expr, to_sql_condition
+
+
+class TestMakeFilters:
+    """Tests for validating filters."""
+
+    def test_empty_values_filter_nothing(self):
+        """Test unset and empty filters are dropped."""
+        assert make_filters("", None, ".", "") == {}
+        assert to_milvus_expr({}, "/project") is None
+
+    def test_languages(self):
+        """Test languages can be given as a list or comma separated."""
+        assert make_filters(["Python,go", "rust"])["language"] == ["go", "python", "rust"]
+
+    def test_relative_time(self):
+        """Test indexed_after accepts relative times and ISO dates."""
+        after = datetime.fromisoformat(make_filters(indexed_after="2d")["indexed_after"])
+        assert abs(after - (datetime.now() - timedelta(days=2))) < timedelta(minutes=1)
+        assert make_filters(indexed_after="2024-05-01")["indexed_after"] == "2024-05-01T00:00:00"
+
+    @pytest.mark.parametrize("kwargs", [{"content_type": "binary"}, {"indexed_after": "yesterday"}, {"path": "src/[ab]"}])
+    def test_invalid_values(self, kwargs):
+        """Test invalid filters are rejected."""
+        with pytest.raises(ValueError):
+            make_filters(**kwargs)
+
+    def test_cache_key_is_hashable(self):
+        """Test equal filters give equal cache keys."""
+        assert hash(filters_key(make_filters("go,python"))) == hash(filters_key(make_filters(["python", "go"])))
+
+
+class TestTranslation:
+    """Tests for Milvus expressions and SQL conditions."""
+
+    def test_milvus_expression(self):
+        """Test every filter becomes a condition of the expression."""
+        expr = to_milvus_expr(make_filters("python", "code", "src", "2024-05-01"), "/project")
+        assert expr == (
+            'language in ["python"] and content_type == "code" and source like "/project/src%" '
+            'and indexed_at >= "2024-05-01T00:00:00"'
+        )
+
+    def test_like_wildcards_in_paths_are_literal(self):
+        """Test _ and % in a path prefix are escaped in the LIKE pattern."""
+        assert to_milvus_expr(make_filters(path="src/my_mod/"), "/p") == r'source like "/p/src/my\\_mod%"'
+
+    def test_glob(self):
+        """Test globs match files directly in the directory of a ** too."""
+        assert to_milvus_expr(make_filters(path="./src/**/*.py"), "/p") == 'source like "/p/src/%.py"'
+
+    def test_sql_condition_selects_rows(self):
+        """Test the SQL condition matches the same paths as the Milvus expression."""
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE chunks (source TEXT, language TEXT, content_type TEXT)")
+        conn.execute("CREATE TABLE docs (filepath TEXT, last_indexed TEXT)")
+        sources = ["/p/src/my_mod/a.py", "/p/src/mymod/b.py", "/p/SRC/my_mod/c.py", "/p/src/my_mod/d.md"]
+        conn.executemany("INSERT INTO chunks VALUES (?, 'python', 'code')", [(source,) for source in sources])
+        conn.executemany("INSERT INTO docs VALUES (?, ?)", [(sources[0], "2024-01-01"), (sources[3], "2025-01-01")])
+        def select(**kwargs):
+            condition, params = to_sql_condition(make_filters(**kwargs), "/p")
+            return [row[0] for row in conn.execute(f"SELECT source FROM chunks WHERE {condition}", params)]
+        assert select(path="src/my_mod") == [sources[0], sources[3]]
+        assert select(path="src/*.py") == sources[:2]
+        assert select(path="src/my_mod", indexed_after="2024-06-01") == [sources[3]]
@@ -0,0 +1,154 @@
+"""Unit tests for the local HTTP/JSON API."""
+import http.client
+import json
+import threading
+from types import SimpleNamespace
+import pytest
+from langchain_core.documents import Document
+
+from perpetua.http_api import APIServer, LatencyStats, parse_head
+from perpetua.setup_db import DBManager, SYMBOL_TABLE
+
+
+class FakeDaemon:
+    """The parts of daemon.Daemon the API uses, with searches answered from memory."""
+
+    def __init__(self, rag_path):
+        self.rag_path = str(rag_path)
+        self.sql_URI = self.rag_path + "/.rag/database.db"
+        self.searches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def search(self, query, k, mode, filters):
+        self.searches.append((query, k, mode, filters))
+        self.release.wait(5)
+        return [Document(f"result for {query}", metadata={"source": self.rag_path + "/a.py"})]
+
+
+@pytest.fixture
+def api(tmp_path):
+    """Serve the API of a project with two indexed files and one symbol on a free port."""
+    (tmp_path / ".rag").mkdir()
+    db = DBManager(str(tmp_path / ".rag" / "database.db"))
+    db.create_doc_table()
+    db.cur.executemany(
+        "INSERT INTO docs VALUES (?, ?, 'hash', 2, '2025-01-01')",
+        [("1", str(tmp_path / "src" / "a.py")), ("2", str(tmp_path / "docs" / "b.md"))],
+    )
+    db.cur.execute(SYMBOL_TABLE)
+    db.cur.execute(
+        "INSERT INTO symbols (filepath, name, qualified_name, kind, parent, start_line, end_line) VALUES (?, 'run', 'Job.run', 'method', 'Job', 3, 9)",
+        (str(tmp_path / "src" / "a.py"),),
+    )
+    db.conn.commit()
+    db.conn.close()
+    server = APIServer(FakeDaemon(tmp_path), port=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def request(api, method, path, body=None, host="127.0.0.1"):
+    conn = http.client.HTTPConnection(api.host, api.port, timeout=10)
+    conn.request(method, path, body=body, headers={"Host": host})
+    response = conn.getresponse()
+    payload = json.loads(response.read())
+    conn.close()
+    return response, payload
+
+
+class TestEndpoints:
+    """Tests for the routes of the API."""
+
+    def test_search(self, api):
+        """Test query parameters become search arguments and filters."""
+        response, payload = request(api, "GET", "/search?q=parse+config&k=2&mode=lexical&language=python&path=src")
+        assert response.status == 200
+        assert payload["results"][0]["page_content"] == "result for parse config"
+        assert api.daemon.searches == [("parse config", 2, "lexical", {"language": ["python"], "path": "src"})]
+
+    def test_search_json_body(self, api):
+        """Test POST /search takes its parameters as a JSON object."""
+        response, _ = request(api, "POST", "/search", json.dumps({"q": "x", "content_type": "code"}))
+        assert response.status == 200
+        assert api.daemon.searches == [("x", 4, "hybrid", {"content_type": "code"})]
+
+    def test_invalid_search(self, api):
+        """Test missing queries and invalid filters are client errors."""
+        assert request(api, "GET", "/search")[0].status == 400
+        response, payload = request(api, "GET", "/search?q=x&content_type=binary")
+        assert response.status == 400
+        assert "Unknown content type" in payload["error"]
+        assert api.daemon.searches == []
+
+    def test_symbols(self, api):
+        """Test definitions are returned with paths relative to the project."""
+        _, payload = request(api, "GET", "/symbols?name=Job.run")
+        assert payload["symbols"] == [{"name": "Job.run", "kind": "method", "path": "src/a.py", "start_line": 3, "end_line": 9}]
+
+    def test_files(self, api):
+        """Test the docs table is listed, optionally under a path."""
+        _, payload = request(api, "GET", "/files")
+        assert [file["path"] for file in payload["files"]] == ["docs/b.md", "src/a.py"]
+        _, payload = request(api, "GET", "/files?path=src")
+        assert [file["path"] for file in payload["files"]] == ["src/a.py"]
+
+    def test_errors(self, api):
+        """Test unknown endpoints, methods and non-local Host headers are refused."""
+        assert request(api, "GET", "/unknown")[0].status == 404
+        assert request(api, "DELETE", "/files")[0].status == 405
+        assert request(api, "GET", "/files", host="example.com")[0].status == 421
+
+
+class TestServer:
+    """Tests for concurrency and latency reporting."""
+
+    def test_only_localhost(self):
+        """Test the API refuses to listen on other interfaces."""
+        with pytest.raises(ValueError):
+            APIServer(SimpleNamespace(), host="0.0.0.0")
+
+    def test_slow_search_does_not_block_other_requests(self, api):
+        """Test requests are answered while a search is still running."""
+        api.daemon.release.clear()
+        search = threading.Thread(target=request, args=(api, "GET", "/search?q=slow"))
+        search.start()
+        response, _ = request(api, "GET", "/symbols?name=run")
+        assert response.status == 200
+        assert search.is_alive()
+        api.daemon.release.set()
+        search.join()
+
+    def test_latency_is_reported(self, api):
+        """Test responses carry their duration and /stats counts requests per endpoint."""
+        response, _ = request(api, "GET", "/files")
+        assert response.getheader("Server-Timing").startswith("app;dur=")
+        request(api, "GET", "/files?path=nothing/here")
+        request(api, "GET", "/search")
+        _, stats = request(api, "GET", "/stats")
+        assert stats["/files"]["count"] == 2
+        assert stats["/search"]["errors"] == 1
+        assert set(stats["/files"]) == {"count", "errors", "mean_ms", "p50_ms", "p95_ms", "max_ms"}
+
+
+class TestHelpers:
+    """Tests for request parsing and latency percentiles."""
+
+    def test_parse_head(self):
+        """Test header names are lowercased and versions other than HTTP/1.x rejected."""
+        method, target, headers = parse_head(b"GET /tree HTTP/1.1\r\nHost: localhost\r\nContent-Length: 0\r\n\r\n")
+        assert (method, target, headers) == ("GET", "/tree", {"host": "localhost", "content-length": "0"})
+        with pytest.raises(ValueError):
+            parse_head(b"GET /tree HTTP/2\r\n\r\n")
+
+    def test_percentiles(self):
+        """Test percentiles are taken over the recent requests only."""
+        stats = LatencyStats(samples=10)
+        for ms in [1000] + list(range(1, 11)):
+            stats.record("/search", ms / 1000, 200)
+        snapshot = stats.snapshot()["/search"]
+        assert snapshot["count"] == 11
+        assert snapshot["max_ms"] == 1000
+        assert snapshot["p50_ms"] == 6
+        assert snapshot["p95_ms"] == 10
@@ -0,0 +1,169 @@
+"""Unit tests for the repo graph and its incremental updates."""
+import json
+import os
+import networkx as nx
+import pytest
+
+from perpetua import repo_graph
+from perpetua.repo_graph import DELTA_FILE, FORMAT_VERSION, GRAPH_FILE, HEADER, LEGACY_GRAPH_FILE, TREE_FILE, Node, RepoGraph
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Create a project tree with a nested package, a README and a .rag directory."""
+    (tmp_path / "pkg" / "sub").mkdir(parents=True)
+    (tmp_path / "pkg" / "a.py").write_text("a = 1\n")
+    (tmp_path / "pkg" / "sub" / "b.py").write_text("b = 2\n")
+    (tmp_path / "README.md").write_text("# readme\n")
+    (tmp_path / ".rag").mkdir()
+    return str(tmp_path)
+
+
+def edges(graph):
+    return {(parent.path, child.path, child.is_file, child.is_dir) for parent, child in graph.G.edges}
+
+
+class TestCreateGraph:
+    """Tests for building the graph from disk."""
+
+    def test_excluded_directories(self, tree):
+        """Test files and directories are linked to their parent and excluded directories are left out."""
+        graph = RepoGraph(tree)
+        assert edges(graph) == {
+            (tree, tree + "/pkg", False, True),
+            (tree, tree + "/README.md", True, False),
+            (tree + "/pkg", tree + "/pkg/a.py", True, False),
+            (tree + "/pkg", tree + "/pkg/sub", False, True),
+            (tree + "/pkg/sub", tree + "/pkg/sub/b.py", True, False),
+        }
+
+    def test_entries_are_not_stat_again(self, tree, monkeypatch):
+        """Test file types come from the directory listing."""
+        def fail(path):
+            raise AssertionError(f"{path} was looked up again")
+        monkeypatch.setattr(repo_graph.os.path, "isfile", fail)
+        monkeypatch.setattr(repo_graph.os.path, "isdir", fail)
+        assert len(RepoGraph(tree).G) == 6
+
+
+class TestApplyChanges:
+    """Tests for updating the graph with changed paths."""
+
+    def test_added_removed_and_renamed_paths(self, tree):
+        """Test the updated graph matches a graph built again from disk."""
+        graph = RepoGraph(tree)
+        os.makedirs(tree + "/lib/deep")
+        open(tree + "/lib/deep/c.py", "w").close()
+        os.remove(tree + "/pkg/a.py")
+        os.rename(tree + "/README.md", tree + "/README.rst")
+        assert graph.apply_changes(added=["lib/deep/c.py", "pkg/sub/b.py"], removed=[tree + "/pkg/a.py"], renamed=[("README.md", "README.rst")])
+        assert edges(graph) == edges(RepoGraph(tree))
+
+    def test_emptied_directories_are_removed(self, tree):
+        """Test directories deleted along with their last file leave the graph."""
+        graph = RepoGraph(tree)
+        os.remove(tree + "/pkg/sub/b.py")
+        os.rmdir(tree + "/pkg/sub")
+        graph.apply_changes(removed=["pkg/sub/b.py"])
+        assert Node("sub", tree + "/pkg/sub") not in graph.G
+        assert Node("pkg", tree + "/pkg") in graph.G
+
+    def test_unchanged_structure(self, tree):
+        """Test modified files and excluded paths leave the graph as it was."""
+        graph = RepoGraph(tree)
+        open(tree + "/.rag/database.db", "w").close()
+        assert not graph.apply_changes(added=["pkg/a.py", ".rag/database.db"])
+        assert graph.changes == []
+
+
+class TestPersistence:
+    """Tests for saving the graph and the changes made to it."""
+
+    def test_round_trip(self, tree):
+        """Test a saved graph loads with its nodes, their types and its root."""
+        RepoGraph(tree).save_graph(tree + "/.rag/")
+        loaded = RepoGraph.load_graph(tree + "/.rag/")
+        assert loaded.path == tree
+        assert edges(loaded) == edges(RepoGraph(tree))
+
+    def test_only_changes_are_written(self, tree, monkeypatch):
+        """Test saving changes appends them to the delta and leaves the graph file as it was."""
+        monkeypatch.setattr(repo_graph, "COMPACT_RATIO", 10)
+        RepoGraph(tree).save_graph(tree + "/.rag/")
+        saved = open(tree + "/.rag/" + GRAPH_FILE, "rb").read()
+        graph = RepoGraph.load_graph(tree + "/.rag/")
+        os.makedirs(tree + "/lib")
+        open(tree + "/lib/c.py", "w").close()
+        os.remove(tree + "/pkg/a.py")
+        graph.apply_changes(added=["lib/c.py"], removed=["pkg/a.py"])
+        graph.save_changes(tree + "/.rag/")
+        assert open(tree + "/.rag/" + GRAPH_FILE, "rb").read() == saved
+        delta = [json.loads(line) for line in open(tree + "/.rag/" + DELTA_FILE)]
+        assert delta == [["+", tree + "/lib", True], ["+", tree + "/lib/c.py", False], ["-", tree + "/pkg/a.py"]]
+        assert edges(RepoGraph.load_graph(tree + "/.rag/")) == edges(RepoGraph(tree))
+
+    def test_large_deltas_are_compacted(self, tree):
+        """Test the graph file is written again once the delta outgrows the graph."""
+        RepoGraph(tree).save_graph(tree + "/.rag/")
+        graph = RepoGraph.load_graph(tree + "/.rag/")
+        for i in range(5):
+            open(f"{tree}/pkg/new{i}.py", "w").close()
+        graph.apply_changes(added=[f"pkg/new{i}.py" for i in range(5)])
+        graph.save_changes(tree + "/.rag/")
+        assert not os.path.exists(tree + "/.rag/" + DELTA_FILE)
+        assert edges(RepoGraph.load_graph(tree + "/.rag/")) == edges(RepoGraph(tree))
+
+    def test_node_link_json_graph(self, tree):
+        """Test graphs saved as node-link JSON by earlier versions, without their root, are read and replaced."""
+        data = nx.node_link_data(RepoGraph(tree).G)
+        json.dump(data, open(tree + "/.rag/" + LEGACY_GRAPH_FILE, "w"), default=lambda obj: obj.to_json())
+        graph = RepoGraph.load_graph(tree + "/.rag/")
+        assert graph.path == tree
+        assert edges(graph) == edges(RepoGraph(tree))
+        graph.save_changes(tree + "/.rag/")
+        assert sorted(os.listdir(tree + "/.rag")) == sorted([GRAPH_FILE, TREE_FILE])
+
+    def test_unreadable_graph_files(self, tree):
+        """Test other format versions and truncated files are refused."""
+        RepoGraph(tree).save_graph(tree + "/.rag/")
+        data = open(tree + "/.rag/" + GRAPH_FILE, "rb").read()
+        for broken in (data[:-3], data[:4] + HEADER.pack(b"PRGB", FORMAT_VERSION + 1, 0, 0)[4:] + data[HEADER.size:]):
+            open(tree + "/.rag/" + GRAPH_FILE, "wb").write(broken)
+            with pytest.raises(ValueError):
+                RepoGraph.load_graph(tree + "/.rag/")
+
+
+class TestTree:
+    """Tests for the rendered tree."""
+
+    def test_same_text_as_networkx(self, tree):
+        """Test the tree is rendered the way networkx renders the graph."""
+        os.makedirs(tree + "/pkg/sub/deeper")
+        open(tree + "/pkg/sub/deeper/c.py", "w").close()
+        graph = RepoGraph(tree)
+        assert graph.to_tree() == "\n".join(nx.generate_network_text(graph.G))
+
+    def test_tree_is_saved_with_the_graph(self, tree, monkeypatch):
+        """Test saving the graph or its changes renders the tree the agent reads."""
+        monkeypatch.setattr(repo_graph, "COMPACT_RATIO", 10)
+        RepoGraph(tree).save_graph(tree + "/.rag/")
+        assert "b.py" in RepoGraph.read_tree(tree + "/.rag/")
+        graph = RepoGraph.load_graph(tree + "/.rag/")
+        open(tree + "/pkg/new.py", "w").close()
+        graph.apply_changes(added=["pkg/new.py"])
+        graph.save_changes(tree + "/.rag/")
+        assert RepoGraph.read_tree(tree + "/.rag/") == graph.to_tree()
+        assert "new.py" in graph.to_tree()
+
+    def test_missing_tree_is_rendered(self, tree):
+        """Test graphs saved without a tree get one on first read."""
+        RepoGraph(tree).save_graph(tree + "/.rag/")
+        os.remove(tree + "/.rag/" + TREE_FILE)
+        assert RepoGraph.read_tree(tree + "/.rag/") == RepoGraph(tree).to_tree()
+        assert os.path.exists(tree + "/.rag/" + TREE_FILE)
+
+    def test_missing_graph_is_built(self, tree):
+        """Test projects that never saved a graph get one, with its tree, on first read."""
+        assert RepoGraph.read_tree(tree + "/.rag/") == RepoGraph(tree).to_tree()
+        assert os.path.exists(tree + "/.rag/" + GRAPH_FILE)
+        assert os.path.exists(tree + "/.rag/" + TREE_FILE)
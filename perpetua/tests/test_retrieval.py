@@ -0,0 +1,133 @@
+"""Unit tests for lexical and hybrid retrieval."""
+import sqlite3
+import uuid
+import pytest
+from langchain_core.documents import Document
+
+from perpetua.agent.document_processing import get_chunk_rowid
+from perpetua.agent import retrieval
+from perpetua.agent.filters import make_filters
+from perpetua.agent.retrieval import get_generation, lexical_search, reciprocal_rank_fusion, search, to_match_query
+from perpetua.setup_db import CHUNK_FTS_TABLE, INDEX_STATE_TABLE
+
+CHUNKS = [
+    ("def get_file_hash(file_path):\n    return blake2b(file_path)", "utils.py", "code", "python"),
+    ("The staging index lives in .rag/index.json", "README.md", "text", "text"),
+    ("raise ValueError(\"Unsupported file extension\")", "split.py", "code", "python"),
+]
+
+
+@pytest.fixture
+def sql_URI(tmp_path):
+    """Create a database whose full-text index holds a few chunks."""
+    path = str(tmp_path / "database.db")
+    conn = sqlite3.connect(path)
+    conn.execute(CHUNK_FTS_TABLE)
+    for text, source, content_type, language in CHUNKS:
+        id = str(uuid.uuid4())
+        conn.execute(
+            "INSERT INTO chunks_fts (rowid, text, id, source, content_type, language) VALUES (?, ?, ?, ?, ?, ?)",
+            (get_chunk_rowid(id), text, id, source, content_type, language),
+        )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def doc(id):
+    return Document(page_content=id, metadata={"uuid": id})
+
+
+class TestLexicalSearch:
+    """Tests for the full-text index."""
+
+    def test_to_match_query_quotes_terms(self):
+        """Test punctuation and FTS5 syntax in a query are searched as plain text."""
+        assert to_match_query('get_file_hash("x") OR NOT') == '"get_file_hash" OR "x" OR "OR" OR "NOT"'
+        assert to_match_query("?!") == ""
+
+    def test_identifier_search(self, sql_URI):
+        """Test an identifier finds the chunk defining it first."""
+        conn = sqlite3.connect(sql_URI)
+        docs = lexical_search(conn, "get_file_hash", k=3)
+        assert docs[0].metadata["source"] == "utils.py"
+        assert docs[0].metadata["language"] == "python"
+
+    def test_error_string_search(self, sql_URI):
+        """Test an error message is matched literally."""
+        conn = sqlite3.connect(sql_URI)
+        docs = lexical_search(conn, 'Unsupported file extension', k=1)
+        assert [doc.metadata["source"] for doc in docs] == ["split.py"]
+
+    def test_lexical_mode_needs_no_vector_store(self, sql_URI, tmp_path):
+        """Test lexical mode only reads the SQLite database."""
+        docs = search("index.json", str(tmp_path / "missing-milvus.db"), sql_URI, k=2, mode="lexical")
+        assert docs[0].metadata["source"] == "README.md"
+
+    def test_filters(self, sql_URI):
+        """Test filters restrict the matching chunks."""
+        conn = sqlite3.connect(sql_URI)
+        assert [doc.metadata["source"] for doc in lexical_search(conn, "index file", k=3, filters=make_filters(content_type="text"))] == ["README.md"]
+        assert lexical_search(conn, "index", k=3, filters=make_filters(language="python")) == []
+
+    def test_unknown_mode(self, sql_URI):
+        """Test an unknown mode is rejected."""
+        with pytest.raises(ValueError):
+            search("query", "", sql_URI, mode="fuzzy")
+
+    def test_chunk_rowid_is_signed_64_bit(self):
+        """Test rowids fit SQLite integers and are stable."""
+        for _ in range(100):
+            id = str(uuid.uuid4())
+            assert -(1 << 63) <= get_chunk_rowid(id) < (1 << 63)
+            assert get_chunk_rowid(id) == get_chunk_rowid(id)
+
+
+class TestReciprocalRankFusion:
+    """Tests for reciprocal_rank_fusion."""
+
+    def test_chunks_in_both_lists_come_first(self):
+        """Test a chunk ranked by both searches beats chunks ranked first by only one."""
+        fused = reciprocal_rank_fusion([[doc("a"), doc("b")], [doc("c"), doc("b")]], k=3)
+        assert [d.page_content for d in fused] == ["b", "a", "c"]
+
+    def test_limit(self):
+        """Test at most k chunks are returned."""
+        assert len(reciprocal_rank_fusion([[doc("a"), doc("b")], [doc("c")]], k=2)) == 2
+
+
+class TestResultCache:
+    """Tests for the search result cache."""
+
+    @pytest.fixture(autouse=True)
+    def empty_cache(self):
+        """Start each test without cached results."""
+        retrieval._results.clear()
+
+    def bump(self, sql_URI):
+        conn = sqlite3.connect(sql_URI)
+        conn.execute(INDEX_STATE_TABLE)
+        conn.execute("INSERT INTO index_state (key, value) VALUES ('generation', 1) ON CONFLICT(key) DO UPDATE SET value = value + 1")
+        conn.commit()
+        conn.close()
+
+    def test_repeated_query_is_cached(self, sql_URI, monkeypatch):
+        """Test a repeated query does not search again."""
+        first = search("index  json", "", sql_URI, k=2, mode="lexical")
+        monkeypatch.setattr(retrieval, "lexical_search", lambda *args: pytest.fail("searched again"))
+        assert search(" index json", "", sql_URI, k=2, mode="lexical") == first
+
+    def test_write_to_the_index_expires_results(self, sql_URI):
+        """Test results cached before a write are not served after it."""
+        search("index json", "", sql_URI, k=2, mode="lexical")
+        conn = sqlite3.connect(sql_URI)
+        conn.execute("DELETE FROM chunks_fts")
+        conn.commit()
+        conn.close()
+        self.bump(sql_URI)
+        assert get_generation(sqlite3.connect(sql_URI)) == 1
+        assert search("index json", "", sql_URI, k=2, mode="lexical") == []
+
+    def test_generation_of_an_older_index(self, sql_URI):
+        """Test indexes without an index_state table are at generation 0."""
+        assert get_generation(sqlite3.connect(sql_URI)) == 0
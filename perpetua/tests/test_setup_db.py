@@ -0,0 +1,89 @@
+"""Unit tests for the database connection layer."""
+import threading
+
+from perpetua.setup_db import ConnectionPool, DBManager, connect, pooled_connection
+
+
+class TestConnect:
+    """Tests for the pragmas applied to every connection."""
+
+    def test_wal_mode(self, tmp_path):
+        """Test databases are switched to write-ahead logging."""
+        conn = connect(str(tmp_path / "database.db"))
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+        conn.close()
+
+    def test_reads_do_not_wait_for_a_commit(self, tmp_path):
+        """Test a reader sees the last committed rows while a writer holds an open transaction."""
+        path = str(tmp_path / "database.db")
+        db = DBManager(path)
+        db.create_doc_table()
+        db.cur.execute("INSERT INTO docs (id, filepath) VALUES ('1', 'a.py')")
+        db.conn.commit()
+        db.cur.execute("INSERT INTO docs (id, filepath) VALUES ('2', 'b.py')")
+        with pooled_connection(path) as conn:
+            assert conn.execute("SELECT filepath FROM docs").fetchall() == [("a.py",)]
+        db.conn.commit()
+        db.conn.close()
+
+
+class TestConnectionPool:
+    """Tests for connections shared by the threads of a process."""
+
+    def test_connections_are_reused(self, tmp_path):
+        """Test a released connection is lent again, by any thread."""
+        pool = ConnectionPool(str(tmp_path / "database.db"))
+        with pool.connection() as conn:
+            first = conn
+        lent = []
+
+        def borrow():
+            with pool.connection() as conn:
+                conn.execute("SELECT 1")
+                lent.append(conn)
+
+        thread = threading.Thread(target=borrow)
+        thread.start()
+        thread.join()
+        assert lent == [first]
+        pool.close()
+
+    def test_concurrent_users_get_their_own_connection(self, tmp_path):
+        """Test a connection is never lent twice at once and only size of them are kept."""
+        pool = ConnectionPool(str(tmp_path / "database.db"), size=1)
+        with pool.connection() as first, pool.connection() as second:
+            assert first is not second
+        assert len(pool.idle) == 1
+        pool.close()
+
+    def test_uncommitted_changes_are_rolled_back(self, tmp_path):
+        """Test a connection goes back to the pool without an open transaction."""
+        pool = ConnectionPool(str(tmp_path / "database.db"))
+        with pool.connection() as conn:
+            conn.execute("CREATE TABLE t(x INT)")
+            conn.execute("INSERT INTO t VALUES (1)")
+        with pool.connection() as conn:
+            assert not conn.in_transaction
+            assert conn.execute("SELECT count(*) FROM t").fetchone()[0] == 0
+        pool.close()
+
+
+class TestReset:
+    """Tests for DBManager.reset."""
+
+    def test_every_per_file_table_is_cleared(self, tmp_path, capsys):
+        """Test indexed files leave the docs, chunks, full-text, symbols and stat tables, and docs are counted."""
+        db = DBManager(str(tmp_path / "database.db"))
+        db.create_doc_table()
+        db.cur.executemany("INSERT INTO docs VALUES (?, ?, 'hash', 1, '2025-01-01')", [("1", "a.py"), ("2", "b.py")])
+        db.cur.executemany("INSERT INTO chunks VALUES (?, '1', 0, 1, 'hash')", [("c1",), ("c2",), ("c3",)])
+        db.cur.execute("INSERT INTO chunks_fts (text, id, source, content_type) VALUES ('def a', 'c1', 'a.py', 'code')")
+        db.cur.execute("INSERT INTO symbols (filepath, name) VALUES ('a.py', 'a')")
+        db.cur.execute("INSERT INTO file_stats VALUES ('a.py', 1, 1, 1, 'hash')")
+        db.conn.commit()
+        db.reset()
+        for table in ("docs", "chunks", "chunks_fts", "symbols", "file_stats"):
+            assert db.cur.execute(f"SELECT count(*) FROM {table}").fetchone()[0] == 0
+        assert "Deleted 2 rows" in capsys.readouterr().out
+        db.conn.close()
@@ -0,0 +1,75 @@
+"""Unit tests for the staging index."""
+import os
+import sqlite3
+import pytest
+
+from perpetua.setup_db import STAT_TABLE
+from perpetua.staging import StagingIndex
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Create a project with two packages holding files of the same name."""
+    for package in ("a", "b"):
+        (tmp_path / package).mkdir()
+        (tmp_path / package / "__init__.py").write_text(f"NAME = {package!r}\n")
+    (tmp_path / "venv").mkdir()
+    (tmp_path / "venv" / "site.py").write_text("")
+    (tmp_path / ".rag").mkdir()
+    return str(tmp_path)
+
+
+class TestStagingIndex:
+    """Tests for StagingIndex."""
+
+    def test_add_directory(self, project):
+        """Test files with the same name in different directories get their own entries."""
+        index = StagingIndex(project)
+        assert index.add(project) == 2
+        index.save()
+
+        entries = StagingIndex(project).entries
+        assert set(entries) == {"a/__init__.py", "b/__init__.py"}
+        assert entries["a/__init__.py"]["size"] == os.path.getsize(project + "/a/__init__.py")
+        assert not os.path.exists(project + "/.rag/staging")
+
+    def test_add_uses_stat_cache(self, project):
+        """Test the hash is recorded when the stat cache already knows it."""
+        path = project + "/a/__init__.py"
+        stat = os.stat(path)
+        conn = sqlite3.connect(project + "/.rag/database.db")
+        conn.execute(STAT_TABLE)
+        conn.execute("INSERT INTO file_stats VALUES (?, ?, ?, ?, ?)", (path, stat.st_size, stat.st_mtime_ns, stat.st_ino, "cafe"))
+        conn.commit()
+        conn.close()
+
+        index = StagingIndex(project)
+        index.add(project)
+        assert index.entries["a/__init__.py"]["hash"] == "cafe"
+        assert index.entries["b/__init__.py"]["hash"] is None
+
+    def test_remove(self, project):
+        """Test unstaging a file or a directory."""
+        index = StagingIndex(project)
+        index.add(project)
+        assert index.remove(project + "/a") == 1
+        assert index.remove(project + "/a/__init__.py") == 0
+        assert set(index.entries) == {"b/__init__.py"}
+
+    def test_is_modified(self, project):
+        """Test edits and deletions after staging are noticed."""
+        index = StagingIndex(project)
+        index.add(project)
+        assert not index.is_modified("a/__init__.py")
+        with open(project + "/a/__init__.py", "a") as f:
+            f.write("# edit\n")
+        os.remove(project + "/b/__init__.py")
+        assert index.is_modified("a/__init__.py")
+        assert index.is_modified("b/__init__.py")
+
+    def test_paths_outside_project(self, project, tmp_path_factory):
+        """Test files outside of the project cannot be staged."""
+        outside = tmp_path_factory.mktemp("outside") / "c.py"
+        outside.write_text("")
+        with pytest.raises(ValueError):
+            StagingIndex(project).add(str(outside))
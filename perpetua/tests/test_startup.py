@@ -0,0 +1,62 @@
+"""Startup budget of the metadata-only commands."""
+import json
+import subprocess
+import sys
+import pytest
+
+from perpetua.setup_db import DBManager
+from perpetua.staging import StagingIndex
+
+# Commands that only read .rag metadata must not import these
+HEAVY_MODULES = (
+    "langchain", "langchain_core", "langchain_community", "langchain_milvus", "langchain_google_genai",
+    "langchain_ollama", "langgraph", "pymilvus", "grpc", "numpy", "networkx", "dotenv",
+)
+
+# Generous, a cold start of these commands imports about 230 modules in well under 0.2s
+MAX_MODULES = 350
+MAX_SECONDS = 1.5
+
+RUN_COMMAND = """
+import json, sys, time
+start = time.perf_counter()
+from perpetua.app import app
+sys.argv = ["perpetua", *json.loads(sys.argv[1])]
+try:
+    app()
+except SystemExit:
+    pass
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}), file=sys.stderr)
+"""
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Create a Perpetua project with one committed and one staged file."""
+    (tmp_path / ".rag").mkdir()
+    db = DBManager(str(tmp_path / ".rag" / "database.db"))
+    db.create_doc_table()
+    db.cur.execute("INSERT INTO docs VALUES ('1', ?, 'hash', 1, '2025-01-01')", (str(tmp_path / "main.py"),))
+    db.conn.commit()
+    db.conn.close()
+    (tmp_path / "main.py").write_text("print('hello')\n")
+    index = StagingIndex(str(tmp_path))
+    index.add(str(tmp_path / "main.py"))
+    index.save()
+    return tmp_path
+
+
+class TestStartup:
+    """Tests for the cold start of metadata-only commands."""
+
+    @pytest.mark.parametrize("command", [["status"], ["ls"], ["diff"], ["rm", "main.py"], ["reset"], ["index"]])
+    def test_metadata_commands_stay_light(self, project, command):
+        """Test the command imports no LLM or vector store module and starts within the budget."""
+        result = subprocess.run(
+            [sys.executable, "-c", RUN_COMMAND, json.dumps(command)], cwd=project, capture_output=True, text=True, timeout=60,
+        )
+        report = json.loads(result.stderr.strip().splitlines()[-1])
+        heavy = sorted({module.split(".")[0] for module in report["modules"]} & set(HEAVY_MODULES))
+        assert heavy == []
+        assert len(report["modules"]) <= MAX_MODULES
+        assert report["seconds"] <= MAX_SECONDS
@@ -0,0 +1,97 @@
+"""Unit tests for symbol extraction and lookup."""
+import sqlite3
+import pytest
+
+from perpetua.agent.symbols import extract_symbols, format_symbols, get_symbol_parser, lookup_symbols
+from perpetua.setup_db import SYMBOL_TABLE, SYMBOL_INDEXES
+
+pytestmark = pytest.mark.skipif(get_symbol_parser("python") is None, reason="tree-sitter-languages is not installed")
+
+PYTHON_SOURCE = b'''
+class Store:
+    def add(self, doc):
+        def helper():
+            pass
+        return helper
+
+def add(a, b):
+    return a + b
+'''
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """Create a symbols table holding the symbols of a python file."""
+    file_path = tmp_path / "store.py"
+    file_path.write_bytes(PYTHON_SOURCE)
+    conn = sqlite3.connect(str(tmp_path / "database.db"))
+    conn.execute(SYMBOL_TABLE)
+    for index in SYMBOL_INDEXES:
+        conn.execute(index)
+    conn.executemany(
+        "INSERT INTO symbols (filepath, name, qualified_name, kind, parent, start_line, end_line) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(str(file_path), *symbol) for symbol in extract_symbols(".py", PYTHON_SOURCE)],
+    )
+    yield conn
+    conn.close()
+
+
+class TestExtractSymbols:
+    """Tests for extract_symbols."""
+
+    def test_python_definitions(self):
+        """Test classes, methods, nested functions and functions are found with their lines."""
+        symbols = extract_symbols(".py", PYTHON_SOURCE)
+        assert symbols == [
+            ("Store", "Store", "class", None, 2, 6),
+            ("add", "Store.add", "method", "Store", 3, 6),
+            ("helper", "Store.add.helper", "function", "Store.add", 4, 5),
+            ("add", "add", "function", None, 8, 9),
+        ]
+
+    def test_out_of_line_cpp_method(self):
+        """Test a C++ method defined outside of its class gets the class as parent."""
+        symbols = extract_symbols(".cpp", b"class A { void m(); };\nvoid A::m() {}\n")
+        assert ("m", "A.m", "method", "A", 2, 2) in symbols
+
+    def test_go_method_receiver(self):
+        """Test a go method is attached to its receiver type."""
+        symbols = extract_symbols(".go", b"package p\ntype T struct{}\nfunc (t *T) Run() {}\n")
+        assert ("Run", "T.Run", "method", "T", 3, 3) in symbols
+
+    def test_unsupported_extension(self):
+        """Test files without a grammar have no symbols."""
+        assert extract_symbols(".txt", b"def f(): pass") == []
+
+
+class TestLookupSymbols:
+    """Tests for lookup_symbols."""
+
+    def test_lookup_by_name(self, conn):
+        """Test every definition with the name is returned."""
+        rows = lookup_symbols(conn, "add")
+        assert [row[0] for row in rows] == ["Store.add", "add"]
+
+    def test_lookup_by_qualified_name(self, conn):
+        """Test a qualified name only matches definitions in that parent."""
+        rows = lookup_symbols(conn, "Store.add")
+        assert [(row[0], row[1], row[3], row[4]) for row in rows] == [("Store.add", "method", 3, 6)]
+
+    def test_lookup_prefers_same_case(self, conn):
+        """Test a different case only matches when nothing matches exactly."""
+        assert [row[0] for row in lookup_symbols(conn, "store")] == ["Store"]
+        assert lookup_symbols(conn, "missing") == []
+
+    def test_format_symbols_includes_source(self, conn):
+        """Test the formatted lookup shows the definition's code."""
+        text = format_symbols(lookup_symbols(conn, "Store.add"))
+        assert "method Store.add" in text
+        assert "def add(self, doc):" in text
+        assert "return a + b" not in text
+
+    def test_tool_without_symbols_table(self, tmp_path):
+        """Test the agent's tool answers with a hint on indexes built before the symbols table existed."""
+        from perpetua.agent.tools import lookup_symbol
+        sqlite3.connect(str(tmp_path / "database.db")).close()
+        result = lookup_symbol.invoke({"name": "Store", "relational_db_path": str(tmp_path / "database.db")})
+        assert "perpetua symbols --rebuild" in result
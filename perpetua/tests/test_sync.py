@@ -0,0 +1,143 @@
+"""Unit tests for git-aware syncing."""
+import os
+import subprocess
+import sys
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from perpetua import app
+from perpetua.agent import document_processing
+from perpetua.agent.document_processing import RAGStore
+from perpetua.setup_db import DBManager
+from perpetua.sync import get_changes, get_dirty_files, get_head, is_excluded
+
+
+def git(cwd, *args):
+    subprocess.run(["git", "-c", "user.email=test@test", "-c", "user.name=test", *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """Create a git repository with a few committed files."""
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "a.py").write_text("def a():\n    return 1\n")
+    (tmp_path / "pkg" / "b.py").write_text("def b():\n    return 2\n")
+    (tmp_path / "README.md").write_text("# repo\n")
+    git(tmp_path, "init", "-q")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-qm", "initial")
+    return str(tmp_path)
+
+
+class TestGetChanges:
+    """Tests for get_changes."""
+
+    def test_first_sync_lists_tracked_files(self, repo):
+        """Test every tracked file is indexed when there is no previous sync."""
+        changed, deleted, renamed = get_changes(repo, {})
+        assert changed == {"pkg/a.py", "pkg/b.py", "README.md"}
+        assert not deleted and not renamed
+
+    def test_first_sync_skips_deleted_files(self, repo):
+        """Test tracked files missing from the working tree are not indexed on the first sync."""
+        os.remove(os.path.join(repo, "pkg", "a.py"))
+        changed, deleted, renamed = get_changes(repo, {})
+        assert changed == {"pkg/b.py", "README.md"}
+        assert deleted == {"pkg/a.py"}
+
+    def test_changes_since_last_sync(self, repo):
+        """Test modified, deleted and renamed files are reported separately."""
+        state = {"sha": get_head(repo), "dirty": []}
+        with open(os.path.join(repo, "pkg", "a.py"), "a") as f:
+            f.write("# edit\n")
+        git(repo, "mv", "pkg/b.py", "pkg/c.py")
+        git(repo, "rm", "-q", "README.md")
+        git(repo, "commit", "-qam", "changes")
+
+        changed, deleted, renamed = get_changes(repo, state)
+        assert changed == {"pkg/a.py", "pkg/c.py"}
+        assert deleted == {"README.md"}
+        assert renamed == [("pkg/b.py", "pkg/c.py")]
+
+    def test_uncommitted_edits_are_included(self, repo):
+        """Test working tree edits are synced and rechecked on the next sync."""
+        state = {"sha": get_head(repo), "dirty": []}
+        with open(os.path.join(repo, "pkg", "a.py"), "a") as f:
+            f.write("# edit\n")
+        assert get_dirty_files(repo) == ["pkg/a.py"]
+        changed, _, _ = get_changes(repo, state)
+        assert changed == {"pkg/a.py"}
+
+        git(repo, "checkout", "--", "pkg/a.py")
+        changed, _, _ = get_changes(repo, {"sha": get_head(repo), "dirty": ["pkg/a.py"]})
+        assert changed == {"pkg/a.py"}
+
+
+class TestIsExcluded:
+    """Tests for is_excluded."""
+
+    def test_excluded_directories(self):
+        assert is_excluded(".rag/threads.txt")
+        assert is_excluded("pkg/__pycache__/a.pyc")
+        assert not is_excluded("pkg/a.py")
+
+    def test_repo_graph_is_not_imported(self):
+        """Test the excluded directories come from utils, without loading the graph module."""
+        code = "import sys, perpetua.sync; print('perpetua.repo_graph' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == "False"
+
+
+@pytest.fixture
+def project(repo, monkeypatch):
+    """Make the repository a Perpetua project embedding with a fake model, run from its root."""
+    monkeypatch.delenv("EMBEDDING_PROVIDER", raising=False)
+    monkeypatch.delenv("LOCAL", raising=False)
+    monkeypatch.setattr(document_processing, "get_embeddings", lambda provider, model: DeterministicFakeEmbedding(size=16))
+    os.mkdir(os.path.join(repo, ".rag"))
+    db = DBManager(os.path.join(repo, ".rag", "database.db"))
+    db.create_doc_table()
+    db.conn.close()
+    monkeypatch.chdir(repo)
+    yield repo
+    for store in list(RAGStore._instances.values()):
+        store.release()
+
+
+class TestSyncCommand:
+    """Tests for the sync command."""
+
+    def indexed(self, repo):
+        """Paths in the docs table and in the vector store, read from a fresh store as the next command would"""
+        for store in list(RAGStore._instances.values()):
+            store.release()
+        store = RAGStore.open(repo + "/.rag/milvus.db", repo + "/.rag/database.db")
+        store.curr.execute("SELECT filepath FROM docs")
+        docs = {path for (path,) in store.curr.fetchall()}
+        vector_store = store.vector_store
+        rows = vector_store.client.query(vector_store.collection_name, filter="", output_fields=["source"], limit=10000)
+        return docs, {row["source"] for row in rows}
+
+    def test_renamed_to_unsupported_extension(self, project):
+        """Test a file renamed to a type that is not indexed leaves the index, and comes back when renamed again."""
+        app.sync()
+        assert self.indexed(project)[0] == {project + "/pkg/a.py", project + "/pkg/b.py", project + "/README.md"}
+
+        git(project, "mv", "README.md", "README.bak")
+        git(project, "commit", "-qm", "rename")
+        app.sync()
+        docs, sources = self.indexed(project)
+        assert project + "/README.md" not in docs | sources
+        assert project + "/README.bak" not in docs | sources
+
+        git(project, "mv", "README.bak", "README.md")
+        git(project, "commit", "-qm", "rename back")
+        app.sync()
+        docs, sources = self.indexed(project)
+        assert project + "/README.md" in docs and project + "/README.md" in sources
+
+    def test_first_sync_with_deleted_tracked_file(self, project):
+        """Test the first sync indexes the other files when a tracked file was deleted from the working tree."""
+        os.remove(os.path.join(project, "pkg", "a.py"))
+        app.sync()
+        assert self.indexed(project)[0] == {project + "/pkg/b.py", project + "/README.md"}
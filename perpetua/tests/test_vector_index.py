@@ -0,0 +1,85 @@
+"""Unit tests for index settings and the index benchmark."""
+import numpy as np
+import pytest
+
+from perpetua.project_config import DEFAULT_CONFIG, LEGACY_CONFIG, load_config, parse_params, save_config
+from perpetua.agent.vector_index import benchmark, exact_neighbors, parse_candidate
+
+
+class TestProjectConfig:
+    """Tests for .rag/config.json."""
+
+    def test_projects_without_config_keep_legacy_index(self, tmp_path):
+        """Test projects created before config.json existed keep the index they were built with."""
+        assert load_config(str(tmp_path)) == LEGACY_CONFIG
+
+    def test_saved_params_replace_defaults(self, tmp_path):
+        """Test params of another index type are not merged into the saved ones."""
+        save_config(str(tmp_path), {"index": {"index_type": "HNSW", "params": {"M": 16}}, "search": {"params": {"ef": 64}}})
+        config = load_config(str(tmp_path))
+        assert config["index"] == {"index_type": "HNSW", "metric_type": DEFAULT_CONFIG["index"]["metric_type"], "params": {"M": 16}}
+        assert config["search"] == {"params": {"ef": 64}, "rescore": 1}
+
+    def test_parse_params(self):
+        """Test numbers are converted and other values kept as strings."""
+        assert parse_params(["nlist=256", "ratio=0.5", "mode=fast"]) == {"nlist": 256, "ratio": 0.5, "mode": "fast"}
+        with pytest.raises(ValueError):
+            parse_params(["nlist"])
+
+
+class TestBenchmark:
+    """Tests for the index benchmark."""
+
+    def test_parse_candidate(self):
+        """Test build and search params are read from a candidate."""
+        config = parse_candidate("hnsw:M=16,efConstruction=200:ef=64", "COSINE")
+        assert config == {
+            "index": {"index_type": "HNSW", "metric_type": "COSINE", "params": {"M": 16, "efConstruction": 200}},
+            "search": {"params": {"ef": 64}, "rescore": 1},
+        }
+        assert parse_candidate("FLAT", "L2")["index"]["params"] == {}
+
+    @pytest.mark.parametrize("metric_type", ["L2", "IP", "COSINE"])
+    def test_exact_neighbors(self, metric_type):
+        """Test exhaustive search ranks neighbors like a direct computation."""
+        rng = np.random.default_rng(0)
+        base, queries = rng.standard_normal((50, 8)), rng.standard_normal((5, 8))
+        for query, neighbors in zip(queries, exact_neighbors(base, queries, metric_type, 3)):
+            if metric_type == "L2":
+                expected = np.argsort(((base - query) ** 2).sum(axis=1))[:3]
+            elif metric_type == "IP":
+                expected = np.argsort(-(base @ query))[:3]
+            else:
+                expected = np.argsort(-(base @ query) / np.linalg.norm(base, axis=1))[:3]
+            assert neighbors.tolist() == expected.tolist()
+
+    def test_flat_index_has_perfect_recall(self):
+        """Test an exhaustive index reaches a recall of 1 against exact search."""
+        vectors = np.random.default_rng(0).standard_normal((300, 8)).astype("float32")
+        [(config, dimension, result)] = benchmark(vectors, [parse_candidate("FLAT", "L2")], k=5, queries=20)
+        assert dimension == 8
+        assert result["recall"] == pytest.approx(1.0)
+        assert 0 < result["p50_ms"] <= result["p99_ms"]
+        assert result["memory_mb"] == pytest.approx(280 * 8 * 4 / (1024 * 1024))
+
+    def test_truncated_dimensions_are_compared_with_full_vectors(self):
+        """Test each dimension is benchmarked and truncation loses recall against the full vectors."""
+        vectors = np.random.default_rng(0).standard_normal((300, 16)).astype("float32")
+        results = benchmark(vectors, [parse_candidate("FLAT", "COSINE")], k=5, queries=20, dimensions=[None, 4])
+        assert [dimension for _, dimension, _ in results] == [16, 4]
+        assert results[0][2]["recall"] == pytest.approx(1.0)
+        assert results[1][2]["recall"] < 1.0
+
+    def test_rescore_param(self):
+        """Test rescore is read from the search params of a candidate and kept out of Milvus' params."""
+        config = parse_candidate("IVF_SQ8:nlist=16:nprobe=16,rescore=4", "L2")
+        assert config["search"] == {"params": {"nprobe": 16}, "rescore": 4}
+        vectors = np.random.default_rng(0).standard_normal((300, 8)).astype("float32")
+        [(_, _, result)] = benchmark(vectors, [config], k=5, queries=20)
+        assert result["recall"] > 0.9
+        assert result["memory_mb"] == pytest.approx(280 * 8 / (1024 * 1024))
+
+    def test_too_few_vectors(self):
+        """Test a benchmark needs more stored vectors than neighbors searched for."""
+        with pytest.raises(ValueError):
+            benchmark(np.zeros((4, 8), dtype="float32"), [parse_candidate("FLAT", "L2")], k=10)
@@ -0,0 +1,146 @@
+"""Unit tests for watch mode."""
+import os
+import sys
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from perpetua import app, watch
+from perpetua.agent import document_processing
+from perpetua.agent.document_processing import RAGStore
+from perpetua.repo_graph import Node, RepoGraph
+from perpetua.setup_db import DBManager
+from perpetua.watch import InotifyWatcher, PollingWatcher, debounced, split_changes
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """Create a small project tree."""
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "a.py").write_text("def a():\n    return 1\n")
+    (tmp_path / ".rag").mkdir()
+    return str(tmp_path)
+
+
+class FakeWatcher:
+    """Returns a scripted sequence of changes, one per read."""
+
+    def __init__(self, reads):
+        self.reads = list(reads)
+
+    def read(self, timeout):
+        return self.reads.pop(0) if self.reads else set()
+
+
+class TestWatchers:
+    """Tests for the polling and inotify watchers."""
+
+    def test_polling_watcher(self, tree):
+        """Test created, modified and deleted files are reported, excluded directories are not."""
+        watcher = PollingWatcher(tree, interval=0)
+        with open(tree + "/pkg/a.py", "a") as f:
+            f.write("# edit\n")
+        open(tree + "/pkg/b.py", "w").close()
+        open(tree + "/.rag/database.db", "w").close()
+        assert watcher.read(0) == {tree + "/pkg/a.py", tree + "/pkg/b.py"}
+        assert watcher.read(0) == set()
+
+        os.remove(tree + "/pkg/b.py")
+        assert watcher.read(0) == {tree + "/pkg/b.py"}
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+    def test_inotify_watcher(self, tree):
+        """Test saves are reported and new directories are watched."""
+        watcher = InotifyWatcher(tree)
+        try:
+            os.mkdir(tree + "/pkg/sub")
+            open(tree + "/.rag/database.db", "w").close()
+            assert watcher.read(1) == {tree + "/pkg/sub"}
+
+            with open(tree + "/pkg/sub/c.py", "w") as f:
+                f.write("x = 1\n")
+            assert watcher.read(1) == {tree + "/pkg/sub/c.py"}
+        finally:
+            watcher.close()
+
+
+class TestDebounced:
+    """Tests for debounced."""
+
+    def test_bursts_are_grouped(self):
+        """Test changes are only yielded once the watcher goes quiet."""
+        watcher = FakeWatcher([{"a"}, {"b"}, set(), {"c"}, set()])
+        bursts = debounced(watcher, debounce=0)
+        assert next(bursts) == {"a"}
+        assert next(bursts) == {"b"}
+        assert next(bursts) == {"c"}
+
+
+class TestSplitChanges:
+    """Tests for split_changes and the RepoGraph updates it makes."""
+
+    def test_added_and_modified_files(self, tree):
+        """Test only files new to the graph change its structure."""
+        graph = RepoGraph(tree)
+        changed, deleted, structure_changed = split_changes({tree + "/pkg/a.py"}, graph)
+        assert changed == {tree + "/pkg/a.py"} and not deleted and not structure_changed
+
+        os.makedirs(tree + "/pkg/sub")
+        open(tree + "/pkg/sub/c.py", "w").close()
+        changed, deleted, structure_changed = split_changes({tree + "/pkg/sub"}, graph)
+        assert changed == {tree + "/pkg/sub/c.py"} and structure_changed
+        assert Node("c.py", tree + "/pkg/sub/c.py") in graph.G
+        assert graph.G.has_edge(Node("pkg", tree + "/pkg"), Node("sub", tree + "/pkg/sub"))
+
+    def test_deleted_directory(self, tree):
+        """Test deleting a directory removes every file under it."""
+        graph = RepoGraph(tree)
+        os.remove(tree + "/pkg/a.py")
+        os.rmdir(tree + "/pkg")
+        changed, deleted, structure_changed = split_changes({tree + "/pkg"}, graph)
+        assert not changed and deleted == {tree + "/pkg/a.py"} and structure_changed
+        assert Node("pkg", tree + "/pkg") not in graph.G
+
+    def test_excluded_paths(self, tree):
+        """Test paths inside excluded directories are ignored."""
+        graph = RepoGraph(tree)
+        open(tree + "/.rag/database.db", "w").close()
+        assert split_changes({tree + "/.rag/database.db"}, graph) == (set(), set(), False)
+
+
+class TestWatchCommand:
+    """Tests for the watch command."""
+
+    def test_files_gone_before_indexing(self, tree, monkeypatch):
+        """Test files deleted between their event and the update are removed from the index instead of stopping the watch."""
+        monkeypatch.delenv("EMBEDDING_PROVIDER", raising=False)
+        monkeypatch.delenv("LOCAL", raising=False)
+        monkeypatch.setattr(document_processing, "get_embeddings", lambda provider, model: DeterministicFakeEmbedding(size=16))
+        db = DBManager(tree + "/.rag/database.db")
+        db.create_doc_table()
+        db.conn.close()
+        store = RAGStore(tree + "/.rag/milvus.db", tree + "/.rag/database.db")
+        store.add_documents_batch([tree + "/pkg/a.py"], verbose=False)
+        store.release()
+
+        def bursts(watcher, debounce):
+            yield {tree + "/pkg/a.py"}
+            raise KeyboardInterrupt
+
+        def split_changes(paths, graph):
+            # the file is removed after the watcher saw it change
+            os.remove(tree + "/pkg/a.py")
+            return set(paths), set(), False
+
+        monkeypatch.setattr(watch, "make_watcher", lambda path, poll: FakeWatcher([]))
+        monkeypatch.setattr(FakeWatcher, "close", lambda self: None, raising=False)
+        monkeypatch.setattr(watch, "debounced", bursts)
+        monkeypatch.setattr(watch, "split_changes", split_changes)
+        monkeypatch.chdir(tree)
+        app.watch()
+
+        store = RAGStore(tree + "/.rag/milvus.db", tree + "/.rag/database.db")
+        try:
+            store.curr.execute("SELECT count(*) FROM docs")
+            assert store.curr.fetchone()[0] == 0
+        finally:
+            store.release()